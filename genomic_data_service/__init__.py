@@ -42,6 +42,10 @@ if is_web_app():
     import genomic_data_service.summary
     import genomic_data_service.rnaseq.views
     import genomic_data_service.errors
+    import genomic_data_service.metrics
+    from genomic_data_service.regulome_atlas import RegulomeAtlas
+    from genomic_data_service.response_cache import response_cache
+    from genomic_data_service.ensembl import ensembl_cache
 
     @app.route('/healthcheck/', methods=['GET'])
     def healthcheck():
@@ -49,6 +53,11 @@ if is_web_app():
         try:
             status['regulome_es'] = regulome_es.cluster.health()
             status['region_search_es'] = region_search_es.cluster.health()
+            status['residents_cache'] = RegulomeAtlas(regulome_es).residents_cache.stats()
+            if response_cache() is not None:
+                status['response_cache'] = response_cache().stats()
+            if ensembl_cache() is not None:
+                status['ensembl_cache'] = ensembl_cache().stats()
         except Exception as e:
             status['exception'] = str(e)
 
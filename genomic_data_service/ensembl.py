@@ -0,0 +1,87 @@
+import json
+import logging
+import os
+import threading
+from functools import lru_cache
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from genomic_data_service import app
+from genomic_data_service.instrumentation import timed
+from genomic_data_service.response_cache import ResponseCache
+
+# Ensembl answers to cache: found, and not found (negative caching). Rate
+# limits, server errors and timeouts are left to be asked again.
+CACHED_STATUSES = [200, 400, 404]
+# entries are kept until Ensembl data could have changed
+CACHE_EPOCH = 'ensembl'
+CONNECT_TIMEOUT = 3.05
+POOL_SIZE = 10
+MAX_ENTRY_BYTES = 1024 * 1024
+
+_sessions = {}
+_sessions_lock = threading.Lock()
+
+
+def ensembl_session():
+    """Returns the requests session of this process, keeping connections to
+    Ensembl alive and retrying idempotent requests on busy servers."""
+    pid = os.getpid()
+    with _sessions_lock:
+        session = _sessions.get(pid)
+        if session is None:
+            session = requests.Session()
+            retry = Retry(
+                total=2,
+                backoff_factor=0.5,
+                status_forcelist=[429, 502, 503, 504],
+                respect_retry_after_header=True,
+            )
+            adapter = HTTPAdapter(
+                pool_connections=POOL_SIZE, pool_maxsize=POOL_SIZE, max_retries=retry
+            )
+            session.mount('https://', adapter)
+            session.mount('http://', adapter)
+            session.headers['Accept'] = 'application/json'
+            _sessions.clear()
+            _sessions[pid] = session
+    return session
+
+
+@lru_cache(maxsize=None)
+def _ensembl_cache(path, max_bytes, max_age):
+    return ResponseCache(path, max_bytes, max_age, MAX_ENTRY_BYTES)
+
+
+def ensembl_cache():
+    """Returns the ResponseCache of Ensembl answers, None if ENSEMBL_CACHE_PATH
+    is not set."""
+    path = app.config.get('ENSEMBL_CACHE_PATH')
+    if not path:
+        return None
+    return _ensembl_cache(
+        path,
+        app.config.get('ENSEMBL_CACHE_MAX_BYTES', 256 * 1024 * 1024),
+        app.config.get('ENSEMBL_CACHE_MAX_AGE', 30 * 86400),
+    )
+
+
+def ensembl_json(url, endpoint, id_, assembly):
+    """Returns the JSON Ensembl answers for url, cached on disk by
+    (endpoint, id, assembly). Raises like requests on connection errors."""
+    cache = ensembl_cache()
+    key = json.dumps([endpoint, id_, assembly])
+    if cache is not None:
+        cached = cache.get(key, CACHE_EPOCH)
+        if cached is not None:
+            return json.loads(cached[1])
+
+    timeout = (CONNECT_TIMEOUT, app.config.get('ENSEMBL_TIMEOUT', 10))
+    with timed('ensembl'):
+        response = ensembl_session().get(url, timeout=timeout)
+    data = response.json()
+    if cache is not None and response.status_code in CACHED_STATUSES:
+        cache.put(key, CACHE_EPOCH, {}, json.dumps(data).encode('utf-8'))
+    elif response.status_code not in CACHED_STATUSES:
+        logging.warning('Ensembl answered %s for %s', response.status_code, url)
+    return data
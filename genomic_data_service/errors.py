@@ -12,6 +12,11 @@ def resource_not_found(e):
     return jsonify(message=str(e)), 404
 
 
+@app.errorhandler(413)
+def request_entity_too_large(e):
+    return jsonify(message=str(e)), 413
+
+
 @app.errorhandler(501)
 def not_implemented(e):
     return jsonify(message=str(e)), 501
@@ -0,0 +1,109 @@
+import gzip
+import os
+import pickle
+import re
+from functools import lru_cache
+from genomic_data_service import app
+
+GTF_ATTRIBUTE = re.compile(r'(\w+) "([^"]*)"')
+# assembly of every alias, by lower case alias
+ASSEMBLY_ALIASES = {
+    'grch37': 'GRCh37',
+    'hg19': 'GRCh37',
+    'grch38': 'GRCh38',
+    'hg38': 'GRCh38',
+    'grcm38': 'GRCm38',
+    'mm10': 'GRCm38',
+}
+
+
+def gene_index_path(directory, assembly):
+    """Returns the path of the index of an assembly, the same for all of its
+    aliases."""
+    assembly = ASSEMBLY_ALIASES.get(assembly.lower(), assembly)
+    return os.path.join(directory, 'genes_{}.pickle'.format(assembly.lower()))
+
+
+class GeneIndex(object):
+    """Coordinates of the genes of an assembly by Ensembl id and symbol,
+    1-based and inclusive like the Ensembl lookup endpoint."""
+
+    __slots__ = ('genes', 'symbols')
+
+    def __init__(self, genes, symbols):
+        # ENSG id: (chrom, start, end)
+        self.genes = genes
+        # lower case symbol: ENSG id, symbols of several genes are left out
+        self.symbols = symbols
+
+    def __len__(self):
+        return len(self.genes)
+
+    @classmethod
+    def from_gtf(cls, lines):
+        """Builds the index from the gene lines of a GENCODE or Ensembl GTF."""
+        genes = {}
+        symbols = {}
+        ambiguous = set()
+        for line in lines:
+            if line.startswith('#'):
+                continue
+            fields = line.rstrip('\n').split('\t')
+            if len(fields) < 9 or fields[2] != 'gene':
+                continue
+            attributes = dict(GTF_ATTRIBUTE.findall(fields[8]))
+            gene_id = attributes.get('gene_id', '').split('.')[0].upper()
+            if not gene_id.startswith('ENSG') or gene_id in genes:
+                continue
+            chrom = fields[0] if fields[0].startswith('chr') else 'chr' + fields[0]
+            genes[gene_id] = (chrom, int(fields[3]), int(fields[4]))
+            symbol = attributes.get('gene_name', '').lower()
+            if not symbol:
+                continue
+            if symbol in symbols and symbols[symbol] != gene_id:
+                ambiguous.add(symbol)
+            symbols[symbol] = gene_id
+        for symbol in ambiguous:
+            del symbols[symbol]
+        return cls(genes, symbols)
+
+    @classmethod
+    def load(cls, path):
+        with open(path, 'rb') as f:
+            return cls(*pickle.load(f))
+
+    def save(self, path):
+        with open(path + '.tmp', 'wb') as f:
+            pickle.dump((self.genes, self.symbols), f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(path + '.tmp', path)
+
+    def lookup_id(self, gene_id):
+        """Returns (chrom, start, end) of an ENSG id, None if not indexed."""
+        return self.genes.get(gene_id.split('.')[0].upper())
+
+    def lookup_symbol(self, symbol):
+        """Returns (chrom, start, end) of a gene symbol, None if not indexed."""
+        gene_id = self.symbols.get(symbol.lower())
+        return self.genes.get(gene_id) if gene_id else None
+
+
+def read_gtf(path):
+    opener = gzip.open if path.endswith('.gz') else open
+    with opener(path, mode='rt') as f:
+        yield from f
+
+
+@lru_cache(maxsize=None)
+def _gene_index(path):
+    try:
+        return GeneIndex.load(path)
+    except (OSError, pickle.UnpicklingError, EOFError):
+        return None
+
+
+def gene_index(assembly):
+    """Returns the GeneIndex of an assembly, None if it was not built."""
+    directory = app.config.get('GENE_INDEX_DIR')
+    if not directory or not assembly:
+        return None
+    return _gene_index(gene_index_path(directory, assembly))
@@ -0,0 +1,229 @@
+import fcntl
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar, copy_context
+
+# upper bounds in seconds of the stage latency histogram buckets
+STAGE_BUCKETS = (
+    0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5,
+    1.0, 2.5, 5.0, 10.0, 30.0, 60.0,
+)
+
+# histograms of processes that are gone, merged into one file
+RETIRED_HISTOGRAMS = 'retired.json'
+
+_stages = ContextVar('stages', default=None)
+
+
+class StageTimings(object):
+    """Seconds spent and times entered per stage of one request. Stages may
+    nest and may run in several threads at once, so their sum can exceed
+    the request time."""
+
+    def __init__(self):
+        self.stages = {}
+        self._lock = threading.Lock()
+
+    def add(self, stage, seconds):
+        with self._lock:
+            total = self.stages.setdefault(stage, [0.0, 0])
+            total[0] += seconds
+            total[1] += 1
+
+    def server_timing(self, total=None):
+        """Returns the Server-Timing header value of the stages, in ms."""
+        with self._lock:
+            metrics = [
+                '{};dur={:.2f};desc="{}x"'.format(stage, seconds * 1000, count)
+                for stage, (seconds, count) in self.stages.items()
+            ]
+        if total is not None:
+            metrics.append('total;dur={:.2f}'.format(total * 1000))
+        return ', '.join(metrics)
+
+
+def start_stages():
+    """Start timing stages of the current request, returns its StageTimings."""
+    stages = StageTimings()
+    _stages.set(stages)
+    return stages
+
+
+def stop_stages():
+    _stages.set(None)
+
+
+def current_stages():
+    return _stages.get()
+
+
+@contextmanager
+def timed(stage):
+    """Add the time spent in the block, or decorated function, to a stage of
+    the current request. Does nothing outside of requests."""
+    stages = _stages.get()
+    if stages is None:
+        yield
+        return
+    begin = time.perf_counter()
+    try:
+        yield
+    finally:
+        stages.add(stage, time.perf_counter() - begin)
+
+
+def in_context(function):
+    """Wrap function to run in a copy of the current context, so stages
+    timed in executor threads are added to the request that started them."""
+    context = copy_context()
+
+    def run(*args, **kwargs):
+        return context.copy().run(function, *args, **kwargs)
+    return run
+
+
+class Histograms(object):
+    """Cumulative latency histograms by (endpoint, stage) of one process,
+    flushed to a file per process so every worker's share can be merged."""
+
+    def __init__(self, buckets=STAGE_BUCKETS):
+        self.buckets = buckets
+        self.histograms = {}
+        self._lock = threading.Lock()
+        self._flushed = 0
+        self._pid = None
+
+    def observe(self, endpoint, stage, seconds):
+        key = '{}\t{}'.format(endpoint, stage)
+        with self._lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = {
+                    'counts': [0] * (len(self.buckets) + 1), 'sum': 0.0}
+            for i, bound in enumerate(self.buckets):
+                if seconds <= bound:
+                    break
+            else:
+                i = len(self.buckets)
+            histogram['counts'][i] += 1
+            histogram['sum'] += seconds
+
+    def flush(self, directory, min_interval=0):
+        """Write the histograms to directory/<pid>.json, at most every min_interval seconds."""
+        now = time.monotonic()
+        if now - self._flushed < min_interval:
+            return
+        self._flushed = now
+        os.makedirs(directory, exist_ok=True)
+        pid = os.getpid()
+        if self._pid != pid:
+            # a file left by an earlier process with this pid is its own
+            retire_histograms(directory, pids=[pid])
+            self._pid = pid
+        path = os.path.join(directory, '{}.json'.format(pid))
+        with self._lock:
+            data = json.dumps(self.histograms)
+        with open(path + '.tmp', 'w') as f:
+            f.write(data)
+        os.replace(path + '.tmp', path)
+
+
+@contextmanager
+def _locked(directory, operation):
+    """private: holds the flock of the histograms directory"""
+    with open(os.path.join(directory, '.lock'), 'a') as f:
+        fcntl.flock(f, operation)
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+
+def _read_histograms(path):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _add_histograms(merged, histograms):
+    for key, histogram in histograms.items():
+        total = merged.setdefault(
+            key, {'counts': [0] * len(histogram['counts']), 'sum': 0.0})
+        total['counts'] = [a + b for a, b in zip(total['counts'], histogram['counts'])]
+        total['sum'] += histogram['sum']
+
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def retire_histograms(directory, pids=None):
+    """Merge the files of pids, by default of the processes that are gone,
+    into RETIRED_HISTOGRAMS and remove them, so files do not pile up as
+    workers are recycled."""
+    if not os.path.isdir(directory):
+        return
+    with _locked(directory, fcntl.LOCK_EX):
+        paths = []
+        for name in os.listdir(directory):
+            pid = name[:-len('.json')]
+            if not name.endswith('.json') or not pid.isdigit():
+                continue
+            if (int(pid) in pids) if pids is not None else not _pid_alive(int(pid)):
+                paths.append(os.path.join(directory, name))
+        if not paths:
+            return
+        retired_path = os.path.join(directory, RETIRED_HISTOGRAMS)
+        retired = _read_histograms(retired_path) or {}
+        for path in paths:
+            _add_histograms(retired, _read_histograms(path) or {})
+        with open(retired_path + '.tmp', 'w') as f:
+            f.write(json.dumps(retired))
+        os.replace(retired_path + '.tmp', retired_path)
+        for path in paths:
+            os.remove(path)
+
+
+def merge_histograms(directory):
+    """Returns the sum of the histograms flushed by every process."""
+    merged = {}
+    if not os.path.isdir(directory):
+        return merged
+    with _locked(directory, fcntl.LOCK_SH):
+        for name in sorted(os.listdir(directory)):
+            if not name.endswith('.json'):
+                continue
+            histograms = _read_histograms(os.path.join(directory, name))
+            if histograms is not None:
+                _add_histograms(merged, histograms)
+    return merged
+
+
+def render_histograms(histograms, name, buckets=STAGE_BUCKETS):
+    """Render histograms in the Prometheus text exposition format."""
+    lines = [
+        '# HELP {} Seconds spent per request in each stage.'.format(name),
+        '# TYPE {} histogram'.format(name),
+    ]
+    for key in sorted(histograms):
+        endpoint, stage = key.split('\t')
+        labels = 'endpoint="{}",stage="{}"'.format(endpoint, stage)
+        histogram = histograms[key]
+        cumulative = 0
+        for bound, count in zip(buckets + ('+Inf',), histogram['counts']):
+            cumulative += count
+            lines.append('{}_bucket{{{},le="{}"}} {}'.format(name, labels, bound, cumulative))
+        lines.append('{}_sum{{{}}} {}'.format(name, labels, histogram['sum']))
+        lines.append('{}_count{{{}}} {}'.format(name, labels, cumulative))
+    return '\n'.join(lines) + '\n'
@@ -0,0 +1,160 @@
+import gzip
+import logging
+import re
+from functools import lru_cache
+import numpy as np
+from genomic_data_service import app
+
+
+def open_chain_file(path):
+    if path.endswith('.gz'):
+        return gzip.open(path, mode='rt')
+    return open(path)
+
+
+def chrom_name(chrom):
+    return chrom if chrom.lower().startswith('chr') else 'chr' + chrom
+
+
+class LiftOver(object):
+    """Maps 0-based half open intervals from the reference (t) to the query
+    (q) assembly of a UCSC chain file, with its aligned blocks.
+
+    The blocks of every source chromosome are kept in arrays sorted by start,
+    so an interval is mapped by binary search, like PeakIndex. When chains
+    overlap on the source, the one with the highest score (first in the
+    file) wins.
+    """
+
+    __slots__ = ('chains', '_chroms')
+
+    def __init__(self, lines):
+        # (query chrom, query size, query strand) of every chain
+        self.chains = []
+        by_chrom = {}
+        blocks = None
+        for line in lines:
+            fields = line.split()
+            if not fields:
+                continue
+            if fields[0] == 'chain':
+                t_name, t_start = fields[2], int(fields[5])
+                q_name, q_size, q_strand, q_start = (
+                    fields[7], int(fields[8]), fields[9], int(fields[10]))
+                chain = len(self.chains)
+                self.chains.append((q_name, q_size, q_strand))
+                blocks = by_chrom.setdefault(t_name, [])
+                continue
+            size = int(fields[0])
+            blocks.append((t_start, t_start + size, q_start, chain))
+            if len(fields) == 3:
+                t_start += size + int(fields[1])
+                q_start += size + int(fields[2])
+
+        self._chroms = {}
+        for chrom, rows in by_chrom.items():
+            rows = np.array(rows, dtype=np.int64)
+            rows = rows[np.lexsort((rows[:, 3], rows[:, 0]))]
+            starts, ends = rows[:, 0], rows[:, 1]
+            overlapping = bool(
+                np.any(starts[1:] < np.maximum.accumulate(ends)[:-1]))
+            max_length = int((ends - starts).max())
+            self._chroms[chrom] = (
+                starts, ends, rows[:, 2], rows[:, 3], max_length, overlapping)
+
+    @classmethod
+    def from_file(cls, path):
+        with open_chain_file(path) as f:
+            return cls(f)
+
+    def _forward(self, chain, q_start, q_end):
+        """private: returns (chrom, start, end) of query coordinates of a
+        chain on the forward strand of the query assembly"""
+        q_name, q_size, q_strand = self.chains[chain]
+        if q_strand == '-':
+            q_start, q_end = q_size - q_end, q_size - q_start
+        return (q_name, q_start, q_end)
+
+    def map_interval(self, chrom, start, end):
+        """Returns (chrom, start, end) of the half open [start, end) on the
+        query assembly, spanning its bases aligned by the best chain
+        overlapping it, None if no base of it is aligned."""
+        chrom = chrom_name(chrom)
+        if chrom not in self._chroms or end <= start:
+            return None
+        starts, ends, q_starts, chains, max_length, _ = self._chroms[chrom]
+        lo = np.searchsorted(starts, start - max_length, side='left')
+        hi = np.searchsorted(starts, end, side='left')
+        candidates = np.arange(lo, hi)[ends[lo:hi] > start]
+        if not len(candidates):
+            return None
+        candidates = candidates[chains[candidates] == chains[candidates].min()]
+        first, last = int(candidates[0]), int(candidates[-1])
+        q_first = int(q_starts[first]) + max(start, int(starts[first])) - int(starts[first])
+        q_last = int(q_starts[last]) + min(end, int(ends[last])) - int(starts[last])
+        return self._forward(int(chains[first]), q_first, q_last)
+
+    def map_intervals(self, intervals):
+        """Maps (chrom, start, end) intervals like map_interval, at once for
+        the intervals lying in one block of a chromosome without
+        overlapping chains."""
+        mapped = [None] * len(intervals)
+        by_chrom = {}
+        for i, (chrom, start, end) in enumerate(intervals):
+            by_chrom.setdefault(chrom_name(chrom), []).append(i)
+
+        for chrom, numbers in by_chrom.items():
+            if chrom not in self._chroms:
+                continue
+            starts, ends, q_starts, chains, _, overlapping = self._chroms[chrom]
+            if overlapping:
+                for i in numbers:
+                    mapped[i] = self.map_interval(*intervals[i])
+                continue
+            query_starts = np.array(
+                [intervals[i][1] for i in numbers], dtype=np.int64)
+            query_ends = np.array(
+                [intervals[i][2] for i in numbers], dtype=np.int64)
+            blocks = np.searchsorted(starts, query_starts, side='right') - 1
+            inside = (blocks >= 0) & (query_starts < query_ends)
+            blocks = np.maximum(blocks, 0)
+            inside &= query_ends <= ends[blocks]
+            q_first = q_starts[blocks] + query_starts - starts[blocks]
+            q_last = q_starts[blocks] + query_ends - starts[blocks]
+            for n, i in enumerate(numbers):
+                if inside[n]:
+                    mapped[i] = self._forward(
+                        int(chains[blocks[n]]), int(q_first[n]), int(q_last[n]))
+                else:
+                    mapped[i] = self.map_interval(*intervals[i])
+        return mapped
+
+    def map_location(self, location):
+        """Maps an Ensembl location, 1-based and inclusive like 7:100-200 or
+        X:100..200, returning (chrom, start, end) 1-based and inclusive like
+        the Ensembl assembly mapper, ('', '', '') if it can not be mapped."""
+        chrom, start, end = re.split(r':|\.\.|-', location)[:3]
+        mapped = self.map_interval(chrom, int(start) - 1, int(end))
+        if mapped is None:
+            return ('', '', '')
+        chrom, start, end = mapped
+        return (chrom, start + 1, end)
+
+
+@lru_cache(maxsize=None)
+def _liftover(path):
+    try:
+        return LiftOver.from_file(path)
+    except (OSError, ValueError, IndexError, TypeError):
+        logging.exception('Failed to load chain file %s', path)
+        return None
+
+
+def liftover(input_assembly, output_assembly):
+    """Returns the LiftOver of the chain file configured for the assemblies,
+    None if there is none."""
+    path = app.config.get('LIFTOVER_CHAIN_FILES', {}).get(
+        (input_assembly, output_assembly))
+    if not path:
+        return None
+    return _liftover(path)
@@ -0,0 +1,66 @@
+import logging
+import time
+from flask import g, request, Response
+from genomic_data_service import app
+from genomic_data_service.instrumentation import (
+    Histograms, start_stages, stop_stages, current_stages,
+    merge_histograms, render_histograms, retire_histograms,
+)
+
+METRIC_NAME = 'genomic_data_service_stage_seconds'
+
+histograms = Histograms()
+
+
+def metrics_dir():
+    return app.config.get('METRICS_DIR', '/tmp/regulome_metrics')
+
+
+@app.before_request
+def start_request_timing():
+    g.request_begin = time.perf_counter()
+    start_stages()
+
+
+def observe_stages(endpoint, stages, total):
+    for stage, (seconds, _count) in list(stages.stages.items()):
+        histograms.observe(endpoint, stage, seconds)
+    histograms.observe(endpoint, 'total', total)
+    try:
+        histograms.flush(metrics_dir(), app.config.get('METRICS_FLUSH_SECONDS', 5))
+    except OSError:
+        logging.exception('Failed to flush metrics to %s', metrics_dir())
+
+
+@app.after_request
+def add_server_timing(response):
+    """Server-Timing is sent with the headers, before a streamed body (like
+    the /summary/ downloads) is generated, so for those it only covers the
+    stages up to then. The histograms are observed once the response is
+    closed, and cover the whole body."""
+    stages = current_stages()
+    if stages is None or 'request_begin' not in g:
+        return response
+    begin = g.request_begin
+    response.headers['Server-Timing'] = stages.server_timing(
+        time.perf_counter() - begin)
+
+    endpoint = request.endpoint or 'unknown'
+    response.call_on_close(
+        lambda: observe_stages(endpoint, stages, time.perf_counter() - begin))
+    return response
+
+
+@app.teardown_request
+def stop_request_timing(exception=None):
+    stop_stages()
+
+
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    histograms.flush(metrics_dir())
+    retire_histograms(metrics_dir())
+    return Response(
+        render_histograms(merge_histograms(metrics_dir()), METRIC_NAME),
+        content_type='text/plain; version=0.0.4',
+    )
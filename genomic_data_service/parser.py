@@ -1,12 +1,14 @@
 from asyncio.log import logger
 import abc
 import pickle
-import py2bit
+from genomic_data_service.sequence_service import sequence_service
 
 TWO_BIT_FILE_PATH = 'ml_models/two_bit_files/hg38.2bit'
 GENE_LOOKUP_FILE_PATH = 'gene_lookup.pickle'
 PWM_GRCH38_STRAND_COL = 3
 PWM_GRCH38_SEQ_COL = 4
+# footprint lines whose sequences are read together
+FOOTPRINT_BATCH_SIZE = 10000
 
 
 class Parser:
@@ -153,7 +155,7 @@ class FootPrintParser(Parser):
     def __init__(self, reader, pwm, cols_for_index={}, file_path=None):
         super().__init__(reader, cols_for_index, file_path)
         self.pwm = pwm
-        self.seq_reader = py2bit.open(TWO_BIT_FILE_PATH)
+        self.sequences = sequence_service(TWO_BIT_FILE_PATH)
         self.complement = {
             'A': 'T',
             'T': 'A',
@@ -162,7 +164,38 @@ class FootPrintParser(Parser):
         }
         self.chars_index = {'A': 0, 'C': 1, 'G': 2, 'T': 3}
 
-    def document_generator(self, line):
+    def parse(self):
+        batch = []
+        for line in self.reader:
+            if line[0].startswith('#'):
+                continue
+            batch.append(line)
+            if len(batch) == FOOTPRINT_BATCH_SIZE:
+                yield from self.parse_batch(batch)
+                batch = []
+        if batch:
+            yield from self.parse_batch(batch)
+
+    def parse_batch(self, lines):
+        """Score a batch of lines with their sequences read in one pass over
+        the 2bit file, falling back to one line at a time if that fails."""
+        try:
+            intervals = [(line[0], int(line[1]), int(line[2])) for line in lines]
+            sequences = self.sequences.sequences(intervals)
+        except Exception:
+            sequences = [None] * len(lines)
+        for line, sequence in zip(lines, sequences):
+            try:
+                (chrom, doc) = self.document_generator(line, sequence)
+            except Exception:
+                logger.error('%s - failure to parse line %s:%s:%s, skipping line',
+                             self.file_path, line[0], line[1], line[2])
+                continue
+            if not chrom and not doc:
+                continue
+            yield (chrom, doc)
+
+    def document_generator(self, line, sequence=None):
         chrom, start, end = line[0], int(line[1]), int(line[2])
         doc = {
             'coordinates': {
@@ -170,7 +203,8 @@ class FootPrintParser(Parser):
                 'lt': end
             },
         }
-        sequence = self.seq_reader.sequence(chrom, start, end)
+        if sequence is None:
+            sequence = self.sequences.sequence(chrom, start, end)
         if 'N' in sequence:
             return (None, None)
         else:
@@ -0,0 +1,127 @@
+import numpy as np
+
+
+class PeakIndex(object):
+    """Sorted arrays of peak starts, ends and uuid codes for fast overlap queries.
+
+    Built once from the peaks (elasticsearch hits) returned for a window, so
+    every position in the window is answered by binary search instead of a
+    scan over all peaks.
+    """
+
+    __slots__ = ('peaks', 'uuids', '_chroms')
+
+    def __init__(self, peaks):
+        self.peaks = peaks
+        self.uuids = []
+        codes = {}
+        by_chrom = {}
+        for i, peak in enumerate(peaks):
+            uuid = peak['_source']['uuid']
+            if uuid not in codes:
+                codes[uuid] = len(self.uuids)
+                self.uuids.append(uuid)
+            coordinates = peak['_source']['coordinates']
+            by_chrom.setdefault(peak['_index'], []).append(
+                (coordinates['gte'], coordinates['lt'], codes[uuid], i)
+            )
+
+        self._chroms = {}
+        for chrom, rows in by_chrom.items():
+            rows = np.array(rows, dtype=np.int64)
+            rows = rows[np.argsort(rows[:, 0], kind='stable')]
+            starts, ends = rows[:, 0], rows[:, 1]
+            max_length = int((ends - starts).max())
+            self._chroms[chrom] = (starts, ends, rows[:, 2], rows[:, 3], max_length)
+
+    def __len__(self):
+        return len(self.peaks)
+
+    def _candidates(self, chrom, start, end):
+        """private: returns ends, uuid codes and peak numbers of peaks starting
+        in [start - longest peak, end]"""
+        if chrom not in self._chroms:
+            return (None, None, None)
+        starts, ends, uuid_codes, peak_numbers, max_length = self._chroms[chrom]
+        lo = np.searchsorted(starts, start - max_length, side='left')
+        hi = np.searchsorted(starts, end, side='right')
+        return (ends[lo:hi], uuid_codes[lo:hi], peak_numbers[lo:hi])
+
+    def _uuids(self, uuid_codes):
+        return {self.uuids[code] for code in np.unique(uuid_codes).tolist()}
+
+    def overlapping(self, chrom, start, end=None):
+        """Returns uuids of peaks with gte <= end and lt >= start (both ends inclusive)."""
+        if end is None:
+            end = start
+        ends, uuid_codes, _ = self._candidates(chrom, start, end)
+        if ends is None:
+            return set()
+        return self._uuids(uuid_codes[ends >= start])
+
+    def intersecting(self, chrom, start, end):
+        """Returns uuids of peaks intersecting the half open [start, end),
+        matching the elasticsearch range queries used to find peaks."""
+        ends, uuid_codes, _ = self._candidates(chrom, start, end - 1)
+        if ends is None:
+            return set()
+        return self._uuids(uuid_codes[ends > start])
+
+    def intersecting_peaks(self, chrom, start, end):
+        """Returns the peaks intersecting the half open [start, end), like
+        intersecting(), in the order they were given."""
+        ends, _, peak_numbers = self._candidates(chrom, start, end - 1)
+        if ends is None:
+            return []
+        return [self.peaks[i] for i in np.sort(peak_numbers[ends > start]).tolist()]
+
+    def segments(self, chrom, start, end):
+        """Sweeps peak breakpoints, yielding (segment_start, segment_end, uuids)
+        for the maximal runs of bases in [start, end) overlapped by the same
+        peak uuids. Segments are half open and uuids follow overlapping(), so
+        a base at a peak's lt still overlaps it."""
+        if start >= end:
+            return
+        if chrom not in self._chroms:
+            yield (start, end, frozenset())
+            return
+        starts, ends, uuid_codes, _, _ = self._chroms[chrom]
+        positions = np.concatenate((starts, ends + 1))
+        deltas = np.concatenate((
+            np.ones(len(starts), dtype=np.int64),
+            -np.ones(len(ends), dtype=np.int64),
+        ))
+        codes = np.concatenate((uuid_codes, uuid_codes))
+        order = np.argsort(positions, kind='stable')
+
+        active = {}
+        current = start
+        segment_start = start
+        segment_uuids = None
+        for position, delta, code in zip(
+            positions[order].tolist(), deltas[order].tolist(), codes[order].tolist()
+        ):
+            if position >= end:
+                break
+            if position > current:
+                # bases [current, position) are overlapped by the active peaks
+                uuids = frozenset(self.uuids[c] for c in active)
+                if uuids != segment_uuids:
+                    if segment_uuids is not None:
+                        yield (segment_start, current, segment_uuids)
+                    segment_start = current
+                    segment_uuids = uuids
+                current = position
+            count = active.get(code, 0) + delta
+            if count:
+                active[code] = count
+            else:
+                del active[code]
+
+        uuids = frozenset(self.uuids[c] for c in active)
+        if uuids != segment_uuids:
+            if segment_uuids is not None:
+                yield (segment_start, current, segment_uuids)
+            segment_start = current
+            segment_uuids = uuids
+        yield (segment_start, end, segment_uuids)
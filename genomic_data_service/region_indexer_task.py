@@ -12,7 +12,8 @@ import uuid
 
 def make_celery(app):
     celery_app = Celery(
-        app.import_name
+        app.import_name,
+        include=['genomic_data_service.summary_jobs'],
     )
     celery_app.conf.update(
         broker_url=app.config['CELERY_BROKER_URL'],
@@ -34,6 +35,7 @@ celery_app = make_celery(app)
 
 RESIDENTS_INDEX = 'resident_regionsets'
 FOR_REGULOME_DB = 'regulomedb'
+RESIDENTS_EPOCH_KEY = 'residents_epoch'
 
 # TODO: move constants to centralized file
 REGULOME_COLLECTION_TYPES = ['assay_term_name',
@@ -113,6 +115,16 @@ def add_to_residence(es, metadata):
 
     es.index(index=RESIDENTS_INDEX, doc_type=FOR_REGULOME_DB,
              body=metadata, id=str(metadata['uuid']))
+    bump_residents_epoch(es)
+
+
+def bump_residents_epoch(es):
+    # RegulomeAtlas caches the residents index and reloads it when this changes
+    try:
+        es.indices.put_mapping(index=RESIDENTS_INDEX, doc_type=FOR_REGULOME_DB,
+                               body={'_meta': {RESIDENTS_EPOCH_KEY: uuid.uuid4().hex}})
+    except Exception as e:
+        print('Failed to update residents epoch: %s' % e)
 
 
 def snps_bulk_iterator(snp_index, chrom, snps_for_chrom):
@@ -472,6 +484,7 @@ def remove_from_es(indexed_file, file_uuid, es):
 
         es.delete(index=RESIDENTS_INDEX,
                   doc_type=FOR_REGULOME_DB, id=str(file_uuid))
+        bump_residents_epoch(es)
 
         return True
 
@@ -480,6 +493,7 @@ def remove_snp_from_es(snp_index, file_uuid, es):
     es.delete(index=snp_index)
     es.delete(index=RESIDENTS_INDEX,
               doc_type=FOR_REGULOME_DB, id=str(file_uuid))
+    bump_residents_epoch(es)
 
 
 def remove_region_from_es(file_uuid, assembly, es):
@@ -488,6 +502,7 @@ def remove_region_from_es(file_uuid, assembly, es):
 
     es.delete(index=RESIDENTS_INDEX,
               doc_type=FOR_REGULOME_DB, id=str(file_uuid))
+    bump_residents_epoch(es)
 
 
 def file_in_es(file_uuid, es):
@@ -1,4 +1,5 @@
 from genomic_data_service import region_search_es
+from genomic_data_service.instrumentation import timed
 from genomic_data_service.rsid_coordinates_resolver import get_coordinates
 
 REGIONS_PER_PAGE = 100
@@ -67,8 +68,9 @@ class RegionService():
         if not (self.chrm and self.start and self.end):
             return
 
-        res = region_search_es.search(index=self.chrm, doc_type=self.assembly.lower(
-        ), _source=True, body=self.region_search_query())
+        with timed('es_regions'):
+            res = region_search_es.search(index=self.chrm, doc_type=self.assembly.lower(
+            ), _source=True, body=self.region_search_query())
 
         self.total_regions = res['hits']['total']
 
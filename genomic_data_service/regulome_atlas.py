@@ -1,16 +1,30 @@
 import pickle
+from bisect import bisect_left
 import math
+import threading
+import time
+import weakref
+from collections import OrderedDict
 import pyBigWig
+from elasticsearch.helpers import scan
 from os.path import exists
 import logging
 from genomic_data_service.constants import ORGANS
 import numpy as np
 from genomic_data_service.constants import GENOME_TO_ALIAS
+from genomic_data_service.instrumentation import timed
+from genomic_data_service.peak_index import PeakIndex
 
 RESIDENT_REGIONSET_KEY = (
     'resident_regionsets'  # keeps track of what datsets are resident
 )
 FOR_REGULOME_DB = 'regulomedb'
+# written into the resident_regionsets mapping _meta by the indexer whenever
+# residents change, see region_indexer_task.bump_residents_epoch
+RESIDENTS_EPOCH_KEY = 'residents_epoch'
+RESIDENTS_EPOCH_CHECK_SECONDS = 30
+# reload even if the epoch is unchanged, for residents written without one
+RESIDENTS_MAX_AGE_SECONDS = 3600
 EVIDENCE_CATEGORIES = [
     'QTL',
     'ChIP',
@@ -116,66 +130,653 @@ LOCAL_BIGWIGS = {
 }
 
 SEARCH_MAX = 9999
+# rsids looked up by one mget and SNP searches run by one msearch when
+# resolving many region queries
+MGET_CHUNK_SIZE = 1000
+MSEARCH_CHUNK_SIZE = 200
+
+# entries kept by each table of an atlas ScoringMemo
+SCORING_MEMO_SIZE = 4096
 
 HISTONE_MARKS = ['H3K27ac', 'H3K36me3', 'H3K4me1', 'H3K4me3', 'H3K27me3']
 
+# score categories by the code DatasetRecord.category holds, other histone
+# target labels get the next codes when first seen
+SCORE_CATEGORIES = [
+    'ChIP', 'Chromatin_accessibility', 'PWM', 'Footprint', 'QTL'] + HISTONE_MARKS
+SCORE_CATEGORY_CODES = {
+    category: code for code, category in enumerate(SCORE_CATEGORIES)}
+_score_categories_lock = threading.Lock()
+CHIP = SCORE_CATEGORY_CODES['ChIP']
+PWM = SCORE_CATEGORY_CODES['PWM']
+FOOTPRINT = SCORE_CATEGORY_CODES['Footprint']
+
+# features for the trained model: presence of each category then bigWig signals
+MODEL_BINARY_KEYS = [
+    'ChIP',
+    'Chromatin_accessibility',
+    'PWM',
+    'Footprint',
+    'QTL',
+    'PWM_matched',
+    'Footprint_matched',
+]
+MODEL_NUMERIC_KEYS = ['IC_max', 'IC_matched_max']
+
 TISSUE_SPECIFIC_FEATURE_KEYS = [
     'H3K27ac', 'H3K36me3', 'H3K4me1', 'H3K4me3', 'H3K27me3', 'DNase', 'Footprint']
 
+ORGAN_COLUMNS = {organ: column for column, organ in enumerate(ORGANS)}
+# bit of every ORGANS column in an organ mask
+ORGAN_BITS = np.uint64(1) << np.arange(len(ORGANS), dtype=np.uint64)
+
+
+def score_category_code(category):
+    """Returns the code of a score category in SCORE_CATEGORIES, None for no
+    category."""
+    if category is None:
+        return None
+    code = SCORE_CATEGORY_CODES.get(category)
+    if code is None:
+        with _score_categories_lock:
+            code = SCORE_CATEGORY_CODES.get(category)
+            if code is None:
+                code = len(SCORE_CATEGORIES)
+                SCORE_CATEGORIES.append(category)
+                SCORE_CATEGORY_CODES[category] = code
+    return code
+
+
+def organ_mask(dataset):
+    """Bitmask of the ORGANS columns of the organ_slims of a dataset, unknown
+    organs dropped."""
+    mask = 0
+    for organ in (dataset.get('biosample_ontology') or {}).get('organ_slims', []):
+        column = ORGAN_COLUMNS.get(organ)
+        if column is not None:
+            mask |= 1 << column
+    return mask
+
+
+def tissue_specific_mask(binary_values):
+    """Pack tissue specific features (in TISSUE_SPECIFIC_FEATURE_KEYS order)
+    into a bitmask, first feature being the most significant bit."""
+    mask = 0
+    for value in binary_values:
+        mask = (mask << 1) | int(value)
+    return mask
+
+
+def tissue_specific_scores_array(table):
+    """Convert the pickled lookup table (keys: feature tuples) to an array
+    indexed by tissue_specific_mask."""
+    if table is None:
+        return None
+    scores = np.zeros(2 ** len(TISSUE_SPECIFIC_FEATURE_KEYS))
+    for binary_values, score in table.items():
+        scores[tissue_specific_mask(binary_values)] = score
+    return scores
+
+
+TISSUE_SPECIFIC_SCORES = tissue_specific_scores_array(
+    TRAINED_TISSUE_SPECIFIC_TABLE)
+
+
+def ranking_rules(characterization):
+    """Returns RegulomeDB ranking from the evidence categories present, by
+    the RegulomeDB rules. Rankings are looked up from RANKINGS instead."""
+    ranking = '7'
+    if 'QTL' in characterization:
+        if 'ChIP' in characterization:
+            if 'Chromatin_accessibility' in characterization:
+                if (
+                    'PWM_matched' in characterization
+                    and 'Footprint_matched' in characterization
+                ):
+                    ranking = '1a'
+                elif 'PWM' in characterization and 'Footprint' in characterization:
+                    ranking = '1b'
+                elif 'PWM_matched' in characterization:
+                    ranking = '1c'
+                elif 'PWM' in characterization:
+                    ranking = '1d'
+                else:
+                    ranking = '1f'
+            elif 'PWM_matched' in characterization:
+                ranking = '1e'
+            else:
+                ranking = '1f'
+        elif 'Chromatin_accessibility' in characterization:
+            ranking = '1f'
+        elif 'PWM' in characterization or 'Footprint' in characterization:
+            ranking = '6'
+    elif 'ChIP' in characterization:
+        if 'Chromatin_accessibility' in characterization:
+            if (
+                'PWM_matched' in characterization
+                and 'Footprint_matched' in characterization
+            ):
+                ranking = '2a'
+            elif 'PWM' in characterization and 'Footprint' in characterization:
+                ranking = '2b'
+            elif 'PWM_matched' in characterization:
+                ranking = '2c'
+            elif 'PWM' in characterization:
+                ranking = '3a'
+            else:
+                ranking = '4'
+        elif 'PWM_matched' in characterization:
+            ranking = '3b'
+        else:
+            ranking = '5'
+    elif 'Chromatin_accessibility' in characterization:
+        ranking = '5'
+    elif 'PWM' in characterization or 'Footprint' in characterization:
+        ranking = '6'
+    return ranking
+
+
+def ranking_mask(characterization):
+    """Pack the presence of MODEL_BINARY_KEYS into a bitmask, first key
+    being the most significant bit."""
+    mask = 0
+    for key in MODEL_BINARY_KEYS:
+        mask = (mask << 1) | (key in characterization)
+    return mask
+
+
+def rankings_array():
+    """Rankings for every combination of MODEL_BINARY_KEYS, indexed by ranking_mask."""
+    rankings = np.empty(2 ** len(MODEL_BINARY_KEYS), dtype=object)
+    for mask in range(len(rankings)):
+        rankings[mask] = ranking_rules({
+            key: [] for i, key in enumerate(reversed(MODEL_BINARY_KEYS))
+            if mask & (1 << i)
+        })
+    return rankings
+
+
+RANKINGS = rankings_array()
+# weights turning the binary columns of model queries into ranking masks
+RANKING_MASK_WEIGHTS = 1 << np.arange(len(MODEL_BINARY_KEYS) - 1, -1, -1)
+
+
+class SignalWindow(object):
+    """bigWig signal arrays prefetched for chrom starting at start"""
+
+    __slots__ = ('chrom', 'start', 'values')
+
+    def __init__(self, chrom, start, values):
+        self.chrom = chrom
+        self.start = start
+        self.values = values
+
+    def values_for(self, k, chrom, start, end):
+        """Returns signal k for chrom:start-end as a list, or None when the
+        window does not hold it."""
+        values = self.values.get(k)
+        if values is None or chrom != self.chrom or start < self.start:
+            return None
+        if end - self.start > len(values):
+            return None
+        # plain floats keep the average identical to a direct bigWig read
+        return values[start - self.start:end - self.start].tolist()
+
+
+class SortedSnps(list):
+    """SNPs as found, with their indexes in location order in order and
+    their start positions in that order in positions, to bisect on."""
+
+    __slots__ = ('order', 'positions')
+
+    def __init__(self, snps=()):
+        super().__init__(snps)
+        starts = [snp['coordinates']['gte'] for snp in self]
+        self.order = sorted(range(len(starts)), key=starts.__getitem__)
+        self.positions = [starts[i] for i in self.order]
+
+
+class LRUMemo(object):
+    """Bounded least recently used memo with hit and miss counters."""
+
+    def __init__(self, max_size=SCORING_MEMO_SIZE):
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key, default=None):
+        with self._lock:
+            if key not in self._entries:
+                self.misses += 1
+                return default
+            self.hits += 1
+            self._entries.move_to_end(key)
+            return self._entries[key]
+
+    def put(self, key, value):
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            'size': len(self._entries),
+            'max_size': self.max_size,
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / lookups if lookups else 0.0,
+        }
+
+
+class ScoringMemo(object):
+    """Memoized scoring work of an atlas, keyed on the set of overlapping peak
+    uuids: datasets breakdown, categorical evidence (evidence without bigWig
+    signals) and scores, the latter also keyed on the IC signals as float32,
+    the precision the trained model compares features at.
+
+    Memoized values are shared between variants and must not be modified.
+    """
+
+    def __init__(self, max_size=SCORING_MEMO_SIZE):
+        self.datasets = LRUMemo(max_size)
+        self.evidence = LRUMemo(max_size)
+        self.scores = LRUMemo(max_size)
+
+    @staticmethod
+    def score_key(evidence_key, evidence):
+        return (evidence_key,) + tuple(
+            np.float32(evidence.get(k, 0.0)).item() for k in MODEL_NUMERIC_KEYS
+        )
+
+    def stats(self):
+        return {
+            'datasets': self.datasets.stats(),
+            'evidence': self.evidence.stats(),
+            'scores': self.scores.stats(),
+        }
+
+
+class DatasetRecord(object):
+    """Scoring facts of a resident dataset, derived once when residents are
+    loaded instead of for every evidence and brief that uses the dataset.
+    Other views of the dataset can be memoized in derived.
+
+    category is the code of the score category in SCORE_CATEGORIES, None
+    when the dataset is not used for scoring, and organ_mask the bitmask of
+    its ORGANS columns.
+    """
+
+    __slots__ = (
+        'dataset', 'category', 'organ_mask', 'targets', 'brief', 'derived')
+
+    def __init__(self, dataset):
+        self.dataset = dataset
+        self.derived = {}
+        self.category = score_category_code(
+            RegulomeAtlas._score_category(dataset))
+        self.organ_mask = organ_mask(dataset)
+
+        target = dataset.get('target')
+        if not target:
+            self.targets = ()
+        elif isinstance(target, str):
+            self.targets = (target,)
+        elif isinstance(target, list):  # rare but PWM targets might be list
+            self.targets = tuple(target)
+        else:
+            self.targets = ()
+
+        # accession|target|biosample| part of the brief, see _write_a_brief
+        try:
+            brief = dataset.get('@id', '').split('/')[-2] + '|'  # accession is buried in @id
+        except Exception:
+            brief = '|'
+        if target:
+            if isinstance(target, list):
+                target = '/'.join(target)
+            brief += target.replace(' ', '') + '|'
+        biosample = dataset.get(
+            'biosample_term_name', dataset.get('biosample_summary')
+        )
+        if biosample:
+            brief += biosample.replace(' ', '') + '|'
+        self.brief = brief
+
+
+@timed('es_residents')
+def read_residents_epoch(es):
+    """Returns the residents epoch written by the indexer in the _meta of the
+    resident_regionsets mapping, None if it is not set or can not be read."""
+    try:
+        mappings = es.indices.get_mapping(
+            index=RESIDENT_REGIONSET_KEY, doc_type=FOR_REGULOME_DB)
+    except Exception:
+        return None
+    for index in mappings.values():
+        mapping = index.get('mappings', {}).get(FOR_REGULOME_DB, {})
+        return mapping.get('_meta', {}).get(RESIDENTS_EPOCH_KEY)
+    return None
+
+
+class ResidentsCache(object):
+    """In memory copy of the whole resident_regionsets index, keyed by uuid.
+
+    The index only holds a few thousand slowly changing metadata documents,
+    so it is loaded at once and reloaded only when the epoch written by the
+    indexer changes (checked at most every check_seconds). Cached documents
+    are shared between requests and must not be modified.
+    """
+
+    def __init__(self, check_seconds=RESIDENTS_EPOCH_CHECK_SECONDS,
+                 max_age_seconds=RESIDENTS_MAX_AGE_SECONDS):
+        self.check_seconds = check_seconds
+        self.max_age_seconds = max_age_seconds
+        self.hits = 0
+        self.misses = 0
+        self.refreshes = 0
+        self._lock = threading.Lock()
+        self._residents = None
+        self._records = {}
+        self._epoch = None
+        self._checked = 0
+        self._loaded = 0
+
+    @staticmethod
+    def _read_epoch(es):
+        """private: returns the residents epoch from the index mapping, None if not set"""
+        return read_residents_epoch(es)
+
+    @staticmethod
+    @timed('es_residents')
+    def _load(es):
+        residents = {}
+        for hit in scan(
+            es,
+            index=RESIDENT_REGIONSET_KEY,
+            doc_type=FOR_REGULOME_DB,
+            query={'query': {'match_all': {}}},
+        ):
+            residents[hit['_source']['uuid']] = hit['_source']
+        return residents
+
+    def _refresh(self, es):
+        """private: reloads the residents if the epoch changed, returns True if it did"""
+        with self._lock:
+            now = time.monotonic()
+            if self._residents is not None and now - self._checked < self.check_seconds:
+                return False
+            self._checked = now
+            epoch = self._read_epoch(es)
+            if (
+                self._residents is not None
+                and epoch == self._epoch
+                and now - self._loaded < self.max_age_seconds
+            ):
+                return False
+            try:
+                residents = self._load(es)
+            except Exception:
+                # keep serving the previous copy, if any
+                logging.exception('Failed to load resident regionsets')
+                return False
+            self._records = {
+                id(detail['dataset']): DatasetRecord(detail['dataset'])
+                for detail in residents.values() if 'dataset' in detail
+            }
+            self._residents = residents
+            self._epoch = epoch
+            self._loaded = now
+            self.refreshes += 1
+            logging.info(
+                'Loaded %d resident regionsets (epoch %s, hit rate %.3f)',
+                len(residents), epoch, self.hit_rate()
+            )
+            return True
+
+    def details(self, es, uuids):
+        """Returns resident details of the uuids found in the index,
+        None if the index could not be read."""
+        if self._refresh(es):
+            self.misses += 1
+        else:
+            self.hits += 1
+        residents = self._residents
+        if residents is None:
+            return None
+        return {uuid: residents[uuid] for uuid in uuids if uuid in residents}
+
+    def epoch(self, es):
+        """Returns the residents epoch, checked at most every check_seconds."""
+        self._refresh(es)
+        return self._epoch
+
+    def record(self, dataset):
+        """Returns the DatasetRecord of a dataset, built on the fly for
+        datasets that are not (or no longer) cached."""
+        record = self._records.get(id(dataset))
+        if record is None or record.dataset is not dataset:
+            record = DatasetRecord(dataset)
+        return record
+
+    def hit_rate(self):
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+    def stats(self):
+        return {
+            'residents': len(self._residents or {}),
+            'epoch': self._epoch,
+            'hits': self.hits,
+            'misses': self.misses,
+            'refreshes': self.refreshes,
+            'hit_rate': self.hit_rate(),
+        }
+
 
 class RegulomeAtlas(object):
+    # one residents cache per elasticsearch client, shared by the atlases
+    # created for every request
+    _residents_caches = weakref.WeakKeyDictionary()
+    _residents_caches_lock = threading.Lock()
+
     def __init__(self, es):
         self.es = es
         self.bigwig_signal_map = LOCAL_BIGWIGS
+        self.scoring_memo = ScoringMemo()
+        # hits of searches already run by an msearch, see prefetch_search
+        self._prefetched = {}
+        self.timing = []
+
+    @property
+    def residents_cache(self):
+        if self.es is None:
+            return ResidentsCache()
+        with self._residents_caches_lock:
+            cache = self._residents_caches.get(self.es)
+            if cache is None:
+                cache = self._residents_caches[self.es] = ResidentsCache()
+        return cache
 
     def snp_es_index_name(self, assembly):
         return 'snp_' + assembly.lower()
 
     def find_snp(self, assembly, rsid):
         try:
-            res = self.es.get(
-                index=self.snp_es_index_name(assembly), doc_type='_all', id=rsid
-            )
+            with timed('es_snp'):
+                res = self.es.get(
+                    index=self.snp_es_index_name(assembly), doc_type='_all', id=rsid
+                )
         except Exception:
             return None
 
         return res['_source']
 
+    def find_snps_by_rsid(self, assembly, rsids):
+        """Returns the SNPs find_snp would find for rsids, keyed by rsid,
+        with one mget every MGET_CHUNK_SIZE rsids."""
+        snps = {}
+        rsids = list(dict.fromkeys(rsids))
+        for i in range(0, len(rsids), MGET_CHUNK_SIZE):
+            chunk = rsids[i:i + MGET_CHUNK_SIZE]
+            try:
+                with timed('es_mget'):
+                    res = self.es.mget(
+                        index=self.snp_es_index_name(assembly), body={'ids': chunk}
+                    )
+            except Exception:
+                logging.exception('Failed to get %d rsids', len(chunk))
+                continue
+            for doc in res['docs']:
+                if doc.get('found'):
+                    snps[doc['_id']] = doc['_source']
+        return snps
+
     def find_snps(self, assembly, chrom, start, end, max_results=SEARCH_MAX, maf=None):
+        """Returns the SNPs of a region as SortedSnps."""
+        key = ('snps', assembly, chrom, start, end, max_results, maf)
+        if key in self._prefetched:
+            return SortedSnps(hit['_source'] for hit in self._prefetched.pop(key))
+
         range_query = self._range_query(start, end, maf=maf)
 
         try:
-            results = self.es.search(
-                index=self.snp_es_index_name(assembly),
-                doc_type=chrom,
-                _source=True,
-                body=range_query,
-                size=max_results,
-            )
+            with timed('es_snps'):
+                results = self.es.search(
+                    index=self.snp_es_index_name(assembly),
+                    doc_type=chrom,
+                    _source=True,
+                    body=range_query,
+                    size=max_results,
+                )
         except Exception:
-            return []
+            return SortedSnps()
 
-        return [hit['_source'] for hit in results['hits']['hits']]
+        return SortedSnps(hit['_source'] for hit in results['hits']['hits'])
 
     def find_peaks(
         self, assembly, chrom, start, end, peaks_too=False, max_results=SEARCH_MAX
     ):
+        key = ('peaks', assembly, chrom, start, end, max_results)
+        if key in self._prefetched:
+            return list(self._prefetched.pop(key))
+
         range_query = self._range_query(start, end, max_results=max_results)
 
-        results = self.es.search(
-            index=chrom.lower(),
-            doc_type=assembly,
-            _source=True,
-            body=range_query,
-            size=max_results,
-        )
+        with timed('es_peaks'):
+            results = self.es.search(
+                index=chrom.lower(),
+                doc_type=assembly,
+                _source=True,
+                body=range_query,
+                size=max_results,
+            )
 
         return list(results['hits']['hits'])
 
+    def _snps_search(self, assembly, chrom, start, end, max_results=SEARCH_MAX, maf=None):
+        """private: returns the prefetch key and msearch header and body of find_snps"""
+        body = self._range_query(start, end, maf=maf)
+        body['size'] = max_results
+        body['_source'] = True
+        return (
+            ('snps', assembly, chrom, start, end, max_results, maf),
+            {'index': self.snp_es_index_name(assembly), 'type': chrom},
+            body,
+        )
+
+    def _peaks_search(self, assembly, chrom, start, end, max_results=SEARCH_MAX):
+        """private: returns the prefetch key and msearch header and body of find_peaks"""
+        body = self._range_query(start, end, max_results=max_results)
+        body['_source'] = True
+        return (
+            ('peaks', assembly, chrom, start, end, max_results),
+            {'index': chrom.lower(), 'type': assembly},
+            body,
+        )
+
+    def _msearch(self, searches):
+        """private: runs searches in one round trip, keeping their hits for
+        find_snps and find_peaks. Failed searches are left to run on their own."""
+        body = []
+        for (_key, header, query) in searches:
+            body.extend([header, query])
+        try:
+            with timed('es_msearch'):
+                responses = self.es.msearch(body=body)['responses']
+        except Exception:
+            logging.exception('Failed to prefetch %d searches', len(searches))
+            return
+        for (key, _header, _query), response in zip(searches, responses):
+            if 'error' not in response:
+                self._prefetched[key] = response['hits']['hits']
+
+    def prefetch_search(self, assembly, chrom, start, end, maf=None):
+        """Prefetches with one msearch the independent queries of a /search/
+        request: its peaks and the SNPs nearby. Variants in the region are
+        picked from the nearby SNPs when the region lies in their window.
+        Resident details of the peaks come from the residents cache."""
+        begin = time.time()
+        (nearby_start, nearby_end) = self._nearby_range(int((start + end) / 2))
+        nearby_search = self._snps_search(assembly, chrom, nearby_start, nearby_end)
+        snps_search = self._snps_search(assembly, chrom, start, end, maf=maf)
+        searches = [nearby_search, self._peaks_search(assembly, chrom, start, end)]
+        in_window = nearby_start <= start and end <= nearby_end
+        if not in_window:
+            searches.append(snps_search)
+        self._msearch(searches)
+
+        nearby_hits = self._prefetched.get(nearby_search[0])
+        if in_window and nearby_hits is not None and len(nearby_hits) < SEARCH_MAX:
+            snps = self._filter_snp_hits(nearby_hits, start, end, maf)
+            if snps is not None:
+                self._prefetched[snps_search[0]] = snps
+        self.timing.append({'prefetch_searches': (time.time() - begin)})
+
+    def prefetch_snps(self, assembly, regions):
+        """Prefetches find_snps of regions, (chrom, start, end, maf) tuples,
+        with one msearch every MSEARCH_CHUNK_SIZE regions."""
+        searches = [
+            self._snps_search(assembly, chrom, start, end, maf=maf)
+            for (chrom, start, end, maf) in regions
+        ]
+        for i in range(0, len(searches), MSEARCH_CHUNK_SIZE):
+            self._msearch(searches[i:i + MSEARCH_CHUNK_SIZE])
+
+    @staticmethod
+    def _filter_snp_hits(hits, start, end, maf=None):
+        """private: returns the SNP hits find_snps would find for start-end
+        (see _range_query), None if maf is not a number"""
+        try:
+            maf = None if maf is None else float(maf)
+        except ValueError:
+            return None
+        snps = []
+        for hit in hits:
+            coordinates = hit['_source']['coordinates']
+            if not (coordinates['gte'] < end and coordinates['lt'] > start):
+                continue
+            if maf is not None and (
+                hit['_source'].get('maf') is None or hit['_source']['maf'] < maf
+            ):
+                continue
+            snps.append(hit)
+        return snps
+
     def find_peaks_filtered(self, assembly, chrom, start, end, peaks_too=False):
         peaks = self.find_peaks(assembly, chrom, start,
                                 end, peaks_too=peaks_too)
+        return self.filter_peaks(peaks)
 
+    def filter_peaks(self, peaks):
+        """Returns the peaks of resident datasets, with their resident details"""
         if not peaks:
             return (peaks, None)
 
@@ -193,42 +794,92 @@ class RegulomeAtlas(object):
 
         return (filtered_peaks, details)
 
-    def regulome_evidence(self, assembly, datasets, chrom, start, end):
-        """Returns evidence for scoring: datasets in a characterized dict"""
+    @timed('bigwig')
+    def signal_window(self, assembly, chrom, start, end):
+        """Reads bigWig signals for a whole window at once, so evidence for
+        every position in it can be sliced out instead of read separately."""
+        values = {}
+        for k, bw in self.bigwig_signal_map[GENOME_TO_ALIAS.get(assembly)].items():
+            try:
+                window_end = min(end, bw.chroms(chrom))
+                values[k] = bw.values(chrom, start, window_end, numpy=True)
+            except Exception:
+                # positions in the window will be read one by one
+                values[k] = None
+        return SignalWindow(chrom, start, values)
+
+    def regulome_evidence(
+        self, assembly, datasets, chrom, start, end, signals=None, uuids=None
+    ):
+        """Returns evidence for scoring: datasets in a characterized dict
+
+        signals is an optional SignalWindow prefetched for a window holding
+        chrom:start-end; without it bigWig files are read for this location.
+        uuids, the peak uuids the datasets were broken down from, memoizes
+        the categorical part of the evidence.
+        """
+
+        if uuids is None:
+            evidence = self._categorical_evidence(datasets)
+        else:
+            key = self._evidence_key(uuids)
+            categorical = self.scoring_memo.evidence.get(key)
+            if categorical is None:
+                categorical = self._categorical_evidence(datasets)
+                self.scoring_memo.evidence.put(key, categorical)
+            evidence = dict(categorical)
 
+        # Get values/signals from bigWig
+        evidence.update(self._signal_evidence(
+            assembly, chrom, start, end, signals=signals))
+        return evidence
+
+    def _categorical_evidence(self, datasets):
+        """private: returns evidence categories of the datasets, without bigWig signals"""
         evidence = {}
-        targets = {'ChIP': [], 'PWM': [], 'Footprint': []}
+        by_code = {}
+        targets = {CHIP: [], PWM: [], FOOTPRINT: []}
         if datasets:
+            record = self.residents_cache.record
             for dataset in datasets.values():
-                character = self._score_category(dataset)
-                if character is None:
+                dataset_record = record(dataset)
+                code = dataset_record.category
+                if code is None:
                     continue
-                if character not in evidence:
-                    evidence[character] = []
-                evidence[character].append(dataset)
-                target = dataset.get('target')
-                if target and character in ['ChIP', 'PWM', 'Footprint']:
-                    if isinstance(target, str):
-                        targets[character].append(target)
-                    elif isinstance(target, list):  # rare but PWM targets might be list
-                        for targ in target:
-                            targets[character].append(targ)
+                if code not in by_code:
+                    by_code[code] = []
+                by_code[code].append(dataset)
+                if code in targets:
+                    targets[code].extend(dataset_record.targets)
+            for code, category_datasets in by_code.items():
+                evidence[SCORE_CATEGORIES[code]] = category_datasets
 
         # For each ChIP target, there could be a PWM and/or Footprint to match
-        for target in targets['ChIP']:
-            if target in targets['PWM']:
-                if 'PWM_matched' not in evidence:
-                    evidence['PWM_matched'] = []
-                evidence['PWM_matched'].append(target)
-            if target in targets['Footprint']:
-                if 'Footprint_matched' not in evidence:
-                    evidence['Footprint_matched'] = []
-                evidence['Footprint_matched'].append(target)
+        pwm_targets = set(targets[PWM])
+        footprint_targets = set(targets[FOOTPRINT])
+        if pwm_targets or footprint_targets:
+            for target in targets[CHIP]:
+                if target in pwm_targets:
+                    if 'PWM_matched' not in evidence:
+                        evidence['PWM_matched'] = []
+                    evidence['PWM_matched'].append(target)
+                if target in footprint_targets:
+                    if 'Footprint_matched' not in evidence:
+                        evidence['Footprint_matched'] = []
+                    evidence['Footprint_matched'].append(target)
+        return evidence
 
-        # Get values/signals from bigWig
+    @timed('bigwig')
+    def _signal_evidence(self, assembly, chrom, start, end, signals=None):
+        """private: returns average bigWig signals for the location"""
+        evidence = {}
         for k, bw in self.bigwig_signal_map[GENOME_TO_ALIAS.get(assembly)].items():
             try:
-                values = bw.values(chrom, start, end)
+                values = None
+                if signals is not None:
+                    values = signals.values_for(k, chrom, start, end)
+                if values is None:
+                    values = bw.values(chrom, start, end)
                 average = sum(values) / max(len(values), 1)
                 evidence[k] = 0.0 if math.isnan(average) else average
             except Exception as e:
@@ -237,6 +888,22 @@ class RegulomeAtlas(object):
                 evidence[k] = 0.0
         return evidence
 
+    def _evidence_key(self, uuids):
+        """private: memo key of the peak uuids, for the current residents"""
+        return (self.residents_cache.refreshes, frozenset(uuids))
+
+    def _uuids_datasets(self, details, uuids):
+        """private: returns the datasets breakdown of peak uuids, memoized"""
+        key = self._evidence_key(uuids)
+        datasets = self.scoring_memo.datasets.get(key)
+        if datasets is None:
+            datasets = {}
+            uuid_details = self._filter_details(details, uuids=list(uuids))
+            if uuid_details:
+                (datasets, _files) = self.details_breakdown(uuid_details)
+            self.scoring_memo.datasets.put(key, datasets)
+        return datasets
+
     @staticmethod
     def _range_query(start, end, maf=None, max_results=SEARCH_MAX):
         # get all peaks that overlap requested point
@@ -266,42 +933,8 @@ class RegulomeAtlas(object):
 
         return query
 
-    def _resident_details(self, uuids, max_results=SEARCH_MAX):
-        try:
-            id_query = {'query': {'ids': {'values': uuids}}}
-            res = self.es.search(
-                index=RESIDENT_REGIONSET_KEY,
-                body=id_query,
-                doc_type=[FOR_REGULOME_DB],
-                size=max_results,
-            )
-        except Exception:
-            return None
-
-        details = {}
-
-        hits = res.get('hits', {}).get('hits', [])
-        for hit in hits:
-            details[hit['_source']['uuid']] = hit['_source']
-
-        return details
-
-    @staticmethod
-    def _peak_uuids_in_overlap(peaks, chrom, start, end=None):
-        """private: returns set of only the uuids for peaks that overlap a given location"""
-        if end is None:
-            end = start
-
-        overlap = set()
-        for peak in peaks:
-            if (
-                chrom == peak['_index']
-                and start <= peak['_source']['coordinates']['lt']
-                and end >= peak['_source']['coordinates']['gte']
-            ):
-                overlap.add(peak['_source']['uuid'])
-
-        return overlap
+    def _resident_details(self, uuids):
+        return self.residents_cache.details(self.es, uuids)
 
     @staticmethod
     def _filter_details(details, uuids=None, peaks=None):
@@ -388,8 +1021,10 @@ class RegulomeAtlas(object):
         brief = ''
         cur_score_category = ''
         cur_regdb_category = ''
+        record = self.residents_cache.record
         for dataset in snp_evidence_category:
-            new_score_category = self._score_category(dataset)
+            dataset_record = record(dataset)
+            new_score_category = SCORE_CATEGORIES[dataset_record.category]
             if cur_score_category != new_score_category:
                 cur_score_category = new_score_category
                 new_regdb_category = self._regulome_category(
@@ -400,23 +1035,7 @@ class RegulomeAtlas(object):
                         brief += ';'
                     brief += '%s:' % cur_regdb_category
                 brief += '%s:|' % cur_score_category
-            try:
-                brief += (
-                    dataset.get('@id', '').split('/')[-2] + '|'
-                )  # accession is buried in @id
-            except Exception:
-                brief += '|'
-            target = dataset.get('target')
-            if target:
-                if isinstance(target, list):
-                    target = '/'.join(target)
-                brief += target.replace(' ', '') + '|'
-            biosample = dataset.get(
-                'biosample_term_name', dataset.get('biosample_summary')
-            )
-            if biosample:
-                brief += biosample.replace(' ', '') + '|'
-            brief += ','
+            brief += dataset_record.brief + ','
         return brief[:-1]  # remove last comma
 
     def make_a_case(self, snp):
@@ -432,130 +1051,152 @@ class RegulomeAtlas(object):
         return case
 
     @staticmethod
-    def _score(characterization):
+    def _model_query(characterization):
+        """private: returns the feature vector the trained model expects"""
+        query = [int(k in characterization) for k in MODEL_BINARY_KEYS]
+        query += [characterization[k] for k in MODEL_NUMERIC_KEYS]
+        return query
+
+    @staticmethod
+    def _tissue_specific_masks(characterization, record=None):
+        """private: returns the tissue specific feature bitmask of every organ
+
+        record returns the DatasetRecord of a dataset, whose organ mask is
+        used; without it organ masks are derived from the datasets.
+        """
+        masks = np.zeros(len(ORGANS), dtype=np.intp)
+        for i, key in enumerate(TISSUE_SPECIFIC_FEATURE_KEYS):
+            if key not in characterization:
+                continue
+            organs = 0
+            for dataset in characterization[key]:
+                if record is None:
+                    organs |= organ_mask(dataset)
+                else:
+                    organs |= record(dataset).organ_mask
+            if organs:
+                bit = 1 << (len(TISSUE_SPECIFIC_FEATURE_KEYS) - 1 - i)
+                masks[(np.uint64(organs) & ORGAN_BITS) != 0] |= bit
+        return masks
+
+    @staticmethod
+    def _ranking(characterization):
+        """private: returns RegulomeDB ranking from the evidence categories present"""
+        return RANKINGS[ranking_mask(characterization)]
+
+    @staticmethod
+    def _score(characterization, record=None):
         """private: returns regulome score from characterization set"""
+        return RegulomeAtlas._score_batch([characterization], record)[0]
+
+    @staticmethod
+    def _score_batch(characterizations, record=None):
+        """private: returns regulome scores for many characterization sets,
+        running the trained model only once. record is passed on to
+        _tissue_specific_masks."""
+        if not characterizations:
+            return []
         # Predict as probability of being a regulatory SNP from prediction
-        binary_keys = [
-            'ChIP',
-            'Chromatin_accessibility',
-            'PWM',
-            'Footprint',
-            'QTL',
-            'PWM_matched',
-            'Footprint_matched',
+        queries = [
+            RegulomeAtlas._model_query(characterization)
+            for characterization in characterizations
         ]
-        query = [int(k in characterization) for k in binary_keys]
-        numeric_keys = ['IC_max', 'IC_matched_max']
-        query += [characterization[k] for k in numeric_keys]
-        tissue_specific_query = {}
-        for organ in ORGANS:
-            tissue_specific_query[organ] = [0]*7
-        for i in range(len(TISSUE_SPECIFIC_FEATURE_KEYS)):
-            if TISSUE_SPECIFIC_FEATURE_KEYS[i] in characterization:
-                datasets = characterization[TISSUE_SPECIFIC_FEATURE_KEYS[i]]
-                organs = []
-                for dataset in datasets:
-                    organs.extend(
-                        dataset['biosample_ontology'].get('organ_slims', []))
-                organs = list(set(organs))
-                for organ in organs:
-                    if organ in ORGANS:
-                        tissue_specific_query[organ][i] = 1
 
         # The TRAINED_REG_MODEL is a `sklearn.ensemble.forest.RandomForestClassifier`
         # https://scikit-learn.org/stable/modules/generated/sklearn.ensemble.RandomForestClassifier.html
-        # In general, the input of the `predict_proba` method is a matrix of
+        # The input of the `predict_proba` method is a matrix of
         # shape = [n_variants, n_features]. There are two classes for variant
         # in RegulomeDB, being allele-specific TF binding or not. So the output
-        # is an numpy array of shape = [n_samples, 2]. Here, we only do one
-        # variant at a time. So `query` is a list of lists with
-        # shape = [1, n_features] and the output of
-        # `TRAINED_REG_MODEL.predict_proba([query])` is numpy array of
-        # shape = [1, 2]. Specifically, the second column is the probability we
-        # would like to output. So `[:, 1][0]` will be the desired score.
-        probability = round(
-            TRAINED_REG_MODEL.predict_proba([query])[:, 1][0], 5)
-        ranking = '7'
-        if 'QTL' in characterization:
-            if 'ChIP' in characterization:
-                if 'Chromatin_accessibility' in characterization:
-                    if (
-                        'PWM_matched' in characterization
-                        and 'Footprint_matched' in characterization
-                    ):
-                        ranking = '1a'
-                    elif 'PWM' in characterization and 'Footprint' in characterization:
-                        ranking = '1b'
-                    elif 'PWM_matched' in characterization:
-                        ranking = '1c'
-                    elif 'PWM' in characterization:
-                        ranking = '1d'
-                    else:
-                        ranking = '1f'
-                elif 'PWM_matched' in characterization:
-                    ranking = '1e'
-                else:
-                    ranking = '1f'
-            elif 'Chromatin_accessibility' in characterization:
-                ranking = '1f'
-            elif 'PWM' in characterization or 'Footprint' in characterization:
-                ranking = '6'
-        elif 'ChIP' in characterization:
-            if 'Chromatin_accessibility' in characterization:
-                if (
-                    'PWM_matched' in characterization
-                    and 'Footprint_matched' in characterization
-                ):
-                    ranking = '2a'
-                elif 'PWM' in characterization and 'Footprint' in characterization:
-                    ranking = '2b'
-                elif 'PWM_matched' in characterization:
-                    ranking = '2c'
-                elif 'PWM' in characterization:
-                    ranking = '3a'
-                else:
-                    ranking = '4'
-            elif 'PWM_matched' in characterization:
-                ranking = '3b'
-            else:
-                ranking = '5'
-        elif 'Chromatin_accessibility' in characterization:
-            ranking = '5'
-        elif 'PWM' in characterization or 'Footprint' in characterization:
-            ranking = '6'
-        tissue_specific_scores = {}
-        for tissue, binary_values in tissue_specific_query.items():
-            # get tissue specific scores from lookup table (keys: tuples)
-            tissue_specific_score = TRAINED_TISSUE_SPECIFIC_TABLE[tuple(
-                binary_values)]
-            tissue_specific_scores[tissue] = str(
-                round(tissue_specific_score * probability, 5))
-        probability = str(probability)
-        return {'probability': probability, 'ranking': ranking, 'tissue_specific_scores': tissue_specific_scores}
+        # is an numpy array of shape = [n_variants, 2]. Specifically, the
+        # second column is the probability we would like to output. Every row
+        # is predicted independently, so scoring variants together gives the
+        # same probabilities as scoring them one at a time while paying the
+        # per-call overhead of the model only once.
+        queries = np.array(queries, dtype=np.float64)
+        with timed('model'):
+            probabilities = np.round(
+                TRAINED_REG_MODEL.predict_proba(queries)[:, 1], 5)
+
+        # rankings of all characterizations in one gather
+        binary = queries[:, :len(MODEL_BINARY_KEYS)].astype(np.intp)
+        rankings = RANKINGS[binary @ RANKING_MASK_WEIGHTS]
+
+        # get tissue specific scores from lookup table for all organs at once
+        masks = np.array([
+            RegulomeAtlas._tissue_specific_masks(characterization, record)
+            for characterization in characterizations
+        ])
+        tissue_specific_scores = np.round(
+            TISSUE_SPECIFIC_SCORES[masks] * probabilities[:, np.newaxis], 5)
+
+        scores = []
+        for ranking, probability, tissue_scores in zip(
+            rankings, probabilities, tissue_specific_scores.tolist()
+        ):
+            scores.append({
+                'probability': str(probability),
+                'ranking': ranking,
+                'tissue_specific_scores': dict(zip(ORGANS, map(str, tissue_scores))),
+            })
+        return scores
 
     def regulome_score(self, datasets, evidence):
         """Calculate RegulomeDB score based upon hits and voodoo"""
         if not evidence:
             return None
-        return self._score(evidence)
+        return self._score(evidence, self.residents_cache.record)
+
+    def regulome_scores(self, evidences, uuids=None):
+        """Calculate RegulomeDB scores for many evidence sets at once.
+
+        Returns a list parallel to evidences, with None for empty evidence.
+        uuids, an optional list parallel to evidences of the peak uuids each
+        evidence was built from, memoizes the scores.
+        """
+        if uuids is None:
+            uuids = [None] * len(evidences)
+        scores = [None] * len(evidences)
+        missing = []
+        # indices of evidences waiting for the score of the same memo key
+        pending = {}
+        for i, (evidence, evidence_uuids) in enumerate(zip(evidences, uuids)):
+            if not evidence:
+                continue
+            if evidence_uuids is None:
+                missing.append((i, None))
+                continue
+            key = self.scoring_memo.score_key(
+                self._evidence_key(evidence_uuids), evidence)
+            scores[i] = self.scoring_memo.scores.get(key)
+            if scores[i] is not None:
+                continue
+            if key not in pending:
+                pending[key] = []
+                missing.append((i, key))
+            pending[key].append(i)
+        computed = self._score_batch(
+            [evidences[i] for i, _key in missing], self.residents_cache.record)
+        for (i, key), score in zip(missing, computed):
+            scores[i] = score
+            if key is not None:
+                self.scoring_memo.scores.put(key, score)
+                for j in pending[key]:
+                    scores[j] = score
+        return scores
 
     @staticmethod
     def _snp_window(snps, window, center_pos=None):
-        """Reduce a list of snps to a set number of snps centered around position"""
+        """Reduce a list of snps to a set number of snps centered around
+        position. SortedSnps, as find_snps returns, are not sorted again."""
         if len(snps) <= window:
             return snps
 
-        snps = sorted(snps, key=lambda s: s['coordinates']['gte'])
-        ix = 0
-        for snp in snps:
-            if snp['coordinates']['gte'] >= center_pos:
-                break
-            ix += 1
+        if not isinstance(snps, SortedSnps):
+            snps = SortedSnps(snps)
+        ix = bisect_left(snps.positions, center_pos)
 
-        first_ix = int(ix - (window / 2))
-        if first_ix > 0:
-            snps = snps[first_ix:]
-        return snps[:window]
+        first_ix = max(int(ix - (window / 2)), 0)
+        return [snps[i] for i in snps.order[first_ix:first_ix + window]]
 
     def _scored_snps(self, assembly, chrom, start, end, window=-1, center_pos=None):
         """For a region, yields all SNPs with scores"""
@@ -577,24 +1218,20 @@ class RegulomeAtlas(object):
                 yield snp
                 return
 
-        last_uuids = {}
+        peak_index = PeakIndex(peaks)
+        signals = self.signal_window(assembly, chrom, start, end)
+        evidences = []
+        evidence_uuids = []
         for snp in snps:
             snp['score'] = None  # default
             snp['assembly'] = assembly
-            snp_uuids = self._peak_uuids_in_overlap(
-                peaks, snp['chrom'], snp['coordinates']['gte']
-            )
+            snp_evidence = None
+            snp_uuids = frozenset(peak_index.overlapping(
+                snp['chrom'], snp['coordinates']['gte']))
             if snp_uuids:
-                # Otherwise datasets hits would be the same
-                if snp_uuids != last_uuids:
-                    last_uuids = snp_uuids
-                    snp_details = self._filter_details(
-                        details, uuids=list(snp_uuids))
-                    if snp_details:
-                        (snp_datasets, _snp_files) = self.details_breakdown(
-                            snp_details)
-                    else:
-                        snp_datasets = {}
+                # Neighbouring SNPs mostly overlap the same peaks: datasets
+                # and categorical evidence are memoized on the peak uuids
+                snp_datasets = self._uuids_datasets(details, snp_uuids)
                 # Regulome evidence now includes signals from bigWig.
                 # Better to recalculate for every new locations.
                 if snp_datasets:
@@ -604,14 +1241,18 @@ class RegulomeAtlas(object):
                         snp['chrom'],
                         snp['coordinates']['gte'],
                         snp['coordinates']['lt'],
+                        signals=signals,
+                        uuids=snp_uuids,
                     )
                     if snp_evidence:
-                        snp['score'] = self.regulome_score(
-                            snp_datasets, snp_evidence)
                         snp['evidence'] = snp_evidence
-                        yield snp
-                        continue
-            # if we are here this snp had no score
+            evidences.append(snp_evidence)
+            evidence_uuids.append(snp_uuids)
+
+        # Score the whole window with one model call
+        for snp, score in zip(snps, self.regulome_scores(evidences, evidence_uuids)):
+            # if score is None this snp had no score
+            snp['score'] = score
             yield snp
 
     def _scored_regions(self, assembly, chrom, start, end):
@@ -622,54 +1263,40 @@ class RegulomeAtlas(object):
         if not peaks or not details:
             return
 
-        last_uuids = set()
+        # Sweep over peak breakpoints: evidence is constant between them
+        signals = self.signal_window(assembly, chrom, start, end)
+        segments = []
+        for (segment_start, segment_end, uuids) in PeakIndex(peaks).segments(chrom, start, end):
+            evidence = None
+            if uuids:
+                datasets = self._uuids_datasets(details, uuids)
+                if datasets:
+                    evidence = self.regulome_evidence(
+                        assembly, datasets, chrom, segment_start, segment_end,
+                        signals=signals, uuids=uuids,
+                    )
+            segments.append((segment_start, segment_end, evidence, uuids))
+
         region_start = 0
         region_end = 0
         region_score = 0
-        num_score = 0
-        for base in range(start, end):
-            base_uuids = self._peak_uuids_in_overlap(peaks, chrom, base)
-            if base_uuids:
-                # For now we will combine nucleotides as long as peaks are the
-                # same. But keep in mind regulome evidence now includes signals
-                # from bigWigs, which are very likely different from nucleotide
-                # to nucleotide.
-                if base_uuids == last_uuids:
-                    region_end = base  # extend region
-                    continue
-                else:
-                    last_uuids = base_uuids
-                    base_details = self._filter_details(
-                        details, uuids=list(base_uuids))
-                    if base_details:
-                        (base_datasets, _base_files) = self.details_breakdown(
-                            base_details
-                        )
-                        if base_datasets:
-                            base_evidence = self.regulome_evidence(
-                                assembly, base_datasets, chrom, start, end
-                            )
-                            if base_evidence:
-                                score = self.regulome_score(
-                                    base_datasets, base_evidence
-                                ).get('ranking', '')
-                                if score:
-                                    num_score = self.numeric_score(score)
-                                    if num_score == region_score:
-                                        region_end = base
-                                        continue
-                                    if region_score > 0:  # end previous region?
-                                        yield (region_start, region_end, region_score)
-                                    # start new region
-                                    region_score = num_score
-                                    region_start = base
-                                    region_end = base
-                                    continue
-            # if we are here this base had no score
+        scores = self.regulome_scores(
+            [evidence for (_, _, evidence, _) in segments],
+            [uuids for (_, _, _, uuids) in segments],
+        )
+        for (segment_start, segment_end, _evidence, _uuids), score in zip(segments, scores):
+            num_score = 0
+            if score and score.get('ranking', ''):
+                num_score = self.numeric_score(score['ranking'])
+            if num_score == region_score:
+                region_end = segment_end - 1  # extend region
+                continue
             if region_score > 0:  # end previous region?
                 yield (region_start, region_end, region_score)
-                region_score = 0
-                last_uuids = base_uuids  # zero score so don't try these uuids again!
+            # start new region
+            region_score = num_score
+            region_start = segment_start
+            region_end = segment_end - 1
 
         if region_score > 0:  # end previous region?
             yield (region_start, region_end, region_score)
@@ -681,11 +1308,7 @@ class RegulomeAtlas(object):
         if rsid:
             max_snps += 1
 
-        range_start = int(pos - (window / 2))
-        range_end = int(pos + (window / 2))
-        if range_start < 0:
-            range_end += 0 - range_start
-            range_start = 0
+        (range_start, range_end) = self._nearby_range(pos, window)
 
         if scores:
             return self._scored_snps(assembly, chrom, range_start, range_end)
@@ -693,6 +1316,16 @@ class RegulomeAtlas(object):
             snps = self.find_snps(assembly, chrom, range_start, range_end)
             return self._snp_window(snps, max_snps, pos)
 
+    @staticmethod
+    def _nearby_range(pos, window=1600):
+        """private: returns the range searched for SNPs nearby to a position"""
+        range_start = int(pos - (window / 2))
+        range_end = int(pos + (window / 2))
+        if range_start < 0:
+            range_end += 0 - range_start
+            range_start = 0
+        return (range_start, range_end)
+
     def iter_scored_snps(self, assembly, chrom, start, end, base_level=False):
         """For a region, iteratively yields all SNPs with scores."""
         if end < start:
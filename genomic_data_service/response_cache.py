@@ -0,0 +1,334 @@
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from functools import lru_cache, wraps
+from flask import g, request, Response
+from genomic_data_service import app
+from genomic_data_service.regulome_atlas import (
+    RESIDENTS_EPOCH_CHECK_SECONDS,
+    read_residents_epoch,
+)
+from genomic_data_service.request_utils import extract_search_params
+from genomic_data_service.serialization import json_response, loads
+
+# request header to skip the cache, and response header telling what it did
+CACHE_HEADER = 'X-Response-Cache'
+CACHE_BYPASS = 'bypass'
+CACHED_HEADERS = ['Content-Type', 'Content-Encoding', 'Content-Disposition', 'Vary']
+COUNTERS = ['hits', 'misses', 'bypasses', 'stores', 'evictions']
+
+# (monotonic time read, epoch) of the elasticsearch clients, see index_epoch
+_index_epochs = {}
+_index_epochs_lock = threading.Lock()
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS responses (
+    key TEXT PRIMARY KEY,
+    epoch TEXT,
+    created REAL,
+    accessed REAL,
+    size INTEGER,
+    headers TEXT,
+    body BLOB
+);
+CREATE INDEX IF NOT EXISTS responses_accessed ON responses (accessed);
+CREATE TABLE IF NOT EXISTS counters (
+    name TEXT PRIMARY KEY,
+    value INTEGER
+);
+'''
+
+
+class ResponseCache(object):
+    """Size bounded cache of response bodies in a sqlite file, shared by all
+    the worker processes of a host.
+
+    Entries are only served for the epoch they were stored with and for at
+    most max_age seconds; the least recently used are evicted past
+    max_bytes. Every sqlite error is logged and treated as a miss, so the
+    cache never fails a request.
+    """
+
+    def __init__(self, path, max_bytes, max_age, max_entry_bytes):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.max_entry_bytes = max_entry_bytes
+        self._local = threading.local()
+
+    def _connection(self):
+        """private: returns the sqlite connection of this thread and process"""
+        local = self._local
+        if getattr(local, 'pid', None) != os.getpid():
+            connection = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('PRAGMA synchronous=NORMAL')
+            connection.executescript(SCHEMA)
+            local.connection = connection
+            local.pid = os.getpid()
+        return local.connection
+
+    def _count(self, connection, name, value=1):
+        connection.execute(
+            'INSERT INTO counters (name, value) VALUES (?, ?) '
+            'ON CONFLICT(name) DO UPDATE SET value = value + excluded.value',
+            (name, value)
+        )
+
+    def count(self, name):
+        try:
+            self._count(self._connection(), name)
+        except sqlite3.Error:
+            logging.exception('Response cache failed to count %s', name)
+
+    def get(self, key, epoch):
+        """Returns (headers, body) stored for key and epoch, None on a miss."""
+        try:
+            connection = self._connection()
+            now = time.time()
+            row = connection.execute(
+                'SELECT epoch, created, headers, body FROM responses WHERE key = ?',
+                (key,)
+            ).fetchone()
+            if row is None or row[0] != epoch or now - row[1] > self.max_age:
+                if row is not None:
+                    connection.execute('DELETE FROM responses WHERE key = ?', (key,))
+                self._count(connection, 'misses')
+                return None
+            connection.execute(
+                'UPDATE responses SET accessed = ? WHERE key = ?', (now, key))
+            self._count(connection, 'hits')
+            return json.loads(row[2]), row[3]
+        except sqlite3.Error:
+            logging.exception('Response cache lookup failed')
+            return None
+
+    def put(self, key, epoch, headers, body):
+        if len(body) > self.max_entry_bytes:
+            return
+        try:
+            connection = self._connection()
+            now = time.time()
+            with connection:
+                connection.execute('BEGIN IMMEDIATE')
+                connection.execute(
+                    'INSERT OR REPLACE INTO responses '
+                    '(key, epoch, created, accessed, size, headers, body) '
+                    'VALUES (?, ?, ?, ?, ?, ?, ?)',
+                    (key, epoch, now, now, len(body), json.dumps(headers), body)
+                )
+                self._count(connection, 'stores')
+                self._evict(connection)
+        except sqlite3.Error:
+            logging.exception('Response cache store failed')
+
+    def _evict(self, connection):
+        """private: deletes the least recently used entries past max_bytes"""
+        total = connection.execute(
+            'SELECT COALESCE(SUM(size), 0) FROM responses').fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        evicted = 0
+        for key, size in connection.execute(
+            'SELECT key, size FROM responses ORDER BY accessed'
+        ).fetchall():
+            if total <= self.max_bytes:
+                break
+            connection.execute('DELETE FROM responses WHERE key = ?', (key,))
+            total -= size
+            evicted += 1
+        self._count(connection, 'evictions', evicted)
+
+    def stats(self):
+        try:
+            connection = self._connection()
+            entries, size = connection.execute(
+                'SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses').fetchone()
+            counters = dict(connection.execute('SELECT name, value FROM counters'))
+        except sqlite3.Error as e:
+            return {'exception': str(e)}
+        stats = {name: counters.get(name, 0) for name in COUNTERS}
+        lookups = stats['hits'] + stats['misses']
+        stats.update({
+            'entries': entries,
+            'bytes': size,
+            'max_bytes': self.max_bytes,
+            'hit_rate': stats['hits'] / lookups if lookups else 0.0,
+        })
+        return stats
+
+
+@lru_cache(maxsize=None)
+def _response_cache(path, max_bytes, max_age, max_entry_bytes):
+    return ResponseCache(path, max_bytes, max_age, max_entry_bytes)
+
+
+def response_cache():
+    """Returns the configured ResponseCache, None if RESPONSE_CACHE_PATH is not set."""
+    path = app.config.get('RESPONSE_CACHE_PATH')
+    if not path:
+        return None
+    return _response_cache(
+        path,
+        app.config.get('RESPONSE_CACHE_MAX_BYTES', 512 * 1024 * 1024),
+        app.config.get('RESPONSE_CACHE_MAX_AGE', 86400),
+        app.config.get('RESPONSE_CACHE_MAX_ENTRY_BYTES', 16 * 1024 * 1024),
+    )
+
+
+def request_cache_key():
+    """Hash of the request path and its normalized search parameters."""
+    assembly, from_, size, format_, maf, region_queries = extract_search_params(
+        request.args
+    )
+    key = [
+        request.path.rstrip('/'),
+        assembly,
+        [region_query.strip() for region_query in region_queries],
+        maf,
+        format_,
+        from_,
+        str(size),
+        request.accept_encodings['gzip'] > 0,
+    ]
+    return hashlib.sha256(json.dumps(key).encode('utf-8')).hexdigest()
+
+
+def request_args_key():
+    """Hash of the request path and all its arguments, in sorted order."""
+    key = [request.path.rstrip('/'), sorted(request.args.items(multi=True))]
+    return hashlib.sha256(json.dumps(key).encode('utf-8')).hexdigest()
+
+
+def index_epoch(es):
+    """The residents epoch of es, read from its index mapping at most every
+    RESIDENTS_EPOCH_CHECK_SECONDS by each process and once per request."""
+    epochs = g.setdefault('index_epochs', {})
+    if id(es) not in epochs:
+        now = time.monotonic()
+        with _index_epochs_lock:
+            read = _index_epochs.get(id(es))
+        if read is None or now - read[0] >= RESIDENTS_EPOCH_CHECK_SECONDS:
+            read = (now, read_residents_epoch(es))
+            with _index_epochs_lock:
+                _index_epochs[id(es)] = read
+        epochs[id(es)] = read[1]
+    return epochs[id(es)]
+
+
+def conditional_view(es, key=request_cache_key):
+    """Decorator adding a strong ETag of key() and the residents epoch of es
+    to GET responses of a view, and answering If-None-Match with 304 before
+    the view runs. Without an epoch written by the indexer the index state
+    is unknown, so no ETag is sent."""
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            if request.method != 'GET':
+                return view(*args, **kwargs)
+            epoch = index_epoch(es)
+            if epoch is None:
+                return view(*args, **kwargs)
+
+            etag = hashlib.sha256(
+                '{}\t{}'.format(key(), epoch).encode('utf-8')).hexdigest()[:32]
+            cache_control = 'public, max-age={}'.format(
+                app.config.get('HTTP_CACHE_MAX_AGE', 300))
+            if request.if_none_match.contains_weak(etag):
+                response = Response(status=304)
+            else:
+                response = app.make_response(view(*args, **kwargs))
+                if response.status_code != 200:
+                    return response
+            response.set_etag(etag)
+            response.headers['Cache-Control'] = cache_control
+            return response
+        return wrapper
+    return decorator
+
+
+def cached_response(headers, body):
+    if headers.get('Content-Type') == 'application/json':
+        # the cached response may be for a differently written query
+        block = loads(body)
+        if '@id' in block:
+            block['@id'] = request.full_path
+        response = json_response(block)
+    else:
+        response = Response(body)
+        response.headers.update(headers)
+    return response
+
+
+def store_response(cache, key, epoch, response):
+    """Store the response body in the cache, once all of it is streamed."""
+    headers = {
+        name: response.headers[name]
+        for name in CACHED_HEADERS if name in response.headers
+    }
+    if not response.is_streamed:
+        cache.put(key, epoch, headers, response.get_data())
+        return response
+
+    chunks = response.response
+
+    def tee():
+        body = []
+        size = 0
+        for chunk in chunks:
+            if isinstance(chunk, str):
+                chunk = chunk.encode('utf-8')
+            if body is not None:
+                body.append(chunk)
+                size += len(chunk)
+                if size > cache.max_entry_bytes:
+                    body = None
+            yield chunk
+        if body is not None:
+            cache.put(key, epoch, headers, b''.join(body))
+
+    response.response = tee()
+    return response
+
+
+def cached_view(es):
+    """Decorator serving GET responses of a view from the response cache,
+    keyed on the normalized search parameters and the residents epoch of
+    es. Without an epoch written by the indexer nothing is cached, like in
+    conditional_view. Send the X-Response-Cache: bypass header to skip the
+    cache."""
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            cache = response_cache()
+            if cache is None or request.method != 'GET':
+                return view(*args, **kwargs)
+            if request.headers.get(CACHE_HEADER, '').lower() == CACHE_BYPASS:
+                cache.count('bypasses')
+                response = app.make_response(view(*args, **kwargs))
+                response.headers[CACHE_HEADER] = 'BYPASS'
+                return response
+
+            epoch = index_epoch(es)
+            if epoch is None:
+                # the index state is unknown, entries could outlive a reindex
+                return view(*args, **kwargs)
+            key = request_cache_key()
+            epoch = str(epoch)
+            cached = cache.get(key, epoch)
+            if cached is not None:
+                response = cached_response(*cached)
+                response.headers[CACHE_HEADER] = 'HIT'
+                return response
+
+            response = app.make_response(view(*args, **kwargs))
+            if response.status_code == 200:
+                response = store_response(cache, key, epoch, response)
+            response.headers[CACHE_HEADER] = 'MISS'
+            return response
+        return wrapper
+    return decorator
@@ -1,3 +1,4 @@
+from genomic_data_service.instrumentation import timed
 from genomic_data_service.rnaseq.remote.portal import get_json
 from genomic_data_service.rnaseq.rnaget.constants import BASE_SEARCH_URL
 from genomic_data_service.rnaseq.rnaget.constants import DATASET_FILTERS
@@ -7,6 +8,7 @@ from genomic_data_service.searches.requests import make_search_request
 from snosearch.parsers import QueryString
 
 
+@timed('portal_studies')
 def get_studies(filters=None):
     filters = filters or []
     qs = QueryString(
@@ -21,6 +21,7 @@ from snosearch.parsers import ParamsParser
 from snosearch.responses import FieldedGeneratorResponse
 from snosearch.responses import FieldedResponse
 
+from genomic_data_service.instrumentation import timed
 from genomic_data_service.rnaseq.matrix import make_rna_expression_search_request
 from genomic_data_service.rnaseq.matrix import ExpressionMatrix
 from genomic_data_service.rnaseq.matrix import TPMExpressionMatrix
@@ -29,6 +30,7 @@ from genomic_data_service.searches.constants import DEFAULT_RNA_EXPRESSION_SORT
 from genomic_data_service.searches.constants import RESERVED_KEYS
 
 
+@timed('es_rnaget')
 def rnaget_search_quick(search_request):
     rna_client = search_request.registry['RNA_CLIENT']
     fr = FieldedResponse(
@@ -51,6 +53,7 @@ def rnaget_search_quick(search_request):
     return fr.render()
 
 
+@timed('es_rnaget')
 def rnaget_search(search_request):
     rna_client = search_request.registry['RNA_CLIENT']
     fr = FieldedResponse(
@@ -94,6 +97,7 @@ def rnaget_search(search_request):
     return fr.render()
 
 
+@timed('es_rnaget')
 def rnaget_report(search_request):
     rna_client = search_request.registry['RNA_CLIENT']
     fr = FieldedResponse(
@@ -1,7 +1,12 @@
 import re
-import requests
 import time
 import logging
+from genomic_data_service.ensembl import ensembl_json
+from genomic_data_service.gene_index import gene_index
+from genomic_data_service.instrumentation import timed
+from genomic_data_service.liftover import liftover
+from genomic_data_service.rsid_index import rsid_index
+from genomic_data_service.serialization import Fragmented, dump_items
 from genomic_data_service.constants import (
     GENOME_TO_ALIAS,
     GENOME_TO_SPECIES,
@@ -11,6 +16,9 @@ from genomic_data_service.constants import (
 
 log = logging.getLogger(__name__)
 
+# region queries whose SNPs are fetched together, see resolve_coordinates_and_variants
+RESOLVE_CHUNK_SIZE = 1000
+
 CHR_GRCH38 = [
     'nc_000001.11',
     'nc_000002.12',
@@ -71,7 +79,8 @@ def ensembl_assembly_mapper(location, species, input_assembly, output_assembly):
            + input_assembly + '/' + location + '/' + output_assembly
            + '/?content-type=application/json')
     try:
-        response = requests.get(url).json()
+        response = ensembl_json(
+            url, 'map', location, '{}>{}'.format(input_assembly, output_assembly))
         mappings = response['mappings']
     except Exception:
         return('', '', '')
@@ -87,14 +96,28 @@ def ensembl_assembly_mapper(location, species, input_assembly, output_assembly):
     return (chromosome, start, end)
 
 
+def assembly_mapper(location, species, input_assembly, output_assembly):
+    # maps with the chain file of the assemblies, if one is configured
+    chain = liftover(input_assembly, output_assembly)
+    if chain is None:
+        return ensembl_assembly_mapper(location, species, input_assembly, output_assembly)
+    return chain.map_location(location)
+
+
 def get_ensemblid_coordinates(id, assembly):
+    genes = gene_index(assembly)
+    if genes is not None:
+        coordinates = genes.lookup_id(id)
+        if coordinates is not None:
+            return coordinates
+
     species = GENOME_TO_SPECIES.get(assembly, 'homo_sapiens')
     url = '{ensembl}lookup/id/{id}?content-type=application/json'.format(
         ensembl=ENSEMBL_URL,
         id=id
     )
     try:
-        response = requests.get(url).json()
+        response = ensembl_json(url, 'lookup', id, assembly)
     except:
         return('', '', '')
     else:
@@ -110,16 +133,22 @@ def get_ensemblid_coordinates(id, assembly):
             chromosome, start, end = re.split(':|-', location)
             return('chr' + chromosome, start, end)
         elif assembly == 'GRCh37':
-            return ensembl_assembly_mapper(location, species, 'GRCh38', assembly)
+            return assembly_mapper(location, species, 'GRCh38', assembly)
         elif assembly == 'GRCm38':
-            return ensembl_assembly_mapper(location, species, 'GRCm39', assembly)
+            return assembly_mapper(location, species, 'GRCm39', assembly)
         elif assembly == 'GRCm37':
-            return ensembl_assembly_mapper(location, species, 'GRCm39', 'NCBIM37')
+            return assembly_mapper(location, species, 'GRCm39', 'NCBIM37')
         else:
             return ('', '', '')
 
 
 def get_rsid_coordinates_from_atlas(atlas, assembly, rsid):
+    index = rsid_index(GENOME_TO_ALIAS.get(assembly))
+    if index is not None:
+        coordinates = index.lookup(rsid)
+        if coordinates is not None:
+            return coordinates
+
     snp = atlas.find_snp(GENOME_TO_ALIAS.get(assembly), rsid)
     if snp:
         chrom = snp.get('chrom', None)
@@ -142,7 +171,7 @@ def get_rsid_coordinates_from_ensembl(assembly, rsid):
     url = ensembl_url + path
 
     try:
-        response = requests.get(url).json()
+        response = ensembl_json(url, 'variation', rsid, assembly)
         mappings = response['mappings']
     except Exception:
         log.error('Failed connecitng to Ensembl: %s' % url)
@@ -155,7 +184,7 @@ def get_rsid_coordinates_from_ensembl(assembly, rsid):
                 # must convert to 0-base
                 return('chr' + chromosome, int(start) - 1, int(end))
             elif assembly == 'GRCh37':
-                return ensembl_assembly_mapper(mapping['location'], species, 'GRCh38', assembly)
+                return assembly_mapper(mapping['location'], species, 'GRCh38', assembly)
     return ('', '', '',)
 
 
@@ -174,6 +203,12 @@ def get_rsid_coordinates(rsid, assembly, atlas=None, webfetch=True):
     return (chrom, start, end)
 
 
+def get_gene_symbol_coordinates(symbol, assembly):
+    genes = gene_index(assembly)
+    coordinates = genes.lookup_symbol(symbol) if genes is not None else None
+    return coordinates or (None, None, None)
+
+
 def get_chrom_from_chrom_ref(chrom_ref):
     chr_num = int(chrom_ref.split('.')[0].split('_')[-1])
     if chr_num == 23:
@@ -234,6 +269,9 @@ def get_coordinates(query_term, assembly='GRCh37', atlas=None):
                         if query_match:
                             chrom, start, end = get_hgvs_coordinates(
                                 tokens[0], tokens[1])
+                else:
+                    chrom, start, end = get_gene_symbol_coordinates(
+                        query_term, assembly)
     if type(start) != int and type(end) != int:
         try:
             start, end = int(start), int(end)
@@ -246,20 +284,81 @@ def get_coordinates(query_term, assembly='GRCh37', atlas=None):
     return chrom, min(start, end), max(start, end)
 
 
-def resolve_coordinates_and_variants(region_queries, assembly, atlas, maf):
+def resolve_rsids(rsids, assembly, atlas):
+    """Returns the coordinates get_rsid_coordinates_from_atlas finds for
+    rsids, keyed by rsid, looking up all the rsids missing from the local
+    rsid index with chunked mgets."""
+    alias = GENOME_TO_ALIAS.get(assembly)
+    index = rsid_index(alias)
+    coordinates = {}
+    missing = []
+    for rsid in dict.fromkeys(rsids):
+        found = index.lookup(rsid) if index is not None else None
+        if found is None:
+            missing.append(rsid)
+        else:
+            coordinates[rsid] = found
+
+    snps = atlas.find_snps_by_rsid(alias, missing) if missing else {}
+    for rsid in missing:
+        snp = snps.get(rsid)
+        if snp:
+            chrom = snp.get('chrom', None)
+            snp_coordinates = snp.get('coordinates', {})
+            if chrom and snp_coordinates and 'gte' in snp_coordinates and 'lt' in snp_coordinates:
+                coordinates[rsid] = (chrom, snp_coordinates['gte'], snp_coordinates['lt'])
+                continue
+        log.warning('Could not find %s on %s. Elasticsearch response: %s' % (
+            rsid, assembly, snp))
+    return coordinates
+
+
+def batch_coordinates(region_queries, assembly, atlas):
+    """Returns a function giving the coordinates of a region query like
+    get_coordinates, with the rsids of all the queries resolved at once."""
+    rsids = set()
+    if atlas and assembly in ['GRCh38', 'hg19', 'GRCh37']:
+        rsids = {
+            query.lower() for query in region_queries
+            if re.match(r'^rs\d+$', query.lower())
+        }
+    resolved = resolve_rsids(rsids, assembly, atlas) if rsids else {}
+
+    def coordinates(region_query):
+        query_term = region_query.lower()
+        if query_term not in rsids:
+            return get_coordinates(region_query, assembly, atlas)
+        if query_term not in resolved:
+            raise ValueError('Could not find %s on %s' % (query_term, assembly))
+        chrom, start, end = resolved[query_term]
+        chrom = chrom.replace('x', 'X').replace('y', 'Y')
+        return chrom, min(start, end), max(start, end)
+
+    return coordinates
+
+
+@timed('resolve_coordinates')
+def resolve_coordinates_and_variants(region_queries, assembly, atlas, maf, prefetch_search=False):
     variants = {}
     notifications = {}
     query_coordinates = []
+    snp_assembly = GENOME_TO_ALIAS.get(assembly, 'hg19')
+
+    # resolve every query first, so their SNPs can be fetched in batches
+    coordinates = batch_coordinates(region_queries, assembly, atlas)
+    resolved = []
     for region_query in region_queries:
         try:
-            chrom, start, end = get_coordinates(region_query, assembly, atlas)
+            chrom, start, end = coordinates(region_query)
         except:
-            notifications[region_query] = 'Failed: invalid region input'
+            resolved.append((region_query, None, 'Failed: invalid region input'))
             continue
         if start == end:
-            notifications[region_query] = (
+            resolved.append((
+                region_query,
+                None,
                 'Failed: coordinates start and end can not be the same.'
-            )
+            ))
             continue
 
         query_coordinates.append(
@@ -267,46 +366,70 @@ def resolve_coordinates_and_variants(region_queries, assembly, atlas, maf):
         # if the region is only one base long, we ignore maf score.
         if (int(end) - int(start)) == 1:
             maf = None
-        snps = atlas.find_snps(
-            GENOME_TO_ALIAS.get(assembly, 'hg19'), chrom, start, end, maf=maf
-        )
+        resolved.append((region_query, (chrom, start, end, maf), None))
 
-        if not snps:
-            if (int(end) - int(start)) > 1:
-                notifications[region_query] = (
-                    'Failed: no known variants matching query conditions found.'
-                )
+    for i in range(0, len(resolved), RESOLVE_CHUNK_SIZE):
+        chunk = resolved[i:i + RESOLVE_CHUNK_SIZE]
+        regions = [region for _, region, _ in chunk if region is not None]
+        if not prefetch_search and len(regions) > 1:
+            atlas.prefetch_snps(snp_assembly, regions)
+
+        for region_query, region, notification in chunk:
+            if region is None:
+                notifications[region_query] = notification
                 continue
-            else:
-                # we keep the region in the variant as long as it is only one base long, even no snps returned.
-                variants[(chrom, int(start), int(end))] = {
-                    'rsids': set(),
-                }
-
-        for snp in snps:
-            coord = (
-                snp['chrom'],
-                snp['coordinates']['gte'],
-                snp['coordinates']['lt']
+            chrom, start, end, region_maf = region
+            if prefetch_search:
+                # one round trip for every query of the region made by search_peaks
+                atlas.prefetch_search(
+                    snp_assembly, chrom, start, end, maf=region_maf
+                )
+            snps = atlas.find_snps(
+                snp_assembly, chrom, start, end, maf=region_maf
             )
-            if coord in variants:
-                variants[coord]['rsids'].add(snp['rsid'])
-            else:
-                variants[coord] = {}
-                variants[coord]['rsids'] = {snp['rsid']}
-            if snp.get('variation_type') == 'SNV':
-                variants[coord]['ref'] = list(snp['ref_allele_freq'].keys())
-                variants[coord]['alt'] = list(snp['alt_allele_freq'].keys())
+
+            if not snps:
+                if (int(end) - int(start)) > 1:
+                    notifications[region_query] = (
+                        'Failed: no known variants matching query conditions found.'
+                    )
+                    continue
+                else:
+                    # we keep the region in the variant as long as it is only one base long, even no snps returned.
+                    variants[(chrom, int(start), int(end))] = {
+                        'rsids': set(),
+                    }
+
+            for snp in snps:
+                coord = (
+                    snp['chrom'],
+                    snp['coordinates']['gte'],
+                    snp['coordinates']['lt']
+                )
+                if coord in variants:
+                    variants[coord]['rsids'].add(snp['rsid'])
+                else:
+                    variants[coord] = {}
+                    variants[coord]['rsids'] = {snp['rsid']}
+                if snp.get('variation_type') == 'SNV':
+                    variants[coord]['ref'] = list(snp['ref_allele_freq'].keys())
+                    variants[coord]['alt'] = list(snp['alt_allele_freq'].keys())
     return (variants, query_coordinates, notifications)
 
 
 def region_get_hits(atlas, assembly, chrom, start, end, peaks_too=False):
     '''Returns a list of file uuids AND dataset paths for chromosome location'''
 
-    all_hits = {}
-
     (peaks, peak_details) = atlas.find_peaks_filtered(GENOME_TO_ALIAS[assembly], chrom, start, end,
                                                       peaks_too)
+    return peaks_get_hits(atlas, peaks, peak_details, peaks_too)
+
+
+def peaks_get_hits(atlas, peaks, peak_details, peaks_too=False):
+    '''Returns region_get_hits for peaks already filtered by atlas.filter_peaks'''
+
+    all_hits = {}
+
     if not peaks:
         return {'message': 'No hits found in this location'}
     if peak_details is None:
@@ -322,6 +445,8 @@ def region_get_hits(atlas, assembly, chrom, start, end, peaks_too=False):
 
     (all_hits['datasets'], all_hits['files']
      ) = atlas.details_breakdown(peak_details)
+    # peak uuids the datasets come from, memoizes evidence and scores
+    all_hits['uuids'] = frozenset(peak_details)
 
     all_hits['dataset_paths'] = list(all_hits['datasets'].keys())
     all_hits['file_count'] = len(all_hits['files'])
@@ -390,28 +515,18 @@ def search_peaks(query_coordinates, atlas, assembly, num_variants):
         notifications[coord] = 'Failed: (exception) {}'.format(e)
 
     for peak in all_hits.get('peaks', []):
-        documents = [resolve_relative_hrefs(
-            document, 'document') for document in peak['resident_detail']['dataset']['documents']]
-        peak_detail = {
+        dataset_detail, fragment = dataset_peak_detail(
+            atlas, peak['resident_detail']['dataset'])
+        peak_detail = Fragmented({
             'chrom': peak['_index'],
             'start': peak['_source']['coordinates']['gte'],
             'end': peak['_source']['coordinates']['lt'],
             'strand': peak['_source'].get('strand'),
             'value': peak['_source'].get('value'),
             'file': peak['resident_detail']['file']['@id'].split('/')[2],
-            'targets': peak['resident_detail']['dataset'].get('target', []),
-            'target_label': peak['resident_detail']['dataset'].get('target_label'),
-            'disease_term_name': peak['resident_detail']['dataset'].get('disease_term_name'),
-            'method': peak['resident_detail']['dataset']['collection_type'],
             'ancestry': peak['resident_detail']['file'].get('ancestry'),
-            'files_for_genome_browser': peak['resident_detail']['dataset'].get('files_for_genome_browser', []),
-            'documents': documents,
-            'dataset': resolve_relative_hrefs(peak['resident_detail']['dataset']['@id'], 'dataset'),
-            'dataset_rel': peak['resident_detail']['dataset']['@id'],
-            'biosample_ontology': resolve_relative_hrefs(peak['resident_detail']['dataset']['biosample_ontology'], 'biosample_ontology'),
-        }
-        if peak_detail['method'] == 'footprints':
-            peak_detail['footprint_assay_term_name'] = peak['resident_detail']['dataset']['footprint_assay_term_name']
+            **dataset_detail,
+        }, fragment)
         peak_details.append(peak_detail)
 
     graph = peak_details
@@ -431,6 +546,33 @@ def search_peaks(query_coordinates, atlas, assembly, num_variants):
     return (regulome_score, features, notifications, graph, timing, nearby_snps)
 
 
+def dataset_peak_detail(atlas, dataset):
+    """Returns the @graph fields of a peak taken from its dataset, with hrefs
+    resolved, and their JSON items from dump_items. Both are built once per resident dataset and
+    shared between requests, so they must not be modified."""
+    record = atlas.residents_cache.record(dataset)
+    detail = record.derived.get('peak_detail')
+    if detail is None:
+        fields = {
+            'targets': dataset.get('target', []),
+            'target_label': dataset.get('target_label'),
+            'disease_term_name': dataset.get('disease_term_name'),
+            'method': dataset['collection_type'],
+            'files_for_genome_browser': dataset.get('files_for_genome_browser', []),
+            'documents': [
+                resolve_relative_hrefs(document, 'document')
+                for document in dataset['documents']
+            ],
+            'dataset': resolve_relative_hrefs(dataset['@id'], 'dataset'),
+            'dataset_rel': dataset['@id'],
+            'biosample_ontology': resolve_relative_hrefs(dataset['biosample_ontology'], 'biosample_ontology'),
+        }
+        if fields['method'] == 'footprints':
+            fields['footprint_assay_term_name'] = dataset['footprint_assay_term_name']
+        detail = record.derived['peak_detail'] = (fields, dump_items(fields))
+    return detail
+
+
 def resolve_relative_hrefs(obj, obj_type=''):
     path = 'https://www.encodeproject.org'
 
@@ -440,7 +582,9 @@ def resolve_relative_hrefs(obj, obj_type=''):
     if obj_type == 'dataset':
         return path + obj
 
+    # resident details are cached and shared between requests, never modify them
     if obj_type == 'document':
+        obj = dict(obj)
         encode_id = obj['@id']
         if obj['aliases']:
             encode_id = f"/{obj['aliases'][0]}/"
@@ -454,5 +598,6 @@ def resolve_relative_hrefs(obj, obj_type=''):
         return obj
 
     if obj_type == 'biosample_ontology':
+        obj = dict(obj)
         obj['@id'] = path + obj['@id']
         return obj
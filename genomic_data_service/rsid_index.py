@@ -0,0 +1,132 @@
+import json
+import os
+from array import array
+from functools import lru_cache
+import numpy as np
+from genomic_data_service import app
+
+# arrays of an assembly's index, saved as <alias>.<name>.npy
+RSID_INDEX_ARRAYS = ['rsids', 'chroms', 'starts', 'ends']
+
+
+def rsid_number(rsid):
+    """Returns the number of an rsid like rs123, None if it is not one."""
+    if rsid[:2].lower() != 'rs' or not rsid[2:].isdigit():
+        return None
+    return int(rsid[2:])
+
+
+class RsidIndex(object):
+    """Sorted rsid numbers with the chromosome code, start and end of each
+    SNP, memory-mapped read only so the pages are shared by all the worker
+    processes of a host through the page cache."""
+
+    __slots__ = ('rsids', 'chroms', 'starts', 'ends', 'chrom_names')
+
+    def __init__(self, rsids, chroms, starts, ends, chrom_names):
+        self.rsids = rsids
+        self.chroms = chroms
+        self.starts = starts
+        self.ends = ends
+        self.chrom_names = chrom_names
+
+    def __len__(self):
+        return len(self.rsids)
+
+    @classmethod
+    def load(cls, directory, alias):
+        prefix = os.path.join(directory, alias.lower())
+        arrays = [
+            np.load('{}.{}.npy'.format(prefix, name), mmap_mode='r')
+            for name in RSID_INDEX_ARRAYS
+        ]
+        with open(prefix + '.chroms.json') as f:
+            chrom_names = json.load(f)
+        return cls(*arrays, chrom_names)
+
+    def lookup(self, rsid):
+        """Returns (chrom, start, end) of the rsid, None if not indexed."""
+        number = rsid_number(rsid)
+        if number is None or not len(self.rsids) or number > int(self.rsids[-1]):
+            return None
+        i = int(np.searchsorted(self.rsids, number))
+        if int(self.rsids[i]) != number:
+            return None
+        return (
+            self.chrom_names[int(self.chroms[i])],
+            int(self.starts[i]),
+            int(self.ends[i]),
+        )
+
+
+def build_rsid_index(rows, directory, alias):
+    """Write the index of an assembly from (chrom, start, end, rsid) rows of
+    a dbSNP BED file, as read by SnfParser. Like the SNP index, where an
+    rsid is the document id, the last row of a repeated rsid wins.
+    Returns the number of rsids indexed.
+
+    Rows are collected in typed arrays, about 17 bytes a row instead of
+    Python ints in lists, so whole dbSNP builds fit in memory."""
+    chrom_codes = {}
+    rsids, chroms, starts, ends = array('Q'), array('B'), array('i'), array('i')
+    for chrom, start, end, rsid in rows:
+        number = rsid_number(rsid)
+        if number is None:
+            continue
+        start, end = int(start), int(end)
+        if start == end:
+            end = end + 1
+        if chrom not in chrom_codes:
+            chrom_codes[chrom] = len(chrom_codes)
+        rsids.append(number)
+        chroms.append(chrom_codes[chrom])
+        starts.append(start)
+        ends.append(end)
+
+    rsids = np.frombuffer(rsids, dtype=np.uint64)
+    if len(rsids) and rsids.max() < 2 ** 32:
+        rsids = rsids.astype(np.uint32)
+    order = np.argsort(rsids, kind='stable')
+    rsids = rsids[order]
+    # keep the last of each run of equal rsids
+    last = np.ones(len(rsids), dtype=bool)
+    last[:-1] = rsids[1:] != rsids[:-1]
+    order = order[last]
+    arrays = {
+        'rsids': rsids[last],
+        'chroms': np.frombuffer(chroms, dtype=np.uint8)[order],
+        'starts': np.frombuffer(starts, dtype=np.int32)[order],
+        'ends': np.frombuffer(ends, dtype=np.int32)[order],
+    }
+
+    # replace the files of a previous build only once all are written
+    os.makedirs(directory, exist_ok=True)
+    prefix = os.path.join(directory, alias.lower())
+    written = []
+    for name in RSID_INDEX_ARRAYS:
+        path = '{}.{}.npy'.format(prefix, name)
+        with open(path + '.tmp', 'wb') as f:
+            np.save(f, arrays[name])
+        written.append(path)
+    with open(prefix + '.chroms.json.tmp', 'w') as f:
+        json.dump(sorted(chrom_codes, key=chrom_codes.get), f)
+    written.append(prefix + '.chroms.json')
+    for path in written:
+        os.replace(path + '.tmp', path)
+    return len(arrays['rsids'])
+
+
+@lru_cache(maxsize=None)
+def _rsid_index(directory, alias):
+    try:
+        return RsidIndex.load(directory, alias)
+    except (OSError, ValueError):
+        return None
+
+
+def rsid_index(alias):
+    """Returns the RsidIndex of an assembly alias, None if it was not built."""
+    directory = app.config.get('RSID_INDEX_DIR')
+    if not directory or not alias:
+        return None
+    return _rsid_index(directory, alias)
@@ -1,13 +1,15 @@
 import time
-from flask import jsonify, request
+from flask import request
 from werkzeug.exceptions import BadRequest
-from genomic_data_service import regulome_es, app
+from genomic_data_service import regulome_es, region_search_es, app
 from genomic_data_service.region_service import RegionService
 from genomic_data_service.regulome_atlas import RegulomeAtlas
 from genomic_data_service.rsid_coordinates_resolver import resolve_coordinates_and_variants, search_peaks
+from genomic_data_service.serialization import json_response
+from genomic_data_service.response_cache import cached_view, conditional_view, request_args_key
 from genomic_data_service.request_utils import validate_search_request, extract_search_params
 from genomic_data_service.constants import REGULOME_VALID_ASSEMBLY, TWO_BIT_HG19_FILE_PATH, TWO_BIT_HG38_FILE_PATH
-import py2bit
+from genomic_data_service.sequence_service import sequence_service
 
 
 def build_response(block):
@@ -22,6 +24,8 @@ def build_response(block):
 
 
 @app.route('/search/', methods=['GET'])
+@conditional_view(regulome_es)
+@cached_view(regulome_es)
 def search():
     """
     Peak analysis for a single region. Used by RegulomeDB.
@@ -63,25 +67,25 @@ def search():
             )
         }
     if result['notifications']:
-        return jsonify(build_response(result))
+        return json_response(build_response(result))
 
     atlas = RegulomeAtlas(regulome_es)
 
     variants, query_coordinates, notifications = resolve_coordinates_and_variants(
-        region_queries, assembly, atlas, maf
+        region_queries, assembly, atlas, maf, prefetch_search=True
     )
     if query_coordinates and (not is_snp(query_coordinates[0])):
         result['notifications'] = {
             'Failed': 'Invalid query coordinates {}.'.format(query_coordinates[0])
         }
-        return jsonify(build_response(result))
+        return json_response(build_response(result))
     if notifications:
         key = list(notifications.keys())[0]
         value = list(notifications.values())[0]
         result['notifications'] = {
             'Failed': '{}. {}'.format(key, value)
         }
-        return jsonify(build_response(result))
+        return json_response(build_response(result))
 
     total = len(variants)
     from_ = max(from_, 0)
@@ -96,7 +100,7 @@ def search():
         to_ = min(from_ + max(size, 0), total)
 
     result = {
-        'timing': [{'parse_region_query': (time.time() - begin)}],
+        'timing': [{'parse_region_query': (time.time() - begin)}] + atlas.timing,
         'assembly': assembly,
         'query_coordinates': query_coordinates,
         'format': format_,
@@ -132,16 +136,17 @@ def search():
     result['nearby_snps'] = nearby_snps
     result['sequence'] = sequence
 
-    return jsonify(build_response(result))
+    return json_response(build_response(result))
 
 
 # General region search endpoint, accepts any region length
 @app.route('/region-search/', methods=['GET'])
+@conditional_view(region_search_es, key=request_args_key)
 def region_search():
     """
     Returns all regions matching the queried interval.
     Ex params:
-       query=rs75982468 or chr10:5894499-5894500 or ENSG00000088320.3 (rsids or coordinate ranges or ensembl id)
+       query=rs75982468 or chr10:5894499-5894500 or ENSG00000088320.3 or BRAF (rsids or coordinate ranges or ensembl id or gene symbol)
        start=754000
        end=754012
        chr=1
@@ -159,7 +164,7 @@ def region_search():
     region_service = RegionService(request.args, atlas)
     region_service.intercepting_regions()
 
-    return jsonify({
+    return json_response({
         'chr': region_service.chrm,
         'start': region_service.start,
         'end': region_service.end,
@@ -172,13 +177,13 @@ def region_search():
 
 def get_sequence(assembly, coordinate, window=50):
     if assembly == 'GRCh38':
-        seq_reader = py2bit.open(TWO_BIT_HG38_FILE_PATH)
+        sequences = sequence_service(TWO_BIT_HG38_FILE_PATH)
     else:
-        seq_reader = py2bit.open(TWO_BIT_HG19_FILE_PATH)
+        sequences = sequence_service(TWO_BIT_HG19_FILE_PATH)
     coordinate_list = coordinate.split(':')
     chrom = coordinate_list[0]
     mid = int(coordinate_list[-1].split('-')[0])
-    chrom_len = seq_reader.chroms(chrom)
+    chrom_len = sequences.chrom_length(chrom)
     start = mid - window//2
     if start >= 0:
         end = start + window
@@ -193,9 +198,8 @@ def get_sequence(assembly, coordinate, window=50):
         'chrom': chrom,
         'start': start,
         'end': end,
-        'sequence': seq_reader.sequence(chrom, start, end)
+        'sequence': sequences.sequence(chrom, start, end)
     }
-    seq_reader.close()
     return sequence
 
 
@@ -0,0 +1,81 @@
+import os
+import threading
+from functools import lru_cache
+import py2bit
+from genomic_data_service.instrumentation import timed
+
+# intervals closer than this on a chromosome are read in one block
+SEQUENCE_BLOCK_GAP = 4096
+SEQUENCE_BLOCK_MAX = 1 << 20
+
+
+class SequenceService(object):
+    """A 2bit file kept open for the life of the process.
+
+    The handle is reopened after a fork, so readers created before gunicorn
+    or celery fork their workers are not shared, and reads on a handle are
+    serialized since py2bit seeks a single file pointer.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._reader = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def _handle(self):
+        """private: returns the open reader of this process, opening it on first use"""
+        if self._reader is None or self._pid != os.getpid():
+            self._reader = py2bit.open(self.path)
+            self._pid = os.getpid()
+        return self._reader
+
+    def chrom_length(self, chrom):
+        with self._lock:
+            return self._handle().chroms(chrom)
+
+    @timed('sequence')
+    def sequence(self, chrom, start, end):
+        with self._lock:
+            return self._handle().sequence(chrom, start, end)
+
+    @timed('sequence')
+    def sequences(self, intervals):
+        """Returns the sequences of (chrom, start, end) intervals in the given
+        order. Intervals are sorted and nearby ones read as one block, which is
+        then sliced, so each stretch of a chromosome is read once."""
+        order = sorted(range(len(intervals)), key=lambda i: intervals[i])
+        sequences = [None] * len(intervals)
+        with self._lock:
+            reader = self._handle()
+            block = []
+            block_end = None
+            for i in order:
+                chrom, start, end = intervals[i]
+                if block and (
+                    chrom != intervals[block[0]][0]
+                    or start - block_end > SEQUENCE_BLOCK_GAP
+                    or end - intervals[block[0]][1] > SEQUENCE_BLOCK_MAX
+                ):
+                    self._read_block(reader, intervals, block, block_end, sequences)
+                    block = []
+                block_end = max(block_end, end) if block else end
+                block.append(i)
+            if block:
+                self._read_block(reader, intervals, block, block_end, sequences)
+        return sequences
+
+    @staticmethod
+    def _read_block(reader, intervals, block, block_end, sequences):
+        """private: reads the span of a block of sorted intervals and slices it"""
+        chrom, block_start = intervals[block[0]][0], intervals[block[0]][1]
+        data = reader.sequence(chrom, block_start, block_end)
+        for i in block:
+            _, start, end = intervals[i]
+            sequences[i] = data[start - block_start:end - block_start]
+
+
+@lru_cache(maxsize=None)
+def sequence_service(path):
+    """Returns the shared SequenceService of a 2bit file."""
+    return SequenceService(path)
@@ -1,12 +1,21 @@
+import logging
 import time
-from flask import jsonify, request, redirect, url_for, make_response
-from werkzeug.exceptions import BadRequest
+import zlib
+from flask import jsonify, request, redirect, url_for, Response, stream_with_context
+from werkzeug.exceptions import BadRequest, NotFound, Conflict, RequestEntityTooLarge
 from genomic_data_service import regulome_es, app
 from genomic_data_service.regulome_atlas import RegulomeAtlas
-from genomic_data_service.rsid_coordinates_resolver import resolve_coordinates_and_variants, region_get_hits, evidence_to_features
+from genomic_data_service.rsid_coordinates_resolver import resolve_coordinates_and_variants, evidence_to_features
+from genomic_data_service.summary_scoring import score_variants, table_columns, table_row
+from genomic_data_service.summary_jobs import SUMMARY_JOB_FORMATS, create_job, job_status, iter_job_result
+from genomic_data_service.serialization import json_response
+from genomic_data_service.response_cache import cached_view, conditional_view
 from genomic_data_service.request_utils import validate_search_request, extract_search_params
 from genomic_data_service.constants import REGULOME_VALID_ASSEMBLY
 
+# variants fetched and scored together while streaming a TSV/BED download
+SUMMARY_STREAM_BATCH_SIZE = 500
+
 
 def build_response(block):
     return {
@@ -19,12 +28,27 @@ def build_response(block):
     }
 
 
-def build_download(table, format_):
-    response = make_response('\n'.join(table))
-    response.headers['Content-Type'] = 'text/tsv'
+def gzip_chunks(chunks):
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    for chunk in chunks:
+        data = compressor.compress(chunk.encode('utf-8'))
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def build_download(chunks, format_, gzip=False, content_type='text/tsv'):
+    """Stream the table chunks as a file download, gzip encoded if asked."""
+    if gzip:
+        chunks = gzip_chunks(chunks)
+    response = Response(stream_with_context(chunks))
+    response.headers['Content-Type'] = content_type
     response.headers['Content-Disposition'] = 'attachment;filename="regulome_{}.{}"'.format(
         time.strftime('%Y%m%d-%Hh%Mm%Ss'), format_
     )
+    if gzip:
+        response.headers['Content-Encoding'] = 'gzip'
+    response.headers['Vary'] = 'Accept-Encoding'
     return response
 
 
@@ -37,7 +61,30 @@ def build_redirect_to_search(variants, assembly):
     return redirect(url_for('search', genome=assembly, regions=regions), code=302)
 
 
+def iter_table(atlas, assembly, variants, format_, concurrency, deadline,
+               batch_size=SUMMARY_STREAM_BATCH_SIZE):
+    """Yield a TSV/BED table of the variants in chunks, fetching and scoring
+    batch_size variants at a time so memory does not grow with the table."""
+    columns = None
+    for batch_start in range(0, len(variants), batch_size):
+        batch = variants[batch_start:batch_start + batch_size]
+        lines = []
+        scored = score_variants(atlas, assembly, batch, concurrency, deadline)
+        for variant, (evidence, regulome_score) in zip(batch, scored):
+            features = evidence_to_features(evidence)
+            if columns is None:
+                columns = table_columns(regulome_score, features)
+                if format_ == 'tsv':
+                    lines.append('\t'.join(columns))
+            lines.append(table_row(variant, columns, regulome_score, features))
+        # rows are separated, not terminated, by new lines
+        yield ('\n' if batch_start else '') + '\n'.join(lines)
+    logging.info('Summary scoring memo: %s', atlas.scoring_memo.stats())
+
+
 @app.route('/summary/', methods=['GET', 'POST'])
+@conditional_view(regulome_es)
+@cached_view(regulome_es)
 def summary():
     begin = time.time()
 
@@ -59,7 +106,7 @@ def summary():
                 'Failed': 'Invalid assembly {}'.format(assembly)
             }
         }
-        return jsonify(build_response(result))
+        return json_response(build_response(result))
 
     atlas = RegulomeAtlas(regulome_es)
 
@@ -103,54 +150,98 @@ def summary():
     if not result['variants']:
         if not result['notifications']:
             result['notifications'] = {'Failed': 'No variants found'}
-        return jsonify(build_response(result))
+        return json_response(build_response(result))
 
     if len(result['variants']) == 1 and not result['notifications']:
         return build_redirect_to_search(result['variants'], result['assembly'])
 
-    table_download = format_ in ['tsv', 'bed']
-    table = []
+    concurrency = app.config.get('SUMMARY_FETCH_CONCURRENCY', 8)
+    deadline = app.config.get('SUMMARY_FETCH_DEADLINE', 60)
 
-    for variant in result['variants']:
-        begin = time.time()
-
-        chrom = variant['chrom']
-        start = variant['start']
-        end = variant['end']
+    if format_ in ['tsv', 'bed']:
+        return build_download(
+            iter_table(atlas, assembly, result['variants'], format_, concurrency, deadline),
+            format_,
+            gzip=request.accept_encodings['gzip'] > 0,
+        )
 
-        all_hits = region_get_hits(atlas, assembly, chrom, start, end)
-        datasets = all_hits.get('datasets', [])
-        evidence = atlas.regulome_evidence(
-            assembly, datasets, chrom, int(start), int(end))
-        regulome_score = atlas.regulome_score(datasets, evidence)
-        features = evidence_to_features(evidence)
+    scored = score_variants(
+        atlas, assembly, result['variants'], concurrency, deadline, timing=result['timing'])
+    logging.info('Summary scoring memo: %s', atlas.scoring_memo.stats())
 
-        if table_download:
-            if not table:
-                columns = ['chrom', 'start', 'end', 'rsids']
-                columns.extend(sorted(regulome_score.keys()))
-                columns.extend(sorted(features.keys()))
-                if format_ == 'tsv':
-                    table.append('\t'.join(columns))
-            row = [chrom, start, end, ', '.join(variant['rsids'])]
-            row.extend([
-                str(features.get(col, '')) or str(regulome_score.get(col, ''))
-                for col in columns
-                if col in regulome_score or col in features
-            ])
-
-            string_row = [str(r) for r in row]
-            table.append('\t'.join(string_row))
-            continue
-
-        variant['features'] = features
+    for variant, (evidence, regulome_score) in zip(result['variants'], scored):
+        variant['features'] = evidence_to_features(evidence)
         variant['regulome_score'] = regulome_score
 
-        result['timing'].append(
-            {'{}:{}-{}'.format(chrom, start, end): (time.time() - begin)}
-        )
+    return json_response(build_response(result))
 
-    if table_download:
-        return build_download(table, format_)
 
-    return jsonify(build_response(result))
+def build_job_response(job):
+    return {
+        **job, **{
+            '@id': url_for('summary_job', job_id=job['job_id']),
+            '@type': ['summary_job'],
+            'download': url_for('summary_job_download', job_id=job['job_id']),
+        }
+    }
+
+
+@app.route('/summary/jobs/', methods=['POST'])
+def create_summary_job():
+    # checked before the form is parsed, which spools the upload
+    max_bytes = app.config.get('SUMMARY_JOB_MAX_UPLOAD_BYTES', 64 * 1024 * 1024)
+    if (request.content_length or 0) > max_bytes:
+        raise RequestEntityTooLarge(
+            'Summary job uploads are limited to {} bytes'.format(max_bytes))
+
+    params = request.values
+    assembly = params.get('genome')
+    format_ = params.get('format', 'tsv').lower()
+    maf = params.get('maf', None)
+
+    if assembly not in REGULOME_VALID_ASSEMBLY:
+        raise BadRequest('Invalid assembly {}'.format(assembly))
+    if format_ not in SUMMARY_JOB_FORMATS:
+        raise BadRequest('Invalid format {}, expected one of {}'.format(
+            format_, ', '.join(SUMMARY_JOB_FORMATS)))
+
+    if 'file' in request.files:
+        save_queries = request.files['file'].save
+    elif params.get('regions'):
+        def save_queries(path):
+            with open(path, 'w') as f:
+                f.write(params['regions'])
+    else:
+        raise BadRequest('Either regions or a file of regions is required.')
+
+    try:
+        job_id = create_job(assembly, format_, maf, save_queries)
+    except ValueError as e:
+        raise RequestEntityTooLarge(str(e))
+    response = jsonify(build_job_response(job_status(job_id)))
+    response.status_code = 202
+    response.headers['Location'] = url_for('summary_job', job_id=job_id)
+    return response
+
+
+@app.route('/summary/jobs/<job_id>/', methods=['GET'])
+def summary_job(job_id):
+    job = job_status(job_id)
+    if job is None:
+        raise NotFound('Summary job {} not found'.format(job_id))
+    return jsonify(build_job_response(job))
+
+
+@app.route('/summary/jobs/<job_id>/download', methods=['GET'])
+def summary_job_download(job_id):
+    job = job_status(job_id)
+    if job is None:
+        raise NotFound('Summary job {} not found'.format(job_id))
+    if job['status'] != 'done':
+        raise Conflict('Summary job {} is {}'.format(job_id, job['status']))
+    return build_download(
+        iter_job_result(job_id),
+        job['format'],
+        gzip=request.accept_encodings['gzip'] > 0,
+        content_type='application/x-ndjson' if job['format'] == 'ndjson' else 'text/tsv',
+    )
@@ -0,0 +1,286 @@
+import json
+import logging
+import os
+import re
+import shutil
+import time
+import uuid
+from functools import lru_cache
+from elasticsearch import Elasticsearch
+from genomic_data_service import app
+from genomic_data_service.region_indexer_task import celery_app
+from genomic_data_service.regulome_atlas import RegulomeAtlas
+from genomic_data_service.rsid_coordinates_resolver import resolve_coordinates_and_variants, evidence_to_features
+from genomic_data_service.summary_scoring import score_variants, table_columns, table_row
+
+SUMMARY_JOB_FORMATS = ['tsv', 'bed', 'ndjson']
+
+JOB_FILE = 'job.json'
+QUERIES_FILE = 'queries.txt'
+VARIANTS_FILE = 'variants-{:05d}.json'
+PART_FILE = 'part-{:05d}.{}'
+FAILED_FILE = 'failed-{:05d}.json'
+
+JOB_ID = re.compile(r'^[0-9a-f]{32}$')
+READ_BLOCK_SIZE = 65536
+
+
+def jobs_dir():
+    return app.config.get('SUMMARY_JOBS_DIR', '/tmp/regulome_summary_jobs')
+
+
+def job_path(job_id, *names):
+    if not JOB_ID.match(job_id):
+        raise ValueError('Invalid summary job id {}'.format(job_id))
+    return os.path.join(jobs_dir(), job_id, *names)
+
+
+def write_json(path, data):
+    """Write data as json to a temporary file renamed over path, so readers
+    never see a partial file."""
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump(data, f)
+    os.replace(tmp_path, path)
+
+
+def read_json(path):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+
+def read_job(job_id):
+    try:
+        return read_json(job_path(job_id, JOB_FILE))
+    except ValueError:
+        return None
+
+
+def update_job(job_id, **fields):
+    # only the web request creating a job and its resolve task write job.json
+    job = read_job(job_id)
+    job.update(fields)
+    write_json(job_path(job_id, JOB_FILE), job)
+    return job
+
+
+def remove_expired_jobs(max_age):
+    if not os.path.isdir(jobs_dir()):
+        return
+    expired = time.time() - max_age
+    for job_id in os.listdir(jobs_dir()):
+        path = os.path.join(jobs_dir(), job_id)
+        if JOB_ID.match(job_id) and os.path.getmtime(path) < expired:
+            shutil.rmtree(path, ignore_errors=True)
+
+
+def max_variants():
+    return app.config.get('SUMMARY_JOB_MAX_VARIANTS', 1000000)
+
+
+def create_job(assembly, format_, maf, save_queries):
+    """Create the job directory, save the region queries with
+    save_queries(path) and queue resolving them. Returns the job id.
+    Raises ValueError, leaving no job, for more than SUMMARY_JOB_MAX_VARIANTS
+    region queries."""
+    remove_expired_jobs(app.config.get('SUMMARY_JOB_MAX_AGE', 86400))
+
+    job_id = uuid.uuid4().hex
+    os.makedirs(job_path(job_id))
+    save_queries(job_path(job_id, QUERIES_FILE))
+    with open(job_path(job_id, QUERIES_FILE)) as f:
+        queries = len(parse_region_queries(f))
+    if queries > max_variants():
+        shutil.rmtree(job_path(job_id), ignore_errors=True)
+        raise ValueError('Received {} region queries, summary jobs are limited to {}'.format(
+            queries, max_variants()))
+    write_json(job_path(job_id, JOB_FILE), {
+        'job_id': job_id,
+        'assembly': assembly,
+        'format': format_,
+        'maf': maf,
+        'status': 'queued',
+        'created': time.time(),
+    })
+    resolve_summary_job.delay(job_id)
+    return job_id
+
+
+def parse_region_queries(lines):
+    """Region queries of a file, one or more per line separated by spaces,
+    skipping blank and comment lines."""
+    return [
+        region_query
+        for line in lines
+        if not re.match(r'^(#.*)|(\s*)$', line)
+        for region_query in line.strip().split(' ')
+        if region_query
+    ]
+
+
+@lru_cache(maxsize=None)
+def job_es():
+    # one client per worker process, so the atlas residents cache stays warm
+    return Elasticsearch(
+        port=app.config['REGULOME_ES_PORT'], hosts=app.config['REGULOME_ES_HOSTS']
+    )
+
+
+def resolve_variants(job_id):
+    """Resolve the job queries to variants, saved in chunks to be scored by
+    score_summary_chunk. Returns the number of chunks."""
+    job = read_job(job_id)
+    with open(job_path(job_id, QUERIES_FILE)) as f:
+        region_queries = parse_region_queries(f)
+
+    atlas = RegulomeAtlas(job_es())
+    variants, query_coordinates, notifications = resolve_coordinates_and_variants(
+        region_queries, job['assembly'], atlas, job['maf']
+    )
+    if len(variants) > max_variants():
+        raise ValueError('Found {} variants, summary jobs are limited to {}'.format(
+            len(variants), max_variants()))
+    rows = [
+        {
+            'chrom': chrom,
+            'start': start,
+            'end': end,
+            'rsids': sorted(variants[(chrom, start, end)]['rsids']),
+            'ref': variants[(chrom, start, end)].get('ref', []),
+            'alt': variants[(chrom, start, end)].get('alt', []),
+        }
+        for chrom, start, end in sorted(variants)
+    ]
+
+    chunk_size = app.config.get('SUMMARY_JOB_CHUNK_SIZE', 1000)
+    chunks = 0
+    for chunk_start in range(0, len(rows), chunk_size):
+        write_json(
+            job_path(job_id, VARIANTS_FILE.format(chunks)),
+            rows[chunk_start:chunk_start + chunk_size],
+        )
+        chunks += 1
+
+    if not rows and not notifications:
+        notifications = {'Failed': 'No variants found'}
+    update_job(
+        job_id,
+        status='scoring' if chunks else 'done',
+        total=len(rows),
+        chunks=chunks,
+        notifications=notifications,
+        scoring_started=time.time(),
+    )
+    return chunks
+
+
+def format_chunk(variants, scored, format_, header):
+    lines = []
+    columns = None
+    for variant, (evidence, regulome_score) in zip(variants, scored):
+        features = evidence_to_features(evidence)
+        if format_ == 'ndjson':
+            lines.append(json.dumps({
+                **variant, 'features': features, 'regulome_score': regulome_score
+            }))
+            continue
+        if columns is None:
+            columns = table_columns(regulome_score, features)
+            if header:
+                lines.append('\t'.join(columns))
+        lines.append(table_row(variant, columns, regulome_score, features))
+    return ''.join(line + '\n' for line in lines)
+
+
+def write_chunk(job_id, chunk):
+    """Score one chunk of the job variants and write it as a part file."""
+    job = read_job(job_id)
+    variants = read_json(job_path(job_id, VARIANTS_FILE.format(chunk)))
+
+    atlas = RegulomeAtlas(job_es())
+    scored = score_variants(
+        atlas, job['assembly'], variants,
+        app.config.get('SUMMARY_FETCH_CONCURRENCY', 8),
+        app.config.get('SUMMARY_JOB_FETCH_DEADLINE', 600),
+    )
+    logging.info('Summary job %s chunk %s scoring memo: %s',
+                 job_id, chunk, atlas.scoring_memo.stats())
+
+    path = job_path(job_id, PART_FILE.format(chunk, job['format']))
+    with open(path + '.tmp', 'w') as f:
+        f.write(format_chunk(
+            variants, scored, job['format'], header=(job['format'] == 'tsv' and chunk == 0)))
+    os.replace(path + '.tmp', path)
+
+
+@celery_app.task
+def resolve_summary_job(job_id):
+    update_job(job_id, status='resolving')
+    try:
+        chunks = resolve_variants(job_id)
+    except Exception as e:
+        update_job(job_id, status='failed', error=str(e))
+        raise
+    for chunk in range(chunks):
+        score_summary_chunk.delay(job_id, chunk)
+    return f'Summary job {job_id} split into {chunks} chunks'
+
+
+# a chunk lost with its worker (killed, out of memory) is delivered again,
+# job_status fails the job if it never reports back
+@celery_app.task(bind=True, max_retries=3, acks_late=True, reject_on_worker_lost=True)
+def score_summary_chunk(self, job_id, chunk):
+    try:
+        write_chunk(job_id, chunk)
+    except Exception as e:
+        if self.request.retries >= self.max_retries:
+            write_json(job_path(job_id, FAILED_FILE.format(chunk)), {'error': str(e)})
+            raise
+        raise self.retry(exc=e, countdown=2)
+    return f'Summary job {job_id} chunk {chunk} was scored'
+
+
+def job_status(job_id):
+    """Returns the job with its status and progress, or None if unknown."""
+    job = read_job(job_id)
+    if job is None:
+        return None
+
+    if job['status'] == 'scoring':
+        names = os.listdir(job_path(job_id))
+        failed = sorted(name for name in names if name.startswith('failed-'))
+        done = sum(
+            1 for name in names
+            if name.startswith('part-') and name.endswith('.' + job['format'])
+        )
+        job['chunks_done'] = done
+        deadline = app.config.get('SUMMARY_JOB_SCORING_DEADLINE', 3600)
+        if failed:
+            job['status'] = 'failed'
+            job['error'] = read_json(job_path(job_id, failed[0]))['error']
+        elif done == job['chunks']:
+            job['status'] = 'done'
+        elif time.time() - job.get('scoring_started', job['created']) > deadline:
+            job['status'] = 'failed'
+            job['error'] = '{} chunks were not scored within {} seconds'.format(
+                job['chunks'] - done, deadline)
+    elif job['status'] == 'done':
+        job['chunks_done'] = job['chunks']
+
+    if job.get('chunks'):
+        job['progress'] = job.get('chunks_done', 0) / job['chunks']
+    else:
+        job['progress'] = 1.0 if job['status'] == 'done' else 0.0
+    return job
+
+
+def iter_job_result(job_id):
+    """Yield the scored table of a done job, part file by part file."""
+    job = read_job(job_id)
+    for chunk in range(job['chunks']):
+        with open(job_path(job_id, PART_FILE.format(chunk, job['format']))) as f:
+            for block in iter(lambda: f.read(READ_BLOCK_SIZE), ''):
+                yield block
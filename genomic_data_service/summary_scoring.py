@@ -0,0 +1,156 @@
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+from werkzeug.exceptions import GatewayTimeout
+from genomic_data_service.instrumentation import in_context
+from genomic_data_service.peak_index import PeakIndex
+from genomic_data_service.regulome_atlas import SEARCH_MAX
+from genomic_data_service.rsid_coordinates_resolver import region_get_hits, peaks_get_hits
+from genomic_data_service.constants import GENOME_TO_ALIAS
+
+# variants this close share one peaks query, in windows up to this long
+PEAK_CLUSTER_GAP = 2000
+PEAK_CLUSTER_SPAN = 20000
+
+
+def cluster_variants(variants, max_gap=PEAK_CLUSTER_GAP, max_span=PEAK_CLUSTER_SPAN):
+    """Split variants sorted by location into runs on one chromosome, each
+    within max_gap of the previous variant and spanning at most max_span."""
+    clusters = []
+    for variant in variants:
+        if clusters:
+            cluster = clusters[-1]
+            if (
+                variant['chrom'] == cluster[0]['chrom']
+                and variant['start'] - cluster[-1]['end'] <= max_gap
+                and variant['end'] - cluster[0]['start'] <= max_span
+            ):
+                cluster.append(variant)
+                continue
+        clusters.append([variant])
+    return clusters
+
+
+def cluster_get_hits(atlas, assembly, variants):
+    """Returns region_get_hits of each variant in a cluster, finding peaks of
+    the whole cluster window at once and assigning them to variants in memory."""
+    if len(variants) == 1:
+        variant = variants[0]
+        return [region_get_hits(atlas, assembly, variant['chrom'], variant['start'], variant['end'])]
+
+    chrom = variants[0]['chrom']
+    peaks = atlas.find_peaks(
+        GENOME_TO_ALIAS[assembly],
+        chrom,
+        min(variant['start'] for variant in variants),
+        max(variant['end'] for variant in variants),
+    )
+    if len(peaks) >= SEARCH_MAX:
+        # the window may be truncated, find peaks of every variant on its own
+        return [
+            region_get_hits(atlas, assembly, chrom, variant['start'], variant['end'])
+            for variant in variants
+        ]
+
+    # peaks are indexed under the lower case chromosome index they came from
+    peak_index = PeakIndex(peaks)
+    return [
+        peaks_get_hits(atlas, *atlas.filter_peaks(peak_index.intersecting_peaks(
+            chrom.lower(), variant['start'], variant['end'])))
+        for variant in variants
+    ]
+
+
+def timed_cluster_get_hits(atlas, assembly, variants):
+    begin = time.time()
+    variants_hits = cluster_get_hits(atlas, assembly, variants)
+    fetch_time = (time.time() - begin) / len(variants)
+    return [(all_hits, fetch_time) for all_hits in variants_hits]
+
+
+def fetch_variants_hits(atlas, assembly, variants, concurrency, deadline):
+    """Fetch peaks and residents of all variants, one peaks query per cluster
+    of nearby variants with at most concurrency threads. Returns
+    (all_hits, seconds) in variants order."""
+    clusters = cluster_variants(variants)
+    if concurrency <= 1 or len(clusters) <= 1:
+        return [
+            variant_hits
+            for cluster in clusters
+            for variant_hits in timed_cluster_get_hits(atlas, assembly, cluster)
+        ]
+
+    executor = ThreadPoolExecutor(max_workers=min(concurrency, len(clusters)))
+    try:
+        futures = [
+            executor.submit(in_context(timed_cluster_get_hits), atlas, assembly, cluster)
+            for cluster in clusters
+        ]
+        _done, not_done = wait(futures, timeout=deadline)
+        if not_done:
+            for future in not_done:
+                future.cancel()
+            raise GatewayTimeout(
+                'Fetching peaks for {} of {} variant clusters took longer than {} seconds'.format(
+                    len(not_done), len(clusters), deadline)
+            )
+        return [
+            variant_hits
+            for future in futures
+            for variant_hits in future.result()
+        ]
+    finally:
+        # do not wait on requests still running past the deadline
+        executor.shutdown(wait=False)
+
+
+def score_variants(atlas, assembly, variants, concurrency, deadline, timing=None):
+    """Returns (evidence, regulome_score) of every variant, scored with one
+    model call. Per variant and scoring times are added to timing if given."""
+    variants_hits = fetch_variants_hits(
+        atlas, assembly, variants, concurrency, deadline)
+
+    evidences = []
+    evidence_uuids = []
+    for variant, (all_hits, fetch_time) in zip(variants, variants_hits):
+        begin = time.time() - fetch_time
+
+        chrom = variant['chrom']
+        start = variant['start']
+        end = variant['end']
+
+        datasets = all_hits.get('datasets', [])
+        evidence = atlas.regulome_evidence(
+            assembly, datasets, chrom, int(start), int(end),
+            uuids=all_hits.get('uuids'))
+        evidences.append(evidence)
+        evidence_uuids.append(all_hits.get('uuids'))
+
+        if timing is not None:
+            timing.append(
+                {'{}:{}-{}'.format(chrom, start, end): (time.time() - begin)}
+            )
+
+    begin = time.time()
+    regulome_scores = atlas.regulome_scores(evidences, evidence_uuids)
+    if timing is not None:
+        timing.append({'regulome_scoring': (time.time() - begin)})
+    return list(zip(evidences, regulome_scores))
+
+
+def table_columns(regulome_score, features):
+    return (
+        ['chrom', 'start', 'end', 'rsids']
+        + sorted(regulome_score.keys())
+        + sorted(features.keys())
+    )
+
+
+def table_row(variant, columns, regulome_score, features):
+    row = [variant['chrom'], variant['start'],
+           variant['end'], ', '.join(variant['rsids'])]
+    row.extend([
+        str(features.get(col, '')) or str(regulome_score.get(col, ''))
+        for col in columns
+        if col in regulome_score or col in features
+    ])
+    return '\t'.join([str(r) for r in row])
@@ -36,6 +36,9 @@ setup(
             'pytest-mock==2.0.0',
             'pytest-cov==3.0.0',
             'coveralls==3.3.1',
-        ]
+        ],
+        'fast-json': [
+            'orjson==3.8.3',
+        ],
     },
 )
@@ -0,0 +1,107 @@
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import pytest
+from genomic_data_service.ensembl import _ensembl_cache, ensembl_json
+from genomic_data_service.rsid_coordinates_resolver import (
+    get_ensemblid_coordinates,
+    get_rsid_coordinates_from_ensembl,
+)
+
+GENES = {
+    'ENSG00000157764': {
+        'assembly_name': 'GRCh38',
+        'seq_region_name': '7',
+        'start': 140719327,
+        'end': 140924929,
+    },
+}
+
+
+class FakeEnsembl(BaseHTTPRequestHandler):
+    requests = []
+    failing = False
+
+    def do_GET(self):
+        self.requests.append(self.path)
+        if self.failing:
+            self._reply(503, {'error': 'busy'})
+        elif self.path.startswith('/lookup/id/'):
+            id_ = self.path.split('/')[3].split('?')[0]
+            if id_ in GENES:
+                self._reply(200, GENES[id_])
+            else:
+                self._reply(400, {'error': "ID '{}' not found".format(id_)})
+        elif self.path.startswith('/variation/'):
+            self._reply(200, {'mappings': [
+                {'location': '9:136131429-136131429', 'assembly_name': 'GRCh38'}]})
+        else:
+            self._reply(404, {'error': 'page not found'})
+
+    def _reply(self, status, body):
+        data = json.dumps(body).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def ensembl(mocker, tmp_path):
+    server = ThreadingHTTPServer(('127.0.0.1', 0), FakeEnsembl)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    url = 'http://127.0.0.1:{}/'.format(server.server_address[1])
+    mocker.patch('genomic_data_service.rsid_coordinates_resolver.ENSEMBL_URL', url)
+    mocker.patch.dict('genomic_data_service.ensembl.app.config', {
+        'ENSEMBL_CACHE_PATH': str(tmp_path / 'ensembl.sqlite'),
+    })
+    mocker.patch.object(FakeEnsembl, 'requests', [])
+    mocker.patch.object(FakeEnsembl, 'failing', False)
+    _ensembl_cache.cache_clear()
+    yield FakeEnsembl
+    server.shutdown()
+    server.server_close()
+    _ensembl_cache.cache_clear()
+
+
+def test_ensembl_lookups_are_cached(ensembl):
+    for _ in range(3):
+        assert get_ensemblid_coordinates('ENSG00000157764', 'GRCh38') == (
+            'chr7', '140719327', '140924929')
+    assert len(ensembl.requests) == 1
+    for _ in range(3):
+        assert get_rsid_coordinates_from_ensembl('GRCh38', 'rs56116432') == (
+            'chr9', 136131428, 136131429)
+    assert len(ensembl.requests) == 2
+
+
+def test_ensembl_misses_are_cached(ensembl):
+    for _ in range(3):
+        assert get_ensemblid_coordinates('ENSG00000000001', 'GRCh38') == ('', '', '')
+    assert len(ensembl.requests) == 1
+
+
+def test_ensembl_failures_are_not_cached(ensembl, mocker):
+    mocker.patch('genomic_data_service.ensembl.Retry.DEFAULT_BACKOFF_MAX', 0)
+    ensembl.failing = True
+    assert get_ensemblid_coordinates('ENSG00000157764', 'GRCh38') == ('', '', '')
+    ensembl.failing = False
+    count = len(ensembl.requests)
+    assert get_ensemblid_coordinates('ENSG00000157764', 'GRCh38') == (
+        'chr7', '140719327', '140924929')
+    assert len(ensembl.requests) == count + 1
+
+
+def test_ensembl_json_without_cache(ensembl, mocker):
+    mocker.patch.dict(
+        'genomic_data_service.ensembl.app.config', {'ENSEMBL_CACHE_PATH': None})
+    from genomic_data_service import rsid_coordinates_resolver
+    url = rsid_coordinates_resolver.ENSEMBL_URL + 'lookup/id/ENSG00000157764'
+    for _ in range(2):
+        assert ensembl_json(url, 'lookup', 'ENSG00000157764', 'GRCh38') == GENES['ENSG00000157764']
+    assert len(ensembl.requests) == 2
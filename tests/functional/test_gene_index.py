@@ -0,0 +1,88 @@
+import gzip
+import pytest
+from genomic_data_service.gene_index import (
+    GeneIndex,
+    _gene_index,
+    gene_index,
+    gene_index_path,
+    read_gtf,
+)
+from genomic_data_service.rsid_coordinates_resolver import get_coordinates
+
+GTF = '''##description: test annotation
+chr7\tHAVANA\tgene\t140719327\t140924929\t.\t-\t.\tgene_id "ENSG00000157764.14"; gene_type "protein_coding"; gene_name "BRAF"; level 2;
+chr7\tHAVANA\ttranscript\t140719327\t140924929\t.\t-\t.\tgene_id "ENSG00000157764.14"; transcript_id "ENST00000646891.2"; gene_name "BRAF";
+X\tensembl\tgene\t73820651\t73852753\t.\t-\t.\tgene_id "ENSG00000229807"; gene_name "XIST";
+chr1\tHAVANA\tgene\t100\t200\t.\t+\t.\tgene_id "ENSG00000000001.1"; gene_name "DUP";
+chr2\tHAVANA\tgene\t300\t400\t.\t+\t.\tgene_id "ENSG00000000002.1"; gene_name "DUP";
+'''
+
+
+@pytest.fixture
+def genes():
+    return GeneIndex.from_gtf(GTF.splitlines(keepends=True))
+
+
+def test_gene_index_from_gtf(genes):
+    assert len(genes) == 4
+    assert genes.lookup_id('ENSG00000157764') == ('chr7', 140719327, 140924929)
+    assert genes.lookup_id('ensg00000157764.14') == ('chr7', 140719327, 140924929)
+    assert genes.lookup_symbol('braf') == ('chr7', 140719327, 140924929)
+    assert genes.lookup_symbol('XIST') == ('chrX', 73820651, 73852753)
+    # symbols of several genes are ambiguous
+    assert genes.lookup_symbol('dup') is None
+    assert genes.lookup_id('ENSG00000000002') == ('chr2', 300, 400)
+    assert genes.lookup_symbol('nope') is None
+
+
+def test_gene_index_save_and_load(genes, tmp_path, mocker):
+    gtf = tmp_path / 'genes.gtf.gz'
+    with gzip.open(str(gtf), 'wt') as f:
+        f.write(GTF)
+    GeneIndex.from_gtf(read_gtf(str(gtf))).save(
+        gene_index_path(str(tmp_path), 'GRCh38'))
+
+    _gene_index.cache_clear()
+    mocker.patch.dict(
+        'genomic_data_service.gene_index.app.config', {'GENE_INDEX_DIR': str(tmp_path)})
+    loaded = gene_index('GRCh38')
+    assert loaded.genes == genes.genes
+    assert loaded.symbols == genes.symbols
+    assert gene_index('GRCh37') is None
+    _gene_index.cache_clear()
+
+
+def test_gene_index_of_assembly_alias(genes, tmp_path, mocker):
+    assert gene_index_path('genes', 'hg19') == gene_index_path('genes', 'GRCh37')
+    assert gene_index_path('genes', 'hg38') == gene_index_path('genes', 'GRCh38')
+    genes.save(gene_index_path(str(tmp_path), 'GRCh37'))
+
+    _gene_index.cache_clear()
+    mocker.patch.dict(
+        'genomic_data_service.gene_index.app.config', {'GENE_INDEX_DIR': str(tmp_path)})
+    mocker.patch(
+        'genomic_data_service.rsid_coordinates_resolver.ensembl_json',
+        side_effect=Exception('offline'))
+    assert gene_index('hg19').genes == genes.genes
+    assert get_coordinates('BRAF', 'hg19') == ('chr7', 140719327, 140924929)
+    assert gene_index('GRCh38') is None
+    _gene_index.cache_clear()
+
+
+def test_get_coordinates_from_gene_index(genes, mocker):
+    mocker.patch(
+        'genomic_data_service.rsid_coordinates_resolver.gene_index', return_value=genes)
+    ensembl = mocker.patch(
+        'genomic_data_service.rsid_coordinates_resolver.ensembl_json',
+        side_effect=Exception('offline'))
+    assert get_coordinates('ENSG00000157764', 'GRCh38') == (
+        'chr7', 140719327, 140924929)
+    assert get_coordinates('BRAF', 'GRCh38') == ('chr7', 140719327, 140924929)
+    assert get_coordinates('xist', 'GRCh38') == ('chrX', 73820651, 73852753)
+    ensembl.assert_not_called()
+    with pytest.raises(ValueError):
+        get_coordinates('DUP', 'GRCh38')
+    # ids missing from the index are still looked up on Ensembl
+    with pytest.raises(ValueError):
+        get_coordinates('ENSG00000999999', 'GRCh38')
+    ensembl.assert_called_once()
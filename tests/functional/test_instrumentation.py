@@ -0,0 +1,112 @@
+from concurrent.futures import ThreadPoolExecutor
+from genomic_data_service import app
+from genomic_data_service.instrumentation import (
+    Histograms, timed, start_stages, stop_stages, current_stages, in_context,
+    merge_histograms, render_histograms, retire_histograms,
+)
+
+
+def test_timed_outside_of_requests():
+    stop_stages()
+    with timed('es_peaks'):
+        pass
+    assert current_stages() is None
+
+
+def test_timed_stages_across_threads():
+    stages = start_stages()
+    try:
+        @timed('model')
+        def predict():
+            return 1
+
+        with timed('es_peaks'):
+            pass
+        with ThreadPoolExecutor(max_workers=4) as executor:
+            futures = [executor.submit(in_context(predict)) for _ in range(8)]
+        assert [future.result() for future in futures] == [1] * 8
+        assert stages.stages['model'][1] == 8
+        assert stages.stages['es_peaks'][1] == 1
+        header = stages.server_timing(total=0.5)
+        assert header.startswith('es_peaks;dur=')
+        assert 'model;dur=' in header and 'desc="8x"' in header
+        assert header.endswith('total;dur=500.00')
+    finally:
+        stop_stages()
+
+
+def test_histograms_merge_and_render(tmp_path, mocker):
+    getpid = mocker.patch('genomic_data_service.instrumentation.os.getpid')
+    for pid, seconds in ((1, 0.002), (2, 0.3)):
+        getpid.return_value = pid
+        histograms = Histograms(buckets=(0.01, 1.0))
+        histograms.observe('search', 'model', seconds)
+        histograms.observe('search', 'model', 5.0)
+        histograms.flush(str(tmp_path))
+    merged = merge_histograms(str(tmp_path))
+    assert merged['search\tmodel']['counts'] == [1, 1, 2]
+    text = render_histograms(merged, 'stage_seconds', buckets=(0.01, 1.0))
+    assert 'stage_seconds_bucket{endpoint="search",stage="model",le="0.01"} 1' in text
+    assert 'stage_seconds_bucket{endpoint="search",stage="model",le="1.0"} 2' in text
+    assert 'stage_seconds_bucket{endpoint="search",stage="model",le="+Inf"} 4' in text
+    assert 'stage_seconds_count{endpoint="search",stage="model"} 4' in text
+
+
+def test_server_timing_and_metrics(test_client, tmp_path, mocker):
+    mocker.patch.dict(app.config, {'METRICS_DIR': str(tmp_path)})
+    response = test_client.get(
+        'search/?regions=chr12:69360231-69360232%0D%0Achr10:5852536-5852537&genome=hg19')
+    server_timing = response.headers['Server-Timing']
+    assert 'serialize;dur=' in server_timing
+    assert 'total;dur=' in server_timing
+    # the histograms are observed when the response is closed
+    response.close()
+
+    response = test_client.get('/metrics')
+    assert response.status_code == 200
+    text = response.get_data(as_text=True)
+    assert '# TYPE genomic_data_service_stage_seconds histogram' in text
+    assert 'endpoint="search",stage="total",le="+Inf"' in text
+    assert 'endpoint="search",stage="serialize"' in text
+
+
+def test_streamed_stages_are_observed_on_close(test_client, tmp_path, mocker):
+    import time
+
+    def score_variants(atlas, assembly, variants, concurrency, deadline):
+        with timed('model'):
+            time.sleep(0.001)
+        return [({}, {'probability': '0.5', 'ranking': '5'}) for _ in variants]
+
+    mocker.patch.dict(app.config, {'METRICS_DIR': str(tmp_path)})
+    mocker.patch('genomic_data_service.summary.score_variants', side_effect=score_variants)
+    response = test_client.get(
+        'summary/?regions=chr1:100-101%0D%0Achr1:200-201&genome=GRCh37&format=tsv')
+    assert response.is_streamed
+    assert 'model;dur=' not in response.headers['Server-Timing']
+    assert response.get_data(as_text=True).startswith('chrom\t')
+    response.close()
+
+    text = test_client.get('/metrics').get_data(as_text=True)
+    assert 'stage="model",le="+Inf"} 1' in text
+
+
+def test_retire_histograms(tmp_path, mocker):
+    getpid = mocker.patch('genomic_data_service.instrumentation.os.getpid')
+    for pid in (1, 2):
+        getpid.return_value = pid
+        histograms = Histograms(buckets=(1.0,))
+        histograms.observe('search', 'model', 0.5)
+        histograms.flush(str(tmp_path))
+    mocker.patch(
+        'genomic_data_service.instrumentation._pid_alive', side_effect=lambda pid: pid == 2)
+    retire_histograms(str(tmp_path))
+    assert sorted(p.name for p in tmp_path.glob('*.json')) == ['2.json', 'retired.json']
+    assert merge_histograms(str(tmp_path))['search\tmodel']['counts'] == [2, 0]
+
+    # a new process reusing a pid keeps what the old one flushed
+    getpid.return_value = 2
+    histograms = Histograms(buckets=(1.0,))
+    histograms.observe('search', 'model', 5.0)
+    histograms.flush(str(tmp_path))
+    assert merge_histograms(str(tmp_path))['search\tmodel']['counts'] == [2, 1]
@@ -0,0 +1,83 @@
+import random
+import pytest
+from genomic_data_service.liftover import LiftOver, _liftover, liftover
+from genomic_data_service.rsid_coordinates_resolver import get_ensemblid_coordinates
+
+CHAIN = '''chain 1000 chr1 5000 + 100 400 chr1 6000 + 1100 1420 1
+100 20 40
+180
+
+chain 900 chr1 5000 + 1000 1200 chr2 3000 - 500 700 2
+50 10 10
+140
+
+chain 10 chr1 5000 + 1150 1250 chr3 3000 + 0 100 3
+100
+
+chain 800 chrX 2000 + 0 50 chrX 2000 + 10 60 4
+50
+'''
+
+
+@pytest.fixture
+def chain():
+    return LiftOver(CHAIN.splitlines())
+
+
+def test_map_interval_blocks_and_gaps(chain):
+    # first block maps 100-200 to 1100-1200, second 220-400 to 1240-1420
+    assert chain.map_interval('chr1', 100, 101) == ('chr1', 1100, 1101)
+    assert chain.map_interval('chr1', 150, 180) == ('chr1', 1150, 1180)
+    assert chain.map_interval('chr1', 399, 400) == ('chr1', 1419, 1420)
+    assert chain.map_interval('chr1', 205, 215) is None
+    # spanning the gap keeps the aligned bases
+    assert chain.map_interval('chr1', 190, 230) == ('chr1', 1190, 1250)
+    assert chain.map_interval('chr1', 50, 100) is None
+    assert chain.map_interval('chr2', 100, 101) is None
+    assert chain.map_interval('1', 100, 101) == ('chr1', 1100, 1101)
+
+
+def test_map_interval_reverse_strand(chain):
+    # chr1 1000-1050 is chr2 500-550 of the reverse strand, 2450-2500 forward
+    assert chain.map_interval('chr1', 1000, 1001) == ('chr2', 2499, 2500)
+    assert chain.map_interval('chr1', 1000, 1050) == ('chr2', 2450, 2500)
+    assert chain.map_interval('chr1', 1060, 1200) == ('chr2', 2300, 2440)
+
+
+def test_map_interval_best_chain_wins(chain):
+    # chr1 1150-1200 is in chains 2 and 3, the first has the higher score
+    assert chain.map_interval('chr1', 1160, 1161) == ('chr2', 2339, 2340)
+    assert chain.map_interval('chr1', 1210, 1220) == ('chr3', 60, 70)
+
+
+def test_map_intervals_matches_map_interval(chain):
+    rng = random.Random(0)
+    intervals = []
+    for _ in range(2000):
+        chrom = rng.choice(['chr1', 'chrX', 'chr5'])
+        start = rng.randint(0, 1500)
+        intervals.append((chrom, start, start + rng.choice([0, 1, 5, 60])))
+    assert chain.map_intervals(intervals) == [
+        chain.map_interval(*interval) for interval in intervals]
+
+
+def test_map_location_is_one_based(chain):
+    assert chain.map_location('1:101-101') == ('chr1', 1101, 1101)
+    assert chain.map_location('X:1..50') == ('chrX', 11, 60)
+    assert chain.map_location('1:206-215') == ('', '', '')
+
+
+def test_ensemblid_coordinates_use_chain_file(mocker, tmp_path):
+    path = tmp_path / 'hg38ToHg19.over.chain'
+    path.write_text(CHAIN)
+    _liftover.cache_clear()
+    mocker.patch.dict('genomic_data_service.liftover.app.config', {
+        'LIFTOVER_CHAIN_FILES': {('GRCh38', 'GRCh37'): str(path)}})
+    assert liftover('GRCh37', 'GRCh38') is None
+    mocker.patch('genomic_data_service.rsid_coordinates_resolver.ensembl_json', return_value={
+        'assembly_name': 'GRCh38', 'seq_region_name': '1', 'start': 101, 'end': 150})
+    mapper = mocker.patch(
+        'genomic_data_service.rsid_coordinates_resolver.ensembl_assembly_mapper')
+    assert get_ensemblid_coordinates('ENSG00000157764', 'GRCh37') == ('chr1', 1101, 1150)
+    mapper.assert_not_called()
+    _liftover.cache_clear()
@@ -1,8 +1,19 @@
 import pytest
 from genomic_data_service.parser import SnfParser, RegionParser, FootPrintParser
+from genomic_data_service.sequence_service import sequence_service
 from genomic_data_service.strand import get_matrix_array, get_pwm
 
 
+@pytest.fixture
+def two_bit(mocker):
+    sequence_service.cache_clear()
+    mock_reader = mocker.Mock()
+    mocker.patch('genomic_data_service.sequence_service.py2bit.open',
+                 return_value=mock_reader)
+    yield mock_reader
+    sequence_service.cache_clear()
+
+
 def test_RegionParser_chip_seq(reader_chip_seq):
     cols_for_index = {'strand_col': 5, 'value_col': 6}
     docs = list(RegionParser(reader_chip_seq, cols_for_index).parse())
@@ -64,11 +75,8 @@ def test_SnpParser(reader_snp):
     }
 
 
-def test_foot_print_parser(reader_footprint_grch38, mocker):
-    mock_reader = mocker.Mock()
-    mock_reader.sequence.return_value = 'TCTGCCTGCCTTCCCTCT'
-    mocker.patch('genomic_data_service.parser.py2bit.open',
-                 return_value=mock_reader)
+def test_foot_print_parser(reader_footprint_grch38, two_bit):
+    two_bit.sequence.return_value = 'TCTGCCTGCCTTCCCTCT'
     url = 'https://www.encodeproject.org/documents/5f806098-bbf7-48e2-9ad2-588590baf2c5/@@download/attachment/MA0149.1.txt'
     matrix = get_matrix_array(url)
     pwm = get_pwm(matrix)
@@ -83,11 +91,8 @@ def test_foot_print_parser(reader_footprint_grch38, mocker):
     }
 
 
-def test_foot_print_parser_with_n(reader_footprint_grch38, mocker):
-    mock_reader = mocker.Mock()
-    mock_reader.sequence.return_value = 'NNNNNNNNNNNNNNNNNN'
-    mocker.patch('genomic_data_service.parser.py2bit.open',
-                 return_value=mock_reader)
+def test_foot_print_parser_with_n(reader_footprint_grch38, two_bit):
+    two_bit.sequence.return_value = 'NNNNNNNNNNNNNNNNNN'
     url = 'https://www.encodeproject.org/documents/5f806098-bbf7-48e2-9ad2-588590baf2c5/@@download/attachment/MA0149.1.txt'
     matrix = get_matrix_array(url)
     pwm = get_pwm(matrix)
@@ -0,0 +1,94 @@
+import random
+import pytest
+from genomic_data_service.peak_index import PeakIndex
+
+
+def make_peak(chrom, gte, lt, uuid):
+    return {
+        '_index': chrom,
+        '_source': {'coordinates': {'gte': gte, 'lt': lt}, 'uuid': uuid},
+    }
+
+
+@pytest.fixture
+def peaks():
+    rng = random.Random(0)
+    peaks = []
+    for _ in range(500):
+        gte = rng.randint(1000, 5000)
+        peaks.append(make_peak(
+            'chr10', gte, gte + rng.choice([1, 20, 150, 900]),
+            'uuid-{}'.format(rng.randint(0, 30))
+        ))
+    return peaks
+
+
+def test_peak_index_overlapping_matches_scan(peaks):
+    peak_index = PeakIndex(peaks)
+    assert len(peak_index) == 500
+    for pos in range(900, 6000, 7):
+        expected = {
+            peak['_source']['uuid'] for peak in peaks
+            if pos <= peak['_source']['coordinates']['lt']
+            and pos >= peak['_source']['coordinates']['gte']
+        }
+        assert peak_index.overlapping('chr10', pos) == expected
+
+
+def test_peak_index_intersecting_matches_half_open(peaks):
+    peak_index = PeakIndex(peaks)
+    for start in range(900, 6000, 11):
+        end = start + 3
+        expected = {
+            peak['_source']['uuid'] for peak in peaks
+            if peak['_source']['coordinates']['gte'] < end
+            and peak['_source']['coordinates']['lt'] > start
+        }
+        assert peak_index.intersecting('chr10', start, end) == expected
+
+
+def test_peak_index_other_chrom():
+    peak_index = PeakIndex([make_peak('chr1', 10, 20, 'a')])
+    assert peak_index.overlapping('chr1', 20) == {'a'}
+    assert peak_index.overlapping('chr2', 15) == set()
+    assert peak_index.intersecting('chr1', 20, 21) == set()
+    assert PeakIndex([]).overlapping('chr1', 15) == set()
+
+
+def test_peak_index_segments_match_overlapping(peaks):
+    peak_index = PeakIndex(peaks)
+    start, end = 2000, 4000
+    segments = list(peak_index.segments('chr10', start, end))
+    assert segments[0][0] == start
+    assert segments[-1][1] == end
+    for (_, seg_end, uuids), (next_start, _, next_uuids) in zip(segments, segments[1:]):
+        assert seg_end == next_start
+        assert uuids != next_uuids
+    for seg_start, seg_end, uuids in segments:
+        for base in range(seg_start, seg_end):
+            assert peak_index.overlapping('chr10', base) == uuids
+
+
+def test_peak_index_segments_no_peaks():
+    assert list(PeakIndex([]).segments('chr1', 5, 10)) == [(5, 10, frozenset())]
+    peak_index = PeakIndex([make_peak('chr1', 10, 20, 'a')])
+    assert list(peak_index.segments('chr1', 0, 30)) == [
+        (0, 10, frozenset()),
+        (10, 21, frozenset(['a'])),
+        (21, 30, frozenset()),
+    ]
+    assert list(peak_index.segments('chr1', 12, 15)) == [
+        (12, 15, frozenset(['a']))]
+
+
+def test_peak_index_intersecting_peaks(peaks):
+    peak_index = PeakIndex(peaks)
+    for start in range(900, 6000, 13):
+        end = start + 5
+        expected = [
+            peak for peak in peaks
+            if peak['_source']['coordinates']['gte'] < end
+            and peak['_source']['coordinates']['lt'] > start
+        ]
+        assert peak_index.intersecting_peaks('chr10', start, end) == expected
+    assert peak_index.intersecting_peaks('chr1', 1000, 2000) == []
@@ -67,3 +67,15 @@ def test_get_cols_for_index_eqtls():
         'p_value_col': 14,
         'effect_size_col': 15
     }
+
+
+def test_add_to_residence_bumps_epoch(mocker):
+    from genomic_data_service.region_indexer_task import add_to_residence
+
+    es = mocker.MagicMock()
+    add_to_residence(es, {'uuid': 'abc', 'chroms': ['chr1', 'chr1']})
+    es.index.assert_called_once()
+    es.indices.put_mapping.assert_called_once()
+    _, kwargs = es.indices.put_mapping.call_args
+    assert kwargs['index'] == 'resident_regionsets'
+    assert 'residents_epoch' in kwargs['body']['_meta']
@@ -0,0 +1,591 @@
+import numpy as np
+import pytest
+from genomic_data_service.regulome_atlas import (
+    RegulomeAtlas,
+    MODEL_BINARY_KEYS,
+    MODEL_NUMERIC_KEYS,
+)
+
+
+@pytest.fixture
+def trained_reg_model(mocker):
+    from sklearn.ensemble import RandomForestClassifier
+
+    rng = np.random.default_rng(0)
+    features = rng.random((500, len(MODEL_BINARY_KEYS) + len(MODEL_NUMERIC_KEYS)))
+    features[:, :len(MODEL_BINARY_KEYS)] = features[:, :len(MODEL_BINARY_KEYS)] > 0.5
+    labels = rng.random(500) > 0.5
+    model = RandomForestClassifier(n_estimators=10, random_state=0)
+    model.fit(features, labels)
+    mocker.patch(
+        'genomic_data_service.regulome_atlas.TRAINED_REG_MODEL', model
+    )
+    return model
+
+
+@pytest.fixture
+def characterizations():
+    return [
+        {
+            'QTL': [],
+            'ChIP': [],
+            'Chromatin_accessibility': [],
+            'PWM_matched': [],
+            'Footprint_matched': [],
+            'IC_matched_max': 0.0,
+            'IC_max': 0.0,
+        },
+        {
+            'ChIP': [],
+            'PWM': [],
+            'Footprint': [
+                {'biosample_ontology': {'organ_slims': ['colon', 'intestine']}}
+            ],
+            'H3K27ac': [
+                {'biosample_ontology': {'organ_slims': ['colon', 'brain']}}
+            ],
+            'IC_matched_max': 0.17,
+            'IC_max': 1.39,
+        },
+        {
+            'Chromatin_accessibility': [
+                {'biosample_ontology': {'organ_slims': ['blood']}}
+            ],
+            'IC_matched_max': 0.05,
+            'IC_max': 0.7,
+        },
+    ]
+
+
+def test_score_batch_matches_per_variant_model_calls(trained_reg_model, characterizations):
+    scores = RegulomeAtlas._score_batch(characterizations)
+    assert [score['ranking'] for score in scores] == ['1a', '5', '5']
+    for characterization, score in zip(characterizations, scores):
+        query = RegulomeAtlas._model_query(characterization)
+        probability = round(
+            trained_reg_model.predict_proba([query])[:, 1][0], 5)
+        assert score['probability'] == str(probability)
+        assert len(score['tissue_specific_scores']) == 51
+    assert scores[1]['tissue_specific_scores']['colon'] != scores[1]['tissue_specific_scores']['blood']
+
+
+def test_score_batch_empty():
+    assert RegulomeAtlas._score_batch([]) == []
+
+
+def test_tissue_specific_masks_use_record_organ_masks(characterizations):
+    from genomic_data_service.constants import ORGANS
+    from genomic_data_service.regulome_atlas import DatasetRecord
+
+    records = {}
+
+    def record(dataset):
+        records[id(dataset)] = DatasetRecord(dataset)
+        return records[id(dataset)]
+
+    for characterization in characterizations:
+        masks = RegulomeAtlas._tissue_specific_masks(characterization, record)
+        assert masks.tolist() == RegulomeAtlas._tissue_specific_masks(
+            characterization).tolist()
+    assert records
+    masks = RegulomeAtlas._tissue_specific_masks(characterizations[1], record)
+    assert masks[ORGANS.index('colon')] == 0b1000001
+    assert masks[ORGANS.index('brain')] == 0b1000000
+
+
+def test_regulome_scores_skips_empty_evidence(trained_reg_model, characterizations):
+    atlas = RegulomeAtlas(None)
+    scores = atlas.regulome_scores(
+        [characterizations[0], None, {}, characterizations[2]])
+    assert scores[1] is None
+    assert scores[2] is None
+    assert scores[0] == RegulomeAtlas._score(characterizations[0])
+    assert scores[3] == RegulomeAtlas._score(characterizations[2])
+
+
+def test_tissue_specific_scores_match_lookup_table(trained_reg_model, characterizations):
+    from genomic_data_service.constants import ORGANS
+    from genomic_data_service.regulome_atlas import (
+        TRAINED_TISSUE_SPECIFIC_TABLE,
+        TISSUE_SPECIFIC_FEATURE_KEYS,
+    )
+
+    scores = RegulomeAtlas._score_batch(characterizations)
+    for characterization, score in zip(characterizations, scores):
+        probability = np.float64(score['probability'])
+        for organ in ORGANS:
+            binary_values = tuple(
+                int(
+                    key in characterization
+                    and any(
+                        organ in dataset['biosample_ontology'].get('organ_slims', [])
+                        for dataset in characterization[key]
+                    )
+                )
+                for key in TISSUE_SPECIFIC_FEATURE_KEYS
+            )
+            expected = str(
+                round(TRAINED_TISSUE_SPECIFIC_TABLE[binary_values] * probability, 5))
+            assert score['tissue_specific_scores'][organ] == expected
+
+
+def test_tissue_specific_mask():
+    from genomic_data_service.regulome_atlas import tissue_specific_mask
+
+    assert tissue_specific_mask((0, 0, 0, 0, 0, 0, 0)) == 0
+    assert tissue_specific_mask((0, 0, 0, 0, 0, 0, 1)) == 1
+    assert tissue_specific_mask((1, 0, 0, 0, 0, 0, 0)) == 64
+    assert tissue_specific_mask((1, 1, 1, 1, 1, 1, 1)) == 127
+
+
+def test_rankings_table_matches_rules():
+    from itertools import product
+    from genomic_data_service.regulome_atlas import (
+        RANKINGS,
+        ranking_mask,
+        ranking_rules,
+    )
+
+    assert len(RANKINGS) == 128
+    for present in product([False, True], repeat=len(MODEL_BINARY_KEYS)):
+        characterization = {
+            key: [] for key, is_present in zip(MODEL_BINARY_KEYS, present)
+            if is_present
+        }
+        characterization['H3K27ac'] = []
+        expected = ranking_rules(characterization)
+        assert RANKINGS[ranking_mask(characterization)] == expected
+        assert RegulomeAtlas._ranking(characterization) == expected
+
+
+def test_score_batch_rankings_match_rules(trained_reg_model):
+    from itertools import product
+    from genomic_data_service.regulome_atlas import ranking_rules
+
+    characterizations = []
+    for present in product([False, True], repeat=len(MODEL_BINARY_KEYS)):
+        characterization = {
+            key: [] for key, is_present in zip(MODEL_BINARY_KEYS, present)
+            if is_present
+        }
+        characterization.update({'IC_max': 0.5, 'IC_matched_max': 0.1})
+        characterizations.append(characterization)
+    scores = RegulomeAtlas._score_batch(characterizations)
+    assert [score['ranking'] for score in scores] == [
+        ranking_rules(characterization) for characterization in characterizations
+    ]
+
+
+class FakeBigWig:
+    def __init__(self):
+        self.reads = 0
+
+    def chroms(self, chrom):
+        return 100000 if chrom == 'chr10' else None
+
+    def values(self, chrom, start, end, numpy=False):
+        self.reads += 1
+        if self.chroms(chrom) is None or end > self.chroms(chrom):
+            raise RuntimeError('Invalid interval bounds!')
+        values = [(position % 7) / 3 for position in range(start, end)]
+        values = np.array(values, dtype=np.float32)
+        return values if numpy else values.tolist()
+
+
+def resident_detail(uuid, collection_type, organ_slims=()):
+    return {
+        'uuid': uuid,
+        'file': {'@id': '/files/{}/'.format(uuid)},
+        'dataset': {
+            '@id': '/experiments/{}/'.format(uuid),
+            'collection_type': collection_type,
+            'target': ['CTCF'] if collection_type in ('ChIP-seq', 'PWMs') else [],
+            'biosample_ontology': {'organ_slims': list(organ_slims)},
+        },
+    }
+
+
+@pytest.fixture
+def residents():
+    return {
+        'chip': resident_detail('chip', 'ChIP-seq', ['blood']),
+        'dnase': resident_detail('dnase', 'DNase-seq', ['brain']),
+        'eqtl': resident_detail('eqtl', 'eQTLs'),
+        'pwm': resident_detail('pwm', 'PWMs'),
+    }
+
+
+@pytest.fixture
+def window_peaks():
+    def peak(uuid, gte, lt):
+        return {
+            '_index': 'chr10',
+            '_source': {'coordinates': {'gte': gte, 'lt': lt}, 'uuid': uuid},
+        }
+    return [
+        peak('chip', 100, 180),
+        peak('dnase', 120, 300),
+        peak('eqtl', 150, 151),
+        peak('pwm', 170, 190),
+        peak('chip', 250, 260),
+    ]
+
+
+@pytest.fixture
+def atlas(mocker, trained_reg_model, residents, window_peaks):
+    atlas = RegulomeAtlas(None)
+    atlas.bigwig_signal_map = {
+        'hg19': {'IC_matched_max': FakeBigWig(), 'IC_max': FakeBigWig()}
+    }
+    mocker.patch.object(
+        atlas, 'find_peaks_filtered', return_value=(window_peaks, residents))
+    return atlas
+
+
+def test_scored_regions_matches_per_base_scores(atlas, residents, window_peaks):
+    from genomic_data_service.peak_index import PeakIndex
+
+    start, end = 90, 320
+    peak_index = PeakIndex(window_peaks)
+    expected = []
+    for base in range(start, end):
+        uuids = peak_index.overlapping('chr10', base)
+        score = 0
+        if uuids:
+            datasets, _files = atlas.details_breakdown(residents, uuids)
+            evidence = atlas.regulome_evidence(
+                'hg19', datasets, 'chr10', base, base + 1)
+            score = atlas.numeric_score(RegulomeAtlas._ranking(evidence))
+        if expected and expected[-1][2] == score and expected[-1][1] == base - 1:
+            expected[-1][1] = base
+        else:
+            expected.append([base, base, score])
+    expected = [tuple(region) for region in expected if region[2] > 0]
+
+    regions = list(atlas._scored_regions('GRCh37', 'chr10', start, end))
+    assert len(regions) > 2
+    assert regions == expected
+
+
+def test_regulome_evidence_from_signal_window(atlas, residents):
+    datasets, _files = atlas.details_breakdown(residents)
+    signals = atlas.signal_window('hg19', 'chr10', 100, 200)
+    bigwig = atlas.bigwig_signal_map['hg19']['IC_max']
+    assert bigwig.reads == 1
+    for start, end in [(100, 101), (150, 151), (199, 200), (120, 180)]:
+        reads = bigwig.reads
+        prefetched = atlas.regulome_evidence(
+            'hg19', datasets, 'chr10', start, end, signals=signals)
+        assert bigwig.reads == reads
+        assert prefetched == atlas.regulome_evidence(
+            'hg19', datasets, 'chr10', start, end)
+    # positions outside of the window are read directly
+    outside = atlas.regulome_evidence(
+        'hg19', datasets, 'chr10', 300, 301, signals=signals)
+    assert outside['IC_max'] == pytest.approx((300 % 7) / 3)
+
+
+def test_signal_window_unknown_chrom(atlas):
+    signals = atlas.signal_window('hg19', 'chr1', 100, 200)
+    assert signals.values_for('IC_max', 'chr1', 100, 101) is None
+
+
+@pytest.fixture
+def residents_es(mocker, residents):
+    es = mocker.MagicMock()
+    es.epoch = 'a'
+    es.indices.get_mapping.side_effect = lambda index, doc_type: {
+        'resident_regionsets': {
+            'mappings': {doc_type: {'_meta': {'residents_epoch': es.epoch}}}
+        }
+    }
+    scan = mocker.patch(
+        'genomic_data_service.regulome_atlas.scan',
+        side_effect=lambda es, **kwargs: [
+            {'_source': detail} for detail in residents.values()
+        ],
+    )
+    return es, scan
+
+
+def test_residents_cache_reloads_on_epoch_change(residents_es, residents):
+    from genomic_data_service.regulome_atlas import ResidentsCache
+
+    es, scan = residents_es
+    cache = ResidentsCache(check_seconds=0)
+    assert cache.details(es, ['chip', 'missing']) == {'chip': residents['chip']}
+    assert cache.details(es, ['pwm', 'eqtl']) == {
+        'pwm': residents['pwm'], 'eqtl': residents['eqtl']}
+    assert scan.call_count == 1
+    es.epoch = 'b'
+    assert cache.details(es, ['dnase']) == {'dnase': residents['dnase']}
+    assert scan.call_count == 2
+    stats = cache.stats()
+    assert stats['epoch'] == 'b'
+    assert stats['residents'] == 4
+    assert (stats['hits'], stats['misses'], stats['refreshes']) == (1, 2, 2)
+
+
+def test_residents_cache_checks_epoch_every_interval(residents_es):
+    from genomic_data_service.regulome_atlas import ResidentsCache
+
+    es, scan = residents_es
+    cache = ResidentsCache(check_seconds=3600)
+    cache.details(es, ['chip'])
+    es.epoch = 'b'
+    cache.details(es, ['chip'])
+    assert es.indices.get_mapping.call_count == 1
+    assert scan.call_count == 1
+    assert cache.hit_rate() == 0.5
+
+
+def test_residents_cache_load_failure(residents_es):
+    from genomic_data_service.regulome_atlas import ResidentsCache
+
+    es, scan = residents_es
+    scan.side_effect = Exception('no index')
+    cache = ResidentsCache(check_seconds=0)
+    assert cache.details(es, ['chip']) is None
+
+
+def test_atlas_shares_residents_cache_per_client(mocker):
+    es = mocker.MagicMock()
+    cache = RegulomeAtlas(es).residents_cache
+    assert RegulomeAtlas(es).residents_cache is cache
+    assert RegulomeAtlas(mocker.MagicMock()).residents_cache is not cache
+
+
+def test_regulome_evidence_matched_targets(atlas):
+    datasets = {}
+    for accession, collection_type, target in [
+        ('ENCSR000AAA', 'ChIP-seq', 'CTCF'),
+        ('ENCSR000AAB', 'ChIP-seq', 'SP1'),
+        ('ENCSR000AAC', 'ChIP-seq', 'CTCF'),
+        ('ENCSR000AAD', 'PWMs', ['CTCF', 'YY1']),
+        ('ENCSR000AAE', 'Footprints', 'SP1'),
+        ('ENCSR000AAF', 'Histone ChIP-seq', 'H3K27ac'),
+    ]:
+        datasets[accession] = {
+            '@id': '/annotations/{}/'.format(accession),
+            'collection_type': collection_type,
+            'target': target,
+            'target_label': target,
+            'biosample_term_name': 'K562 cell',
+        }
+    evidence = atlas.regulome_evidence('hg19', datasets, 'chr10', 100, 101)
+    assert evidence['PWM_matched'] == ['CTCF', 'CTCF']
+    assert evidence['Footprint_matched'] == ['SP1']
+    assert len(evidence['ChIP']) == 3
+    assert len(evidence['H3K27ac']) == 1
+    case = atlas.make_a_case({'evidence': {
+        k: v for k, v in evidence.items() if k not in MODEL_NUMERIC_KEYS}})
+    assert case['PWM_matched'] == 'CTCF,CTCF'
+    assert case['ChIP'] == (
+        'Protein_Binding:ChIP:|ENCSR000AAA|CTCF|K562cell|,'
+        'ENCSR000AAB|SP1|K562cell|,ENCSR000AAC|CTCF|K562cell|'
+    )
+    assert case['PWM'] == 'Motifs:PWM:|ENCSR000AAD|CTCF/YY1|K562cell|'
+
+
+def test_residents_cache_records(residents_es, residents):
+    from genomic_data_service.regulome_atlas import (
+        DatasetRecord, ResidentsCache, SCORE_CATEGORIES)
+
+    es, _scan = residents_es
+    cache = ResidentsCache()
+    details = cache.details(es, ['chip', 'pwm'])
+    chip = details['chip']['dataset']
+    assert cache.record(chip) is cache.record(chip)
+    assert SCORE_CATEGORIES[cache.record(chip).category] == 'ChIP'
+    assert cache.record(chip).targets == ('CTCF',)
+    assert SCORE_CATEGORIES[cache.record(details['pwm']['dataset']).category] == 'PWM'
+    # copies of cached datasets are not confused with them
+    record = cache.record(dict(chip))
+    assert isinstance(record, DatasetRecord)
+    assert record is not cache.record(chip)
+
+
+def test_lru_memo_evicts_least_recently_used():
+    from genomic_data_service.regulome_atlas import LRUMemo
+
+    memo = LRUMemo(max_size=2)
+    memo.put('a', 1)
+    memo.put('b', 2)
+    assert memo.get('a') == 1
+    memo.put('c', 3)
+    assert memo.get('b') is None
+    assert memo.get('a') == 1
+    assert memo.get('c') == 3
+    assert len(memo) == 2
+    assert memo.stats()['hits'] == 3
+    assert memo.stats()['misses'] == 1
+
+
+def test_regulome_scores_memoized_on_uuids(atlas, residents):
+    uuids = frozenset(['chip', 'dnase', 'pwm'])
+    datasets, _files = atlas.details_breakdown(residents, uuids)
+    evidences = [
+        atlas.regulome_evidence(
+            'hg19', datasets, 'chr10', pos, pos + 1, uuids=uuids)
+        for pos in range(100, 114)
+    ]
+    assert evidences[0] == atlas.regulome_evidence(
+        'hg19', datasets, 'chr10', 100, 101)
+    memo = atlas.scoring_memo
+    assert memo.evidence.misses == 1
+    assert memo.evidence.hits == 13
+
+    scores = atlas.regulome_scores(evidences, [uuids] * len(evidences))
+    assert scores == atlas.regulome_scores(evidences)
+    # IC signals repeat every 7 bases
+    assert memo.scores.misses == 14
+    assert len(memo.scores) == 7
+    assert memo.scores.hits == 0
+    assert atlas.regulome_scores(evidences[:3], [uuids] * 3) == scores[:3]
+    assert memo.scores.hits == 3
+
+
+def test_prefetch_search_answers_queries_from_one_msearch(mocker):
+    snp = {'chrom': 'chr10', 'rsid': 'rs1', 'coordinates': {'gte': 150, 'lt': 151}}
+    peak = {'_index': 'chr10', '_source': {'uuid': 'chip'}}
+    es = mocker.MagicMock()
+    es.msearch.return_value = {'responses': [
+        {'error': {'type': 'index_not_found_exception'}},
+        {'hits': {'hits': [peak]}},
+        {'hits': {'hits': [{'_source': snp}]}},
+    ]}
+    es.search.return_value = {'hits': {'hits': [{'_source': snp}]}}
+    atlas = RegulomeAtlas(es)
+    atlas.prefetch_search('hg19', 'chr10', 150, 2000)
+
+    _args, kwargs = es.msearch.call_args
+    headers = kwargs['body'][::2]
+    assert headers == [
+        {'index': 'snp_hg19', 'type': 'chr10'},
+        {'index': 'chr10', 'type': 'hg19'},
+        {'index': 'snp_hg19', 'type': 'chr10'},
+    ]
+    assert kwargs['body'][1]['query']['bool']['filter'][0]['range']['coordinates'] == {
+        'gte': 275, 'lt': 1875, 'relation': 'intersects'}
+    assert atlas.find_snps('hg19', 'chr10', 150, 2000) == [snp]
+    assert atlas.find_peaks('hg19', 'chr10', 150, 2000) == [peak]
+    es.search.assert_not_called()
+    # failed searches of the msearch run on their own
+    assert atlas.nearby_snps('hg19', 'chr10', 1075) == [snp]
+    assert es.search.call_count == 1
+    # prefetched hits are used once
+    atlas.find_snps('hg19', 'chr10', 150, 2000)
+    assert es.search.call_count == 2
+    assert 'prefetch_searches' in atlas.timing[0]
+
+
+def test_prefetch_search_picks_variants_from_nearby_snps(mocker):
+    nearby = [
+        {'rsid': 'rs1', 'coordinates': {'gte': 149, 'lt': 150}, 'maf': 0.2},
+        {'rsid': 'rs2', 'coordinates': {'gte': 150, 'lt': 151}, 'maf': 0.2},
+        {'rsid': 'rs3', 'coordinates': {'gte': 150, 'lt': 151}, 'maf': 0.001},
+        {'rsid': 'rs4', 'coordinates': {'gte': 148, 'lt': 152}},
+        {'rsid': 'rs5', 'coordinates': {'gte': 151, 'lt': 152}, 'maf': 0.3},
+    ]
+    peak = {'_index': 'chr10', '_source': {'uuid': 'chip'}}
+    es = mocker.MagicMock()
+    es.msearch.return_value = {'responses': [
+        {'hits': {'hits': [{'_source': snp} for snp in nearby]}},
+        {'hits': {'hits': [peak]}},
+    ]}
+    atlas = RegulomeAtlas(es)
+    atlas.prefetch_search('hg19', 'chr10', 150, 151, maf='0.01')
+
+    _args, kwargs = es.msearch.call_args
+    assert len(kwargs['body']) == 4
+    assert atlas.find_snps('hg19', 'chr10', 150, 151, maf='0.01') == nearby[1:2]
+    assert atlas.nearby_snps('hg19', 'chr10', 150) == nearby
+    es.search.assert_not_called()
+
+    atlas.prefetch_search('hg19', 'chr10', 150, 151)
+    assert atlas.find_snps('hg19', 'chr10', 150, 151) == [
+        nearby[1], nearby[2], nearby[3]]
+
+
+def test_snp_window():
+    snps = [
+        {'rsid': 'rs{}'.format(pos), 'coordinates': {'gte': pos, 'lt': pos + 1}}
+        for pos in (90, 10, 50, 30, 70, 20, 60, 40, 80)
+    ]
+    assert RegulomeAtlas._snp_window(snps, 20, 50) is snps
+    window = RegulomeAtlas._snp_window(snps, 4, 55)
+    assert [snp['coordinates']['gte'] for snp in window] == [40, 50, 60, 70]
+    window = RegulomeAtlas._snp_window(snps, 4, 5)
+    assert [snp['coordinates']['gte'] for snp in window] == [10, 20, 30, 40]
+    window = RegulomeAtlas._snp_window(snps, 4, 100)
+    assert [snp['coordinates']['gte'] for snp in window] == [80, 90]
+
+
+def test_find_snps_are_sorted_once(mocker):
+    from genomic_data_service.regulome_atlas import SortedSnps
+
+    es = mocker.MagicMock()
+    es.search.return_value = {'hits': {'hits': [
+        {'_source': {'rsid': 'rs{}'.format(pos), 'coordinates': {'gte': pos, 'lt': pos + 1}}}
+        for pos in (90, 10, 50, 30, 70, 20, 60, 40, 80)
+    ]}}
+    atlas = RegulomeAtlas(es)
+    snps = atlas.find_snps('hg19', 'chr10', 0, 100)
+    assert isinstance(snps, SortedSnps)
+    # found order is kept, location order is built with it
+    assert snps[0]['rsid'] == 'rs90'
+    assert snps.positions == [10, 20, 30, 40, 50, 60, 70, 80, 90]
+    assert [snps[i]['coordinates']['gte'] for i in snps.order] == snps.positions
+    sort = mocker.patch('genomic_data_service.regulome_atlas.sorted', create=True)
+    window = RegulomeAtlas._snp_window(snps, 4, 55)
+    assert [snp['rsid'] for snp in window] == ['rs40', 'rs50', 'rs60', 'rs70']
+    sort.assert_not_called()
+
+
+def test_prefetch_search_failure(mocker):
+    es = mocker.MagicMock()
+    es.msearch.side_effect = Exception('timeout')
+    es.search.return_value = {'hits': {'hits': []}}
+    atlas = RegulomeAtlas(es)
+    atlas.prefetch_search('hg19', 'chr10', 150, 151)
+    assert atlas.find_snps('hg19', 'chr10', 150, 151) == []
+    es.search.assert_called_once()
+
+
+def test_find_snps_by_rsid_chunks_mget(mocker):
+    mocker.patch('genomic_data_service.regulome_atlas.MGET_CHUNK_SIZE', 2)
+    es = mocker.MagicMock()
+    es.mget.side_effect = [
+        {'docs': [
+            {'_id': 'rs1', 'found': True, '_source': {'rsid': 'rs1'}},
+            {'_id': 'rs2', 'found': False},
+        ]},
+        Exception('timeout'),
+    ]
+    atlas = RegulomeAtlas(es)
+    snps = atlas.find_snps_by_rsid('hg19', ['rs1', 'rs2', 'rs1', 'rs3'])
+    assert snps == {'rs1': {'rsid': 'rs1'}}
+    assert es.mget.call_count == 2
+    _args, kwargs = es.mget.call_args_list[0]
+    assert kwargs == {'index': 'snp_hg19', 'body': {'ids': ['rs1', 'rs2']}}
+
+
+def test_prefetch_snps_chunks_msearch(mocker):
+    mocker.patch('genomic_data_service.regulome_atlas.MSEARCH_CHUNK_SIZE', 2)
+    snps = [
+        {'rsid': 'rs{}'.format(i), 'coordinates': {'gte': i, 'lt': i + 1}}
+        for i in range(3)
+    ]
+    es = mocker.MagicMock()
+    es.msearch.side_effect = [
+        {'responses': [{'hits': {'hits': [{'_source': snps[0]}]}},
+                       {'hits': {'hits': [{'_source': snps[1]}]}}]},
+        {'responses': [{'hits': {'hits': [{'_source': snps[2]}]}}]},
+    ]
+    atlas = RegulomeAtlas(es)
+    regions = [('chr1', 10, 11, None), ('chr1', 20, 30, '0.01'), ('chr2', 5, 6, None)]
+    atlas.prefetch_snps('hg19', regions)
+    assert es.msearch.call_count == 2
+    for (chrom, start, end, maf), snp in zip(regions, snps):
+        assert atlas.find_snps('hg19', chrom, start, end, maf=maf) == [snp]
+    es.search.assert_not_called()
@@ -1,3 +1,6 @@
+import pytest
+
+
 def test_valid_params(test_client):
     response = test_client.get(
         'summary/?regions=rs75982468%0D%0Ars7745856&genome=GRCh37&maf=0.01'
@@ -35,3 +38,166 @@ def test_valid_params_limit_exception(test_client):
         'summary/?regions=rs75982468%0D%0Ars7745856&genome=GRCh37&maf=0.01&limit=no'
     )
     assert response.status_code == 200
+
+
+def test_fetch_variants_hits_keeps_variant_order(mocker):
+    import random
+    import time
+    from genomic_data_service.summary_scoring import fetch_variants_hits
+
+    def region_get_hits(atlas, assembly, chrom, start, end):
+        time.sleep(random.random() / 100)
+        return {'datasets': {'{}:{}'.format(chrom, start): {}}}
+
+    mocker.patch('genomic_data_service.summary_scoring.region_get_hits', region_get_hits)
+    variants = [
+        {'chrom': 'chr1', 'start': i * 100000, 'end': i * 100000 + 1}
+        for i in range(30)
+    ]
+    for concurrency in (1, 8):
+        hits = fetch_variants_hits(None, 'GRCh37', variants, concurrency, 10)
+        assert [list(all_hits['datasets']) for all_hits, _ in hits] == [
+            ['chr1:{}'.format(i * 100000)] for i in range(30)]
+
+
+def test_fetch_variants_hits_deadline(mocker):
+    import time
+    from werkzeug.exceptions import GatewayTimeout
+    from genomic_data_service.summary_scoring import fetch_variants_hits
+
+    mocker.patch(
+        'genomic_data_service.summary_scoring.region_get_hits',
+        side_effect=lambda *args: time.sleep(0.5) or {},
+    )
+    variants = [
+        {'chrom': 'chr1', 'start': i * 100000, 'end': i * 100000 + 1}
+        for i in range(4)
+    ]
+    with pytest.raises(GatewayTimeout):
+        fetch_variants_hits(None, 'GRCh37', variants, 2, 0.1)
+
+
+def test_cluster_variants():
+    from genomic_data_service.summary_scoring import cluster_variants
+
+    variants = [
+        {'chrom': 'chr1', 'start': 100, 'end': 101},
+        {'chrom': 'chr1', 'start': 1500, 'end': 1501},
+        {'chrom': 'chr1', 'start': 9000, 'end': 9001},
+        {'chrom': 'chr2', 'start': 9100, 'end': 9101},
+        {'chrom': 'chr2', 'start': 9200, 'end': 9201},
+    ]
+    clusters = cluster_variants(variants, max_gap=2000, max_span=20000)
+    assert [len(cluster) for cluster in clusters] == [2, 1, 2]
+    clusters = cluster_variants(variants, max_gap=10000, max_span=1000)
+    assert [len(cluster) for cluster in clusters] == [1, 1, 1, 2]
+
+
+def test_cluster_get_hits_matches_region_get_hits(mocker):
+    import random
+    from genomic_data_service.regulome_atlas import RegulomeAtlas
+    from genomic_data_service.rsid_coordinates_resolver import region_get_hits
+    from genomic_data_service.summary_scoring import cluster_get_hits
+
+    rng = random.Random(0)
+    peaks = []
+    for _ in range(300):
+        gte = rng.randint(1000, 20000)
+        peaks.append({
+            '_index': 'chrx',
+            '_source': {
+                'coordinates': {'gte': gte, 'lt': gte + rng.choice([1, 50, 500])},
+                'uuid': 'uuid-{}'.format(rng.randint(0, 20)),
+            },
+        })
+    residents = {
+        'uuid-{}'.format(i): {
+            'uuid': 'uuid-{}'.format(i),
+            'file': {'@id': '/files/{}/'.format(i)},
+            'dataset': {'@id': '/experiments/{}/'.format(i % 7)},
+        }
+        for i in range(0, 20, 2)
+    }
+
+    def find_peaks(assembly, chrom, start, end, peaks_too=False):
+        # term query for single bases, intersects range query otherwise
+        return [
+            peak for peak in peaks
+            if peak['_source']['coordinates']['gte'] < end
+            and peak['_source']['coordinates']['lt'] > start
+        ]
+
+    atlas = RegulomeAtlas(None)
+    mocker.patch.object(atlas, 'find_peaks', side_effect=find_peaks)
+    mocker.patch.object(
+        atlas, '_resident_details',
+        side_effect=lambda uuids: {
+            uuid: residents[uuid] for uuid in uuids if uuid in residents},
+    )
+    variants = [
+        {'chrom': 'chrX', 'start': start, 'end': start + length}
+        for start, length in sorted(
+            (rng.randint(900, 21000), rng.choice([1, 1, 1, 30])) for _ in range(100))
+    ]
+    clustered = cluster_get_hits(atlas, 'GRCh37', variants)
+    assert atlas.find_peaks.call_count == 1
+    assert any(all_hits.get('peak_count') for all_hits in clustered)
+    for variant, all_hits in zip(variants, clustered):
+        assert all_hits == region_get_hits(
+            atlas, 'GRCh37', variant['chrom'], variant['start'], variant['end'])
+
+
+def test_iter_table_streams_batches(mocker):
+    from genomic_data_service.summary import iter_table
+
+    def score_variants(atlas, assembly, variants, concurrency, deadline):
+        return [
+            (
+                {'ChIP': [], 'IC_max': variant['start'] / 10},
+                {'probability': '0.5', 'ranking': '5'},
+            )
+            for variant in variants
+        ]
+
+    score = mocker.patch(
+        'genomic_data_service.summary.score_variants', side_effect=score_variants)
+    atlas = mocker.MagicMock()
+    variants = [
+        {'chrom': 'chr1', 'start': i, 'end': i + 1, 'rsids': ['rs{}'.format(i)]}
+        for i in range(7)
+    ]
+    tables = {}
+    for batch_size in (1, 3, 7, 100):
+        chunks = list(iter_table(
+            atlas, 'GRCh37', variants, 'tsv', 1, 10, batch_size=batch_size))
+        assert len(chunks) == -(-7 // batch_size)
+        tables[batch_size] = ''.join(chunks)
+    assert len(set(tables.values())) == 1
+    lines = tables[1].split('\n')
+    assert len(lines) == 8
+    assert lines[0].split('\t')[:6] == [
+        'chrom', 'start', 'end', 'rsids', 'probability', 'ranking']
+    assert lines[1].split('\t')[:7] == [
+        'chr1', '0', '1', 'rs0', '0.5', '5', 'True']
+    bed = ''.join(iter_table(atlas, 'GRCh37', variants, 'bed', 1, 10, batch_size=3))
+    assert bed.split('\n') == lines[1:]
+    assert score.call_count == 7 + 3 + 1 + 1 + 3
+
+
+def test_build_download_gzip():
+    import gzip
+    from genomic_data_service import app
+    from genomic_data_service.summary import build_download
+
+    chunks = ['chrom\tstart', '\nchr1\t1', '\nchr2\t2']
+    with app.test_request_context():
+        response = build_download(iter(chunks), 'tsv', gzip=True)
+        assert response.headers['Content-Encoding'] == 'gzip'
+        assert response.headers['Content-Type'] == 'text/tsv'
+        body = b''.join(response.response)
+    assert gzip.decompress(body).decode('utf-8') == ''.join(chunks)
+
+    with app.test_request_context():
+        response = build_download(iter(chunks), 'bed')
+        assert 'Content-Encoding' not in response.headers
+        assert response.get_data(as_text=True) == ''.join(chunks)
@@ -0,0 +1,148 @@
+import pytest
+from genomic_data_service import app
+from genomic_data_service.request_utils import validate_search_request
+from genomic_data_service.response_cache import ResponseCache, index_epoch, _index_epochs
+
+
+@pytest.fixture
+def epoch(mocker):
+    _index_epochs.clear()
+    yield mocker.patch(
+        'genomic_data_service.response_cache.read_residents_epoch', return_value='1')
+    _index_epochs.clear()
+
+
+def new_epoch(epoch, value):
+    epoch.return_value = value
+    _index_epochs.clear()
+
+
+@pytest.fixture
+def cache(tmp_path):
+    return ResponseCache(str(tmp_path / 'cache.sqlite'), 100, 60, 50)
+
+
+def test_response_cache_get_put(cache):
+    assert cache.get('a', '1') is None
+    cache.put('a', '1', {'Content-Type': 'text/tsv'}, b'chrom\tstart')
+    assert cache.get('a', '1') == ({'Content-Type': 'text/tsv'}, b'chrom\tstart')
+    # entries of an older epoch are dropped
+    assert cache.get('a', '2') is None
+    assert cache.get('a', '1') is None
+    stats = cache.stats()
+    assert (stats['hits'], stats['misses'], stats['stores']) == (1, 3, 1)
+    assert stats['entries'] == 0
+
+
+def test_response_cache_max_age(cache, mocker):
+    cache.put('a', '1', {}, b'body')
+    time = mocker.patch('genomic_data_service.response_cache.time.time')
+    time.return_value = 10 ** 10
+    assert cache.get('a', '1') is None
+
+
+def test_response_cache_evicts_least_recently_used(cache, mocker):
+    time = mocker.patch('genomic_data_service.response_cache.time.time')
+    for i, key in enumerate('abc'):
+        time.return_value = 1000 + i
+        cache.put(key, '1', {}, b'x' * 40)
+    # c does not fit with a and b, a is the least recently used
+    time.return_value = 1010
+    assert cache.get('b', '1') is not None
+    assert cache.get('a', '1') is None
+    assert cache.get('c', '1') is not None
+    cache.put('d', '1', {}, b'x' * 51)
+    assert cache.get('d', '1') is None
+    stats = cache.stats()
+    assert stats['evictions'] == 1
+    assert stats['bytes'] == 80
+
+
+def test_cached_view(test_client, tmp_path, mocker, epoch):
+    mocker.patch.dict(app.config, {'RESPONSE_CACHE_PATH': str(tmp_path / 'cache.sqlite')})
+    view = mocker.patch(
+        'genomic_data_service.search.validate_search_request',
+        side_effect=validate_search_request)
+
+    url = 'search/?regions=chr12:69360231-69360232%0D%0Achr10:5852536-5852537&genome=hg19'
+    response = test_client.get(url)
+    assert response.headers['X-Response-Cache'] == 'MISS'
+    data = response.json
+
+    # the same query written differently is served from the cache
+    other_url = 'search/?genome=hg19&regions=chr12:69360231-69360232%0D%0A%20chr10:5852536-5852537'
+    response = test_client.get(other_url)
+    assert response.headers['X-Response-Cache'] == 'HIT'
+    assert response.json['@id'] == '/' + other_url
+    assert {**response.json, '@id': data['@id']} == data
+    assert view.call_count == 1
+
+    response = test_client.get(url, headers={'X-Response-Cache': 'bypass'})
+    assert response.headers['X-Response-Cache'] == 'BYPASS'
+    assert view.call_count == 2
+
+    new_epoch(epoch, '2')
+    response = test_client.get(url)
+    assert response.headers['X-Response-Cache'] == 'MISS'
+    assert view.call_count == 3
+
+    # without an epoch nothing is served from or stored in the cache
+    new_epoch(epoch, None)
+    for count in (4, 5):
+        response = test_client.get(url)
+        assert 'X-Response-Cache' not in response.headers
+        assert view.call_count == count
+
+
+def test_conditional_view(test_client, mocker, epoch):
+    view = mocker.patch(
+        'genomic_data_service.search.validate_search_request',
+        side_effect=validate_search_request)
+
+    url = 'search/?regions=chr12:69360231-69360232%0D%0Achr10:5852536-5852537&genome=hg19'
+    response = test_client.get(url)
+    etag = response.headers['ETag']
+    assert response.status_code == 200
+    assert response.headers['Cache-Control'] == 'public, max-age=300'
+
+    response = test_client.get(url, headers={'If-None-Match': etag})
+    assert response.status_code == 304
+    assert response.headers['ETag'] == etag
+    assert response.data == b''
+    assert view.call_count == 1
+
+    response = test_client.get(
+        url + '&maf=0.1', headers={'If-None-Match': etag})
+    assert response.status_code == 200
+    assert response.headers['ETag'] != etag
+
+    new_epoch(epoch, '2')
+    response = test_client.get(url, headers={'If-None-Match': etag})
+    assert response.status_code == 200
+    assert response.headers['ETag'] != etag
+
+    new_epoch(epoch, None)
+    response = test_client.get(url, headers={'If-None-Match': etag})
+    assert response.status_code == 200
+    assert 'ETag' not in response.headers
+
+
+def test_index_epoch_reads_only_the_mapping(mocker):
+    from genomic_data_service import regulome_atlas
+    _index_epochs.clear()
+    es = mocker.MagicMock()
+    es.indices.get_mapping.return_value = {'resident_regionsets': {'mappings': {
+        'regulomedb': {'_meta': {'residents_epoch': '7'}}}}}
+    scan = mocker.patch.object(regulome_atlas, 'scan')
+    monotonic = mocker.patch('genomic_data_service.response_cache.time.monotonic')
+    monotonic.return_value = 1000
+    for _ in range(3):
+        with app.test_request_context('/search/'):
+            assert index_epoch(es) == '7'
+    assert es.indices.get_mapping.call_count == 1
+    monotonic.return_value = 1000 + regulome_atlas.RESIDENTS_EPOCH_CHECK_SECONDS
+    with app.test_request_context('/search/'):
+        assert index_epoch(es) == '7'
+    assert es.indices.get_mapping.call_count == 2
+    scan.assert_not_called()
+    _index_epochs.clear()
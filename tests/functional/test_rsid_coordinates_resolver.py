@@ -43,7 +43,7 @@ def test_ensembl_assembly_mapper(mocker):
         ]
     }
     mocker.patch(
-        'genomic_data_service.rsid_coordinates_resolver.requests.get',
+        'genomic_data_service.ensembl.requests.Session.get',
         return_value=mock_response,
     )
 
@@ -67,7 +67,7 @@ def test_ensembl_assembly_mapper_exception(mocker):
         'error': "Can not find internal name for species 'butter'"
     }
     mocker.patch(
-        'genomic_data_service.rsid_coordinates_resolver.requests.get',
+        'genomic_data_service.ensembl.requests.Session.get',
         return_value=mock_response,
     )
 
@@ -90,7 +90,7 @@ def test_ensembl_assembly_mapper_no_mapping(mocker):
         'mappings': []
     }
     mocker.patch(
-        'genomic_data_service.rsid_coordinates_resolver.requests.get',
+        'genomic_data_service.ensembl.requests.Session.get',
         return_value=mock_response,
     )
 
@@ -123,7 +123,7 @@ def test_get_ensemblid_coordinates_grch38(mocker):
         'strand': -1,
     }
     mocker.patch(
-        'genomic_data_service.rsid_coordinates_resolver.requests.get',
+        'genomic_data_service.ensembl.requests.Session.get',
         return_value=mock_response,
     )
     id = 'ENSG00000157764'
@@ -155,7 +155,7 @@ def test_get_ensemblid_coordinates_grch37(mocker):
         'strand': -1,
     }
     mocker.patch(
-        'genomic_data_service.rsid_coordinates_resolver.requests.get',
+        'genomic_data_service.ensembl.requests.Session.get',
         return_value=mock_response
     )
     mocker.patch(
@@ -194,7 +194,7 @@ def test_get_ensemblid_coordinates_ncbi36(mocker):
         'strand': -1,
     }
     mocker.patch(
-        'genomic_data_service.rsid_coordinates_resolver.requests.get',
+        'genomic_data_service.ensembl.requests.Session.get',
         return_value=mock_response
     )
     (chromosome, start, end) = get_ensemblid_coordinates(id, assembly)
@@ -226,7 +226,7 @@ def test_get_ensemblid_coordinates_GRCm39(mocker):
         'object_type': 'Gene'
     }
     mocker.patch(
-        'genomic_data_service.rsid_coordinates_resolver.requests.get',
+        'genomic_data_service.ensembl.requests.Session.get',
         return_value=mock_response
     )
     (chromosome, start, end) = get_ensemblid_coordinates(id, assembly)
@@ -256,7 +256,7 @@ def test_get_ensemblid_coordinates_GRCm38(mocker):
         'strand': 1
     }
     mocker.patch(
-        'genomic_data_service.rsid_coordinates_resolver.requests.get',
+        'genomic_data_service.ensembl.requests.Session.get',
         return_value=mock_response
     )
     mocker.patch(
@@ -294,7 +294,7 @@ def test_get_ensemblid_coordinates_GRCm37(mocker):
         'strand': 1
     }
     mocker.patch(
-        'genomic_data_service.rsid_coordinates_resolver.requests.get',
+        'genomic_data_service.ensembl.requests.Session.get',
         return_value=mock_response
     )
     mocker.patch(
@@ -315,7 +315,7 @@ def test_get_ensemblid_coordinates_error(mocker):
         'error': "ID 'ENUSG00000157764' not found"
     }
     mocker.patch(
-        'genomic_data_service.rsid_coordinates_resolver.requests.get',
+        'genomic_data_service.ensembl.requests.Session.get',
         return_value=mock_response,
     )
     (chromosome, start, end) = get_ensemblid_coordinates(id, assembly)
@@ -375,7 +375,7 @@ def test_get_rsid_coordinates_from_ensembl_grch38(mocker):
         ]
     }
     mocker.patch(
-        'genomic_data_service.rsid_coordinates_resolver.requests.get',
+        'genomic_data_service.ensembl.requests.Session.get',
         return_value=mock_response,
     )
     chromosome, start, end = get_rsid_coordinates_from_ensembl(assembly, rsid)
@@ -435,7 +435,7 @@ def test_get_rsid_coordinates_from_ensembl_grch37(mocker):
         ]
     }
     mocker.patch(
-        'genomic_data_service.rsid_coordinates_resolver.requests.get',
+        'genomic_data_service.ensembl.requests.Session.get',
         return_value=mock_response,
     )
     mocker.patch(
@@ -559,3 +559,47 @@ def test_get_hgvs_coordinates():
     assert chrom == 'chr9'
     assert start == 4575119
     assert end == 4575120
+
+
+def test_resolve_coordinates_and_variants_in_batches(mocker):
+    from genomic_data_service.regulome_atlas import RegulomeAtlas
+    from genomic_data_service.rsid_coordinates_resolver import (
+        resolve_coordinates_and_variants,
+    )
+
+    def snp(rsid, start):
+        return {
+            'rsid': rsid,
+            'chrom': 'chr1',
+            'coordinates': {'gte': start, 'lt': start + 1},
+        }
+
+    es = mocker.MagicMock()
+    es.mget.return_value = {'docs': [
+        {'_id': 'rs1', 'found': True, '_source': snp('rs1', 100)},
+        {'_id': 'rs2', 'found': False},
+    ]}
+    es.msearch.return_value = {'responses': [
+        {'hits': {'hits': [{'_source': snp('rs1', 100)}]}},
+        {'hits': {'hits': []}},
+        {'hits': {'hits': []}},
+    ]}
+    atlas = RegulomeAtlas(es)
+    region_queries = ['rs1', 'rs2', 'chr1:500-600', 'chr1:7-7', 'chr1:800-801']
+    variants, query_coordinates, notifications = resolve_coordinates_and_variants(
+        region_queries, 'GRCh37', atlas, '0.01'
+    )
+    es.mget.assert_called_once()
+    es.msearch.assert_called_once()
+    es.get.assert_not_called()
+    es.search.assert_not_called()
+    assert variants == {
+        ('chr1', 100, 101): {'rsids': {'rs1'}},
+        ('chr1', 800, 801): {'rsids': set()},
+    }
+    assert query_coordinates == ['chr1:100-101', 'chr1:500-600', 'chr1:800-801']
+    assert notifications == {
+        'rs2': 'Failed: invalid region input',
+        'chr1:500-600': 'Failed: no known variants matching query conditions found.',
+        'chr1:7-7': 'Failed: coordinates start and end can not be the same.',
+    }
@@ -0,0 +1,103 @@
+import csv
+import gzip
+import numpy as np
+import pytest
+from genomic_data_service.parser import SnfParser
+from genomic_data_service.rsid_index import (
+    RsidIndex,
+    build_rsid_index,
+    rsid_index,
+    _rsid_index,
+)
+from genomic_data_service.rsid_coordinates_resolver import (
+    get_rsid_coordinates_from_atlas,
+)
+
+SNP_FILE = './tests/data/test_snp_file.bed.gz'
+
+
+def snp_lines():
+    with gzip.open(SNP_FILE, mode='rt') as f:
+        return list(csv.reader(f, delimiter='\t'))
+
+
+@pytest.fixture
+def index_dir(tmp_path):
+    rows = [line[:4] for line in snp_lines()]
+    build_rsid_index(rows, str(tmp_path), 'grch38')
+    return str(tmp_path)
+
+
+def test_rsid_index_matches_snp_parser(index_dir):
+    index = RsidIndex.load(index_dir, 'grch38')
+    assert isinstance(index.rsids, np.memmap)
+    docs = [doc for _, doc in SnfParser(iter(snp_lines())).parse()]
+    assert len(index) == len({doc['rsid'] for doc in docs})
+    for doc in docs:
+        assert index.lookup(doc['rsid']) == (
+            doc['chrom'],
+            doc['coordinates']['gte'],
+            doc['coordinates']['lt'],
+        )
+
+
+def test_rsid_index_missing_rsids(index_dir):
+    index = RsidIndex.load(index_dir, 'grch38')
+    assert index.lookup('rs1') is None
+    assert index.lookup('rs99999999999') is None
+    assert index.lookup('chr1:10-20') is None
+    assert index.lookup('rs') is None
+
+
+def test_build_rsid_index_last_row_wins(tmp_path):
+    rows = [
+        ('chr2', '50', '50', 'rs5'),
+        ('chr1', '10', '11', 'rs7'),
+        ('chr1', '30', '31', 'rs5'),
+        ('chr1', '1', '2', 'not_an_rsid'),
+    ]
+    assert build_rsid_index(rows, str(tmp_path), 'hg19') == 2
+    index = RsidIndex.load(str(tmp_path), 'hg19')
+    assert index.rsids.dtype == np.uint32
+    assert index.lookup('rs5') == ('chr1', 30, 31)
+    assert index.lookup('rs7') == ('chr1', 10, 11)
+
+
+def test_build_rsid_index_wide_and_empty(tmp_path):
+    rows = [('chr1', '5', '6', 'rs{}'.format(2 ** 33)), ('chrX', '7', '8', 'rs3')]
+    assert build_rsid_index(rows, str(tmp_path), 'grch38') == 2
+    index = RsidIndex.load(str(tmp_path), 'grch38')
+    assert index.rsids.dtype == np.uint64
+    assert index.lookup('rs{}'.format(2 ** 33)) == ('chr1', 5, 6)
+    assert index.lookup('rs3') == ('chrX', 7, 8)
+
+    assert build_rsid_index([], str(tmp_path), 'hg19') == 0
+    assert RsidIndex.load(str(tmp_path), 'hg19').lookup('rs3') is None
+
+
+def test_rsid_index_from_config(index_dir, mocker):
+    _rsid_index.cache_clear()
+    mocker.patch.dict(
+        'genomic_data_service.rsid_index.app.config', {'RSID_INDEX_DIR': index_dir}
+    )
+    assert rsid_index('grch38') is not None
+    assert rsid_index('hg19') is None
+    assert rsid_index(None) is None
+    _rsid_index.cache_clear()
+
+
+def test_get_rsid_coordinates_from_atlas_uses_index(index_dir, mocker):
+    mocker.patch(
+        'genomic_data_service.rsid_coordinates_resolver.rsid_index',
+        return_value=RsidIndex.load(index_dir, 'grch38')
+    )
+    atlas = mocker.Mock()
+    atlas.find_snp.return_value = {
+        'chrom': 'chr1', 'coordinates': {'gte': 5, 'lt': 6}
+    }
+    assert get_rsid_coordinates_from_atlas(
+        atlas, 'GRCh38', 'rs1399657112') == ('chr10', 60089, 60090)
+    atlas.find_snp.assert_not_called()
+    assert get_rsid_coordinates_from_atlas(
+        atlas, 'GRCh38', 'rs1') == ('chr1', 5, 6)
+    atlas.find_snp.assert_called_once_with('grch38', 'rs1')
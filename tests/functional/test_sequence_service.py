@@ -0,0 +1,72 @@
+import random
+import pytest
+from genomic_data_service.sequence_service import SequenceService
+
+
+class FakeTwoBit(object):
+    def __init__(self):
+        self.reads = 0
+        self.chrom_sequences = {
+            chrom: ''.join(random.Random(chrom).choices('ACGTN', k=200000))
+            for chrom in ('chr1', 'chr2')
+        }
+
+    def chroms(self, chrom):
+        return len(self.chrom_sequences[chrom])
+
+    def sequence(self, chrom, start, end):
+        self.reads += 1
+        if end > len(self.chrom_sequences[chrom]):
+            raise RuntimeError('Invalid interval bounds!')
+        return self.chrom_sequences[chrom][start:end]
+
+
+@pytest.fixture
+def two_bit(mocker):
+    reader = FakeTwoBit()
+    two_bit_open = mocker.patch(
+        'genomic_data_service.sequence_service.py2bit.open', return_value=reader)
+    return reader, two_bit_open
+
+
+def test_sequences_match_single_reads(two_bit):
+    reader, two_bit_open = two_bit
+    service = SequenceService('hg38.2bit')
+    rng = random.Random(0)
+    intervals = []
+    for _ in range(300):
+        start = rng.randint(0, 199000)
+        intervals.append((rng.choice(['chr1', 'chr2']), start, start + rng.randint(1, 500)))
+
+    sequences = service.sequences(intervals)
+    batch_reads = reader.reads
+    assert batch_reads < len(intervals)
+    assert sequences == [service.sequence(*interval) for interval in intervals]
+    assert two_bit_open.call_count == 1
+
+
+def test_sequences_block_limits(two_bit, mocker):
+    reader, _ = two_bit
+    mocker.patch('genomic_data_service.sequence_service.SEQUENCE_BLOCK_GAP', 10)
+    mocker.patch('genomic_data_service.sequence_service.SEQUENCE_BLOCK_MAX', 100)
+    service = SequenceService('hg38.2bit')
+    intervals = [
+        ('chr1', 0, 20), ('chr1', 25, 30), ('chr1', 10, 40),
+        ('chr1', 51, 60), ('chr1', 65, 160), ('chr2', 65, 70),
+    ]
+    sequences = service.sequences(intervals)
+    # [0, 40), [51, 60), [65, 160) on chr1 and chr2 on its own
+    assert reader.reads == 4
+    assert sequences == [
+        reader.chrom_sequences[chrom][start:end] for chrom, start, end in intervals]
+
+
+def test_reopens_after_fork(two_bit, mocker):
+    _, two_bit_open = two_bit
+    service = SequenceService('hg38.2bit')
+    assert service.chrom_length('chr1') == 200000
+    service.sequence('chr1', 0, 10)
+    assert two_bit_open.call_count == 1
+    mocker.patch('genomic_data_service.sequence_service.os.getpid', return_value=-1)
+    service.sequence('chr1', 0, 10)
+    assert two_bit_open.call_count == 2
@@ -0,0 +1,89 @@
+import json
+import pytest
+from genomic_data_service import app
+from genomic_data_service.regulome_atlas import DatasetRecord, ResidentsCache
+from genomic_data_service.serialization import Fragmented, dump_items, encode
+
+
+@pytest.fixture(params=['orjson', 'json'])
+def backend(request, mocker):
+    mocker.patch.dict(app.config, {'JSON_BACKEND': request.param})
+    return request.param
+
+
+@pytest.fixture
+def dataset(dataset_no_doc_chip_seq, document_dict):
+    return {
+        **dataset_no_doc_chip_seq,
+        'collection_type': 'ChIP-seq',
+        'documents': document_dict,
+        'biosample_ontology': {'@id': '/biosample-types/cell_line_EFO_0002067/'},
+    }
+
+
+def test_fragmented_encode(backend):
+    dataset_fields = {'documents': [{'@id': 'x'}], 'method': 'ChIP-seq'}
+    detail = Fragmented(
+        {'chrom': 'chr1', 'start': 1, **dataset_fields}, dump_items(dataset_fields))
+    block = {'@graph': [detail, detail], 'total': 1, 'features': {'ChIP': True}}
+    assert json.loads(encode(block)) == json.loads(json.dumps(block))
+    assert encode({'total': 1}) == b'{"total":1}'
+    assert encode(Fragmented({}, {})) == b'{}'
+
+
+def test_fragmented_encode_matches_jsonify(backend, mocker):
+    from flask import jsonify
+
+    mocker.patch.dict(app.config, {'JSONIFY_PRETTYPRINT_REGULAR': False, 'DEBUG': False})
+    dataset_fields = {'method': 'ChIP-seq', 'dataset': '/x/', 'targets': ['A', 'B']}
+    detail = Fragmented({
+        'chrom': 'chr1', 'start': 1, 'end': 2, 'value': None, **dataset_fields,
+    }, dump_items(dataset_fields))
+    block = {'@graph': [detail], 'total': 1}
+    with app.test_request_context():
+        expected = jsonify(block).get_data()
+    assert encode(block) + b'\n' == expected
+    assert json.loads(encode(block)) == json.loads(expected)
+
+
+def test_dataset_peak_detail_is_built_once(backend, dataset, mocker):
+    from genomic_data_service.rsid_coordinates_resolver import dataset_peak_detail
+
+    atlas = mocker.MagicMock()
+    atlas.residents_cache = ResidentsCache()
+    atlas.residents_cache._records[id(dataset)] = DatasetRecord(dataset)
+    fields, fragment = dataset_peak_detail(atlas, dataset)
+    assert dataset_peak_detail(atlas, dataset)[1] is fragment
+    assert json.loads(b'{' + b','.join(fragment.values()) + b'}') == fields
+    assert fields['dataset'] == 'https://www.encodeproject.org/experiments/ENCSR668LDD/'
+    assert fields['documents'][0]['@id'].startswith('https://www.encodeproject.org/')
+    # the resident dataset itself is untouched
+    assert not dataset['documents'][0]['@id'].startswith('https://')
+
+
+def test_search_peaks_graph_json(backend, dataset, mocker):
+    from genomic_data_service.rsid_coordinates_resolver import search_peaks
+
+    peaks = [
+        {
+            '_index': 'chr1',
+            '_source': {'coordinates': {'gte': start, 'lt': start + 10}, 'value': '1.5'},
+            'resident_detail': {'file': {'@id': '/files/ENCFF001AAA/'}, 'dataset': dataset},
+        }
+        for start in (100, 105)
+    ]
+    mocker.patch(
+        'genomic_data_service.rsid_coordinates_resolver.region_get_hits',
+        return_value={'peaks': peaks, 'datasets': {}})
+    atlas = mocker.MagicMock()
+    atlas.residents_cache = ResidentsCache()
+    atlas.regulome_evidence.return_value = {}
+    atlas.regulome_score.return_value = {}
+    atlas.nearby_snps.return_value = []
+
+    graph = search_peaks(['chr1:104-105'], atlas, 'GRCh38', 1)[3]
+    assert [peak['start'] for peak in graph] == [100, 105]
+    assert graph[0]['file'] == 'ENCFF001AAA'
+    assert graph[0]['dataset_rel'] == '/experiments/ENCSR668LDD/'
+    plain = json.loads(json.dumps(graph))
+    assert json.loads(encode({'@graph': graph})) == {'@graph': plain}
@@ -0,0 +1,197 @@
+import io
+import json
+import pytest
+from genomic_data_service import app
+from genomic_data_service import summary_jobs
+
+
+@pytest.fixture
+def jobs_dir(tmp_path, mocker):
+    mocker.patch.dict(app.config, {
+        'SUMMARY_JOBS_DIR': str(tmp_path),
+        'SUMMARY_JOB_CHUNK_SIZE': 3,
+    })
+    mocker.patch.object(summary_jobs, 'job_es', return_value=None)
+    return tmp_path
+
+
+@pytest.fixture
+def run_tasks(mocker):
+    """Run queued tasks in order instead of sending them to the broker."""
+    queued = []
+    mocker.patch.object(
+        summary_jobs.resolve_summary_job, 'delay',
+        side_effect=lambda *args: queued.append((summary_jobs.resolve_summary_job, args)))
+    mocker.patch.object(
+        summary_jobs.score_summary_chunk, 'delay',
+        side_effect=lambda *args: queued.append((summary_jobs.score_summary_chunk, args)))
+
+    def run():
+        while queued:
+            task, args = queued.pop(0)
+            task(*args)
+    return run
+
+
+def resolve_coordinates_and_variants(region_queries, assembly, atlas, maf):
+    variants = {}
+    for query in region_queries:
+        chrom, start = query.split(':')
+        variants[(chrom, int(start), int(start) + 1)] = {'rsids': ['rs' + start]}
+    return variants, {}, {}
+
+
+def score_variants(atlas, assembly, variants, concurrency, deadline):
+    return [
+        (
+            {'ChIP': [], 'IC_max': variant['start'] / 10},
+            {'probability': '0.5', 'ranking': '5'},
+        )
+        for variant in variants
+    ]
+
+
+@pytest.fixture
+def scoring(mocker):
+    mocker.patch(
+        'genomic_data_service.summary_jobs.resolve_coordinates_and_variants',
+        side_effect=resolve_coordinates_and_variants)
+    return mocker.patch(
+        'genomic_data_service.summary_jobs.score_variants', side_effect=score_variants)
+
+
+def test_parse_region_queries():
+    lines = ['# comment chr1:5\n', 'chr1:1 chr1:2\r\n', '\n', 'rs3\n']
+    assert summary_jobs.parse_region_queries(lines) == ['chr1:1', 'chr1:2', 'rs3']
+
+
+def test_summary_job_tsv(test_client, jobs_dir, run_tasks, scoring):
+    regions = ' '.join('chr1:{}'.format(i) for i in range(8, 0, -1))
+    response = test_client.post(
+        '/summary/jobs/', data={'genome': 'GRCh37', 'regions': regions})
+    assert response.status_code == 202
+    job_id = response.json['job_id']
+    assert response.json['status'] == 'queued'
+    assert response.headers['Location'].endswith('/summary/jobs/{}/'.format(job_id))
+
+    response = test_client.get('/summary/jobs/{}/download'.format(job_id))
+    assert response.status_code == 409
+
+    run_tasks()
+    assert scoring.call_count == 3
+
+    response = test_client.get('/summary/jobs/{}/'.format(job_id))
+    assert response.json['status'] == 'done'
+    assert response.json['total'] == 8
+    assert response.json['chunks'] == 3
+    assert response.json['progress'] == 1.0
+
+    response = test_client.get('/summary/jobs/{}/download'.format(job_id))
+    assert response.status_code == 200
+    lines = response.get_data(as_text=True).splitlines()
+    assert len(lines) == 9
+    assert lines[0].split('\t')[:6] == [
+        'chrom', 'start', 'end', 'rsids', 'probability', 'ranking']
+    assert [line.split('\t')[1] for line in lines[1:]] == [
+        str(i) for i in range(1, 9)]
+
+
+def test_summary_job_ndjson_upload(test_client, jobs_dir, run_tasks, scoring):
+    upload = io.BytesIO(b'# variants\nchr2:10\nchr2:20\n')
+    response = test_client.post(
+        '/summary/jobs/',
+        data={'genome': 'GRCh38', 'format': 'ndjson', 'file': (upload, 'variants.txt')},
+        content_type='multipart/form-data',
+    )
+    assert response.status_code == 202
+    job_id = response.json['job_id']
+    run_tasks()
+
+    response = test_client.get('/summary/jobs/{}/download'.format(job_id))
+    assert response.headers['Content-Type'] == 'application/x-ndjson'
+    rows = [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+    assert [row['start'] for row in rows] == [10, 20]
+    assert rows[0]['rsids'] == ['rs10']
+    assert rows[0]['regulome_score'] == {'probability': '0.5', 'ranking': '5'}
+
+
+def test_summary_job_chunk_failure(test_client, jobs_dir, run_tasks, scoring, mocker):
+    job_id = summary_jobs.create_job(
+        'GRCh37', 'bed', None,
+        lambda path: open(path, 'w').write('chr1:1 chr1:2 chr1:3 chr1:4'))
+    summary_jobs.resolve_summary_job(job_id)
+    scoring.side_effect = RuntimeError('elasticsearch is down')
+    mocker.patch.object(summary_jobs.score_summary_chunk, 'max_retries', 0)
+    with pytest.raises(RuntimeError):
+        summary_jobs.score_summary_chunk(job_id, 1)
+
+    job = summary_jobs.job_status(job_id)
+    assert job['status'] == 'failed'
+    assert job['error'] == 'elasticsearch is down'
+    assert job['chunks_done'] == 0
+
+
+def test_summary_job_lost_chunk(test_client, jobs_dir, run_tasks, scoring, mocker):
+    job_id = summary_jobs.create_job(
+        'GRCh37', 'tsv', None,
+        lambda path: open(path, 'w').write('chr1:1 chr1:2 chr1:3 chr1:4'))
+    summary_jobs.resolve_summary_job(job_id)
+    # chunk 1 is lost with its worker and never reports back
+    summary_jobs.score_summary_chunk(job_id, 0)
+
+    job = summary_jobs.job_status(job_id)
+    assert job['status'] == 'scoring'
+    assert job['progress'] == 0.5
+
+    started = job['scoring_started']
+    mocker.patch('genomic_data_service.summary_jobs.time.time', return_value=started + 3601)
+    job = summary_jobs.job_status(job_id)
+    assert job['status'] == 'failed'
+    assert job['error'] == '1 chunks were not scored within 3600 seconds'
+    assert summary_jobs.score_summary_chunk.acks_late
+    assert summary_jobs.score_summary_chunk.reject_on_worker_lost
+
+
+def test_summary_job_limits(test_client, jobs_dir, run_tasks, scoring, mocker):
+    mocker.patch.dict(app.config, {
+        'SUMMARY_JOB_MAX_UPLOAD_BYTES': 64,
+        'SUMMARY_JOB_MAX_VARIANTS': 2,
+    })
+    upload = io.BytesIO(b'chr2:10\n' * 10)
+    response = test_client.post(
+        '/summary/jobs/',
+        data={'genome': 'GRCh38', 'file': (upload, 'variants.txt')},
+        content_type='multipart/form-data',
+    )
+    assert response.status_code == 413
+    response = test_client.post(
+        '/summary/jobs/', data={'genome': 'GRCh37', 'regions': 'chr1:1 chr1:2 chr1:3'})
+    assert response.status_code == 413
+    assert response.json['message'].endswith('summary jobs are limited to 2')
+    assert list(jobs_dir.iterdir()) == []
+
+    # region queries resolving to more variants fail the job
+    resolve = summary_jobs.resolve_coordinates_and_variants.side_effect
+    summary_jobs.resolve_coordinates_and_variants.side_effect = (
+        lambda queries, *args: resolve(queries + ['chr1:9'], *args))
+    response = test_client.post(
+        '/summary/jobs/', data={'genome': 'GRCh37', 'regions': 'chr1:1 chr1:2'})
+    assert response.status_code == 202
+    with pytest.raises(ValueError):
+        run_tasks()
+    job = summary_jobs.job_status(response.json['job_id'])
+    assert job['status'] == 'failed'
+    assert job['error'] == 'Found 3 variants, summary jobs are limited to 2'
+
+
+def test_summary_job_invalid(test_client, jobs_dir):
+    response = test_client.post('/summary/jobs/', data={'genome': 'GRCh37'})
+    assert response.status_code == 400
+    response = test_client.post(
+        '/summary/jobs/', data={'genome': 'mm10', 'regions': 'chr1:1'})
+    assert response.status_code == 400
+    response = test_client.post(
+        '/summary/jobs/', data={'genome': 'GRCh37', 'regions': 'chr1:1', 'format': 'xml'})
+    assert response.status_code == 400
+    assert test_client.get('/summary/jobs/../../etc/').status_code == 404
+    assert test_client.get('/summary/jobs/{}/'.format('0' * 32)).status_code == 404
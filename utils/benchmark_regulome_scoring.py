@@ -0,0 +1,87 @@
+import argparse
+import random
+import sys
+import time
+
+import numpy as np
+from genomic_data_service import regulome_atlas
+from genomic_data_service.constants import ORGANS
+from genomic_data_service.regulome_atlas import (
+    RegulomeAtlas,
+    MODEL_BINARY_KEYS,
+    MODEL_NUMERIC_KEYS,
+    TISSUE_SPECIFIC_FEATURE_KEYS,
+)
+
+BATCH_SIZES = [1, 10, 100, 1000, 5000]
+
+
+def synthetic_model(seed):
+    """Fit a random forest shaped like the RegulomeDB model, for machines
+    without ml_models/rf_model1.0.1.sav."""
+    from sklearn.ensemble import RandomForestClassifier
+
+    rng = np.random.default_rng(seed)
+    features = rng.random((2000, len(MODEL_BINARY_KEYS) + len(MODEL_NUMERIC_KEYS)))
+    features[:, :len(MODEL_BINARY_KEYS)] = features[:, :len(MODEL_BINARY_KEYS)] > 0.5
+    labels = rng.random(2000) > 0.5
+    model = RandomForestClassifier(n_estimators=100, random_state=seed)
+    return model.fit(features, labels)
+
+
+def synthetic_characterization(rng):
+    characterization = {}
+    for key in MODEL_BINARY_KEYS + TISSUE_SPECIFIC_FEATURE_KEYS:
+        if rng.random() < 0.4:
+            characterization[key] = [
+                {'biosample_ontology': {'organ_slims': rng.sample(ORGANS, 3)}}
+                for _ in range(rng.randint(1, 4))
+            ]
+    for key in MODEL_NUMERIC_KEYS:
+        characterization[key] = round(rng.random() * 2, 2)
+    return characterization
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Compare per-variant and batched RegulomeDB scoring.'
+    )
+    parser.add_argument(
+        '--batch-sizes',
+        type=int,
+        nargs='+',
+        default=BATCH_SIZES,
+        help='Number of variants to score. Default: {}.'.format(BATCH_SIZES)
+    )
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    if regulome_atlas.TRAINED_REG_MODEL is None:
+        print('Trained model not found, using a synthetic random forest.',
+              file=sys.stderr)
+        regulome_atlas.TRAINED_REG_MODEL = synthetic_model(args.seed)
+
+    rng = random.Random(args.seed)
+    print('variants\tper_variant_s\tbatched_s\tspeedup')
+    for batch_size in args.batch_sizes:
+        characterizations = [
+            synthetic_characterization(rng) for _ in range(batch_size)
+        ]
+
+        begin = time.time()
+        single = [RegulomeAtlas._score(c) for c in characterizations]
+        per_variant = time.time() - begin
+
+        begin = time.time()
+        batched = RegulomeAtlas._score_batch(characterizations)
+        batch = time.time() - begin
+
+        if single != batched:
+            sys.exit('Batched scores differ from per-variant scores')
+        print('{}\t{:.4f}\t{:.4f}\t{:.1f}x'.format(
+            batch_size, per_variant, batch, per_variant / max(batch, 1e-9)
+        ))
+
+
+if __name__ == '__main__':
+    main()
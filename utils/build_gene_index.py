@@ -0,0 +1,31 @@
+import argparse
+import os
+
+from genomic_data_service import app
+from genomic_data_service.gene_index import GeneIndex, gene_index_path, read_gtf
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Build the gene coordinates of an assembly, looked up for '
+                    'ENSG ids and gene symbols, from a GENCODE or Ensembl GTF.'
+    )
+    parser.add_argument('assembly', help='Assembly of the GTF, like GRCh38.')
+    parser.add_argument('gtf_file', help='GTF file, can be gzipped.')
+    parser.add_argument(
+        '--output',
+        default=app.config.get('GENE_INDEX_DIR'),
+        help='Index directory. Default: GENE_INDEX_DIR of the app config.'
+    )
+    args = parser.parse_args()
+
+    genes = GeneIndex.from_gtf(read_gtf(args.gtf_file))
+    os.makedirs(args.output, exist_ok=True)
+    path = gene_index_path(args.output, args.assembly)
+    genes.save(path)
+    print('Indexed {} genes and {} symbols of {} in {}'.format(
+        len(genes), len(genes.symbols), args.assembly, path))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,41 @@
+import argparse
+import time
+
+from genomic_data_service import app
+from genomic_data_service.constants import GENOME_TO_ALIAS
+from genomic_data_service.file_opener import LocalFileOpener
+from genomic_data_service.region_indexer_task import SUPPORTED_CHROMOSOMES
+from genomic_data_service.rsid_index import build_rsid_index
+
+
+def snp_rows(file_path):
+    """(chrom, start, end, rsid) of the SNPs the region indexer would index."""
+    for line in LocalFileOpener(file_path).open():
+        if line[0].lower() in SUPPORTED_CHROMOSOMES:
+            yield (line[0], line[1], line[2], line[3])
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Build the memory-mapped rsid lookup of an assembly from '
+                    'the dbSNP BED file indexed as its SNPs.'
+    )
+    parser.add_argument('assembly', choices=sorted(GENOME_TO_ALIAS))
+    parser.add_argument('snp_file', help='gzipped dbSNP BED file.')
+    parser.add_argument(
+        '--output',
+        default=app.config.get('RSID_INDEX_DIR'),
+        help='Index directory. Default: RSID_INDEX_DIR of the app config.'
+    )
+    args = parser.parse_args()
+
+    begin = time.time()
+    count = build_rsid_index(
+        snp_rows(args.snp_file), args.output, GENOME_TO_ALIAS[args.assembly]
+    )
+    print('Indexed {} rsids of {} in {:.1f}s'.format(
+        count, args.assembly, time.time() - begin))
+
+
+if __name__ == '__main__':
+    main()
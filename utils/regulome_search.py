@@ -13,6 +13,9 @@ from genomic_data_service.rsid_coordinates_resolver import (
 )
 from genomic_data_service.regulome_atlas import RegulomeAtlas
 
+# variants scored together by one call to the trained model
+SEARCH_BATCH_SIZE = 500
+
 
 class RegulomeApp:
     """Start an independent app to do regulome search.
@@ -43,16 +46,73 @@ class RegulomeApp:
         self.matched_pwm_peak_bed_only = matched_pwm_peak_bed_only
         self.search_snps_in_region = search_snps_in_region
         self.maf = maf
+        self._atlas = None
+
+    def __getstate__(self):
+        # every worker process connects and memoizes scoring on its own
+        state = self.__dict__.copy()
+        state['_atlas'] = None
+        return state
 
     @property
     def atlas(self):
-        regulome_es = Elasticsearch(
-            port=app.config['REGULOME_ES_PORT'], hosts=app.config['REGULOME_ES_HOSTS']
-        )
-        self._atlas = RegulomeAtlas(regulome_es)
+        # one atlas for the whole run, so its scoring memo is shared by all queries
+        if self._atlas is None:
+            regulome_es = Elasticsearch(
+                port=app.config['REGULOME_ES_PORT'], hosts=app.config['REGULOME_ES_HOSTS']
+            )
+            self._atlas = RegulomeAtlas(regulome_es)
         return self._atlas
 
     def search(self, normalized_query):
+        return self.search_batch([normalized_query])[0]
+
+    def search_batch(self, normalized_queries):
+        """Search many normalized queries, scoring them with one model call."""
+        searched = [self._search_evidence(query)
+                    for query in normalized_queries]
+        if self.matched_pwm_peak_bed_only:
+            return [
+                self._search_result(*found[1:]) if found[0] == 0 else found
+                for found in searched
+            ]
+        scored = [found for found in searched if found[0] == 0]
+        try:
+            scores = self.atlas.regulome_scores(
+                [found[2] for found in scored],
+                [found[3].get('uuids') for found in scored],
+            )
+        except Exception:
+            # score one by one, so only the offending variants fail
+            scores = [self._score_one(found) for found in scored]
+        scores = iter(scores)
+        results = []
+        for found in searched:
+            if found[0] != 0:
+                results.append(found)
+                continue
+            _status, result, evidence, all_hits = found
+            score = next(scores)
+            if isinstance(score, Exception):
+                results.append((1, 'Regulome search failed on {}:{}-{}'.format(
+                    result['chrom'], result['start'], result['end']
+                )))
+                continue
+            result['score'] = score
+            result['features'] = evidence_to_features(evidence)
+            results.append(self._search_result(result, evidence, all_hits))
+        return results
+
+    def _score_one(self, found):
+        """Score the evidence of one searched query, returning the exception
+        instead of raising it."""
+        try:
+            return self.atlas.regulome_scores(
+                [found[2]], [found[3].get('uuids')])[0]
+        except Exception as e:
+            return e
+
+    def _search_evidence(self, normalized_query):
         result = json.loads(normalized_query)
         if 'chrom' not in result:
             return 1, result.get(
@@ -75,18 +135,18 @@ class RegulomeApp:
 
         try:
             evidence = self.atlas.regulome_evidence(
-                self.assembly, datasets, chrom, int(start), int(end)
+                self.assembly, datasets, chrom, int(start), int(end),
+                uuids=all_hits.get('uuids')
             )
-            if not self.matched_pwm_peak_bed_only:
-                result['score'] = self.atlas.regulome_score(
-                    datasets, evidence
-                )
-                result['features'] = evidence_to_features(evidence)
         except Exception:
             return 1, 'Regulome search failed on {}:{}-{}'.format(
                 chrom, start, end
             )
+        return 0, result, evidence, all_hits
 
+    def _search_result(self, result, evidence, all_hits):
+        start = result['start']
+        end = result['end']
         if self.matched_pwm_peak_bed_only:
             if not evidence.get('PWM_matched', []):
                 return 0, ''
@@ -238,6 +298,17 @@ class RegulomeApp:
         ]
 
 
+def iter_batches(lines, batch_size):
+    batch = []
+    for line in lines:
+        batch.append(line)
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
 def main():
     parser = argparse.ArgumentParser(
         description='Regulome search for one or more variations.'
@@ -265,6 +336,13 @@ def main():
         default=1,
         help='Number of process run in parallel.'
     )
+    parser.add_argument(
+        '--batch-size',
+        type=int,
+        default=SEARCH_BATCH_SIZE,
+        help='Number of variants scored together by one model call. '
+        'Default: {}.'.format(SEARCH_BATCH_SIZE)
+    )
     parser.add_argument(
         '--search-snps-in-region',
         action='store_true',
@@ -347,9 +425,12 @@ def main():
                     variant_count += 1
                     variant_stream.write('{}\n'.format(variant))
     variant_stream.seek(0)
-    variant_chunksize = variant_count // args.processes + (
-        variant_count % args.processes > 0
+    batch_count = variant_count // args.batch_size + (
+        variant_count % args.batch_size > 0
     )
+    variant_chunksize = max(batch_count // args.processes + (
+        batch_count % args.processes > 0
+    ), 1)
 
     print(
         'Querying {} {} using {} processes with chunksize {}...'.format(
@@ -364,23 +445,24 @@ def main():
     failure_count = 0
     with variant_stream as variants:
         with Pool(args.processes) as p:
-            for status, res in p.imap(
+            for results in p.imap(
                 RegulomeApp(
                     args.assembly,
                     args.peaks,
                     args.matched_pwm_peak_only,
                     args.search_snps_in_region,
                     args.maf,
-                ).search,
-                variants,
+                ).search_batch,
+                iter_batches(variants, args.batch_size),
                 variant_chunksize
             ):
-                if status == 0:
-                    print(res)
-                    success_count += 1
-                else:
-                    print(res, file=sys.stderr)
-                    failure_count += 1
+                for status, res in results:
+                    if status == 0:
+                        print(res)
+                        success_count += 1
+                    else:
+                        print(res, file=sys.stderr)
+                        failure_count += 1
     print(
         'Succeeded {}; Failed: {}'.format(success_count, failure_count),
         file=sys.stderr
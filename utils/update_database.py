@@ -3,7 +3,7 @@
 # example to update metadata for residents: python utils/update_database.py --resident ENCFF495KNO ENCFF028UPE
 import requests
 from genomic_data_service.region_indexer_elastic_search import RegionIndexerElasticSearch
-from genomic_data_service.region_indexer_task import metadata_doc
+from genomic_data_service.region_indexer_task import metadata_doc, bump_residents_epoch
 from genomic_data_service.region_indexer import dataset_accession, index_regulome_db, SUPPORTED_CHROMOSOMES, SUPPORTED_ASSEMBLIES, clean_up, FILE_REQUIRED_FIELDS, DATASET_REQUIRED_FIELDS
 from elasticsearch import Elasticsearch
 import argparse
@@ -72,6 +72,7 @@ def delete_file_by_accession(file_accession):
             print(file_accession, 'is not found in Regulome database')
         elif response.json().get('result', None) == 'deleted':
             print(file_accession, 'is deleted in residents index')
+            bump_residents_epoch(es)
             is_fail = False
             for index in INDEXES:
                 json_data = {
@@ -136,6 +137,7 @@ def re_index_resident(file_accessions):
             delete_resident(file_accession)
             es.index(index='resident_regionsets', doc_type='regulomedb',
                      body=metadata, id=str(metadata['uuid']))
+        bump_residents_epoch(es)
 
 
 def add_files(accessions):